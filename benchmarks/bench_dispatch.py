@@ -0,0 +1,100 @@
+"""Пакет автораспределения на синтетическом парке: время и качество матчеров.
+
+Для каждого размера пакета (заказов x водителей) печатается время
+жадного назначения по всем парам (полная матрица), жадного по лучшим
+парам (best_pairs, используется в боте) и венгерского алгоритма, число
+пар и сумма оценок. Оба жадных варианта обязаны дать одну сумму;
+венгерский — оптимум.
+
+Запуск: python benchmarks/bench_dispatch.py [seed]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.dispatch import (  # noqa: E402
+    SATURATION, Candidate, Job, allowed_cars, best_pairs, match_greedy, match_hungarian,
+    parse_weights, score_matrix
+)
+
+CAR_MODELS = ["labo", "porter", "damas", "gazel", "other"]
+CARGO_CARS = {
+    "мебель": ["gazel", "porter"],
+    "стройматериалы": ["gazel"],
+    "коробки": ["labo", "damas"],
+}
+CARGOS = ["мебель", "стройматериалы", "коробки", "продукты", "техника"]
+WEIGHTS = parse_weights("fit=1,wait=1,idle=0.5")
+
+# (заказов, водителей): избыток водителей и их нехватка
+SIZES = [(20, 50), (50, 200), (200, 1000), (500, 5000), (50, 20), (200, 100), (1000, 300)]
+# Венгерский считается, пока меньшая сторона не больше этого
+HUNGARIAN_MAX = 100
+
+
+def synthetic_batch(orders: int, drivers: int, rng: random.Random):
+    jobs = [
+        Job(i, rng.uniform(0, SATURATION * 1.5), allowed_cars(rng.choice(CARGOS), CARGO_CARS))
+        for i in range(orders)
+    ]
+    candidates = [
+        Candidate(i, rng.choice(CAR_MODELS), rng.uniform(0, SATURATION * 1.5))
+        for i in range(drivers)
+    ]
+    return jobs, candidates
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def total(pairs) -> float:
+    return sum(score for score, _, _ in pairs)
+
+
+def with_scores(scores, matched):
+    return [(scores[i][j], i, j) for i, j in matched]
+
+
+def main():
+    rng = random.Random(int(sys.argv[1]) if len(sys.argv) > 1 else 42)
+    for orders, drivers in SIZES:
+        jobs, candidates = synthetic_batch(orders, drivers, rng)
+        print(f"{orders} orders x {drivers} drivers ({orders * drivers} pairs):")
+
+        started = time.perf_counter()
+        scores = score_matrix(jobs, candidates, WEIGHTS)
+        dense = with_scores(scores, match_greedy([
+            (score, i, j)
+            for i, row in enumerate(scores)
+            for j, score in enumerate(row)
+            if score is not None
+        ]))
+        dense_ms = (time.perf_counter() - started) * 1000
+        print(f"  greedy, full matrix: {dense_ms:8.1f} ms, {len(dense)} pairs, "
+              f"score {total(dense):.2f}")
+
+        started = time.perf_counter()
+        pairs = best_pairs(jobs, candidates, WEIGHTS)
+        sparse = with_scores(scores, match_greedy(pairs))
+        sparse_ms = (time.perf_counter() - started) * 1000
+        print(f"  greedy, best pairs:  {sparse_ms:8.1f} ms, {len(sparse)} pairs, "
+              f"score {total(sparse):.2f} ({len(pairs)} pairs scored)")
+        assert abs(total(sparse) - total(dense)) < 1e-6, "best_pairs changed the greedy result"
+
+        if min(orders, drivers) <= HUNGARIAN_MAX:
+            started = time.perf_counter()
+            optimal = with_scores(scores, match_hungarian(score_matrix(jobs, candidates, WEIGHTS)))
+            hungarian_ms = (time.perf_counter() - started) * 1000
+            print(f"  hungarian:           {hungarian_ms:8.1f} ms, {len(optimal)} pairs, "
+                  f"score {total(optimal):.2f} "
+                  f"(greedy at {total(sparse) / total(optimal) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
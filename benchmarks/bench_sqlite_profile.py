@@ -0,0 +1,98 @@
+"""Сравнение профилей SQLite на нагрузке, похожей на бота.
+
+Каждая операция — короткая транзакция с commit, как в обработчиках:
+создание заказа, резерв, подтверждение. Затем случайные чтения заказа
+по id; объем данных по умолчанию (~12 MB) больше кэша SQLite по
+умолчанию (2 MB), чтобы разница в cache_size/mmap_size была видна.
+
+Запуск: python benchmarks/bench_sqlite_profile.py [заказов]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+PROFILES = {
+    "baseline (FULL, default cache)": {
+        "synchronous": "FULL",
+    },
+    "tuned (NORMAL, 16MB cache, 64MB mmap, temp in memory)": {
+        "synchronous": "NORMAL",
+        "cache_size": -16000,
+        "mmap_size": 64 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    },
+}
+
+SCHEMA = """
+CREATE TABLE orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    customer_id INTEGER NOT NULL,
+    cargo TEXT NOT NULL,
+    status TEXT NOT NULL,
+    driver_id INTEGER,
+    updated_at INTEGER
+);
+CREATE INDEX idx_orders_status ON orders(status);
+"""
+
+
+def run(profile: dict, orders: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "bench.sqlite"), isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        for name, value in profile.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        conn.executescript(SCHEMA)
+
+        started = time.perf_counter()
+        for i in range(orders):
+            conn.execute("BEGIN")
+            order_id = conn.execute(
+                "INSERT INTO orders (customer_id, cargo, status, updated_at) "
+                "VALUES (?, ?, 'WAITING_DRIVER', ?) RETURNING id",
+                (i % 500, "cargo" * 100, i)
+            ).fetchone()[0]
+            conn.execute("COMMIT")
+            for status in ("reserved", "completed"):
+                conn.execute("BEGIN")
+                conn.execute(
+                    "UPDATE orders SET status = ?, driver_id = ?, updated_at = ? WHERE id = ?",
+                    (status, i % 50, i, order_id)
+                )
+                conn.execute("COMMIT")
+        writes = time.perf_counter() - started
+
+        # Новое соединение с тем же профилем: холодный кэш страниц
+        conn.close()
+        conn = sqlite3.connect(os.path.join(tmp, "bench.sqlite"), isolation_level=None)
+        for name, value in profile.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        ids = [random.randint(1, orders) for _ in range(orders * 5)]
+
+        started = time.perf_counter()
+        for order_id in ids:
+            conn.execute("SELECT * FROM orders WHERE id = ?", (order_id,)).fetchone()
+        reads = time.perf_counter() - started
+        conn.close()
+
+    return {
+        "write_tx_per_s": orders * 3 / writes,
+        "reads_per_s": orders * 5 / reads,
+    }
+
+
+def main():
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for name, profile in PROFILES.items():
+        result = run(profile, orders)
+        print(
+            f"{name}: {result['write_tx_per_s']:.0f} write tx/s, "
+            f"{result['reads_per_s']:.0f} reads/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Жизненный цикл заказов через API Database на любом хранилище.
+
+Сценарий проверяет ожидаемые результаты (гонка за один заказ выигрывается
+ровно одним водителем) и печатает пропускную способность операций.
+
+Запуск:
+    python benchmarks/bench_storage.py sqlite:///bench.sqlite [заказов]
+    python benchmarks/bench_storage.py postgresql://user@localhost/bench [заказов]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import create_database  # noqa: E402
+from states import OrderStatus  # noqa: E402
+
+CUSTOMERS = 50
+DRIVERS = 20
+
+
+async def timed(name: str, count: int, coro_factory):
+    started = time.perf_counter()
+    results = await coro_factory()
+    elapsed = time.perf_counter() - started
+    print(f"{name}: {count / elapsed:.0f} ops/s")
+    return results
+
+
+async def run(url: str, orders: int):
+    db = create_database(url)
+    await db.connect()
+    try:
+        base = int(time.time() * 1000) % 10**9 * 1000
+        customers = [base + i for i in range(CUSTOMERS)]
+        drivers = [base + CUSTOMERS + i for i in range(DRIVERS)]
+        for user_id in customers:
+            await db.create_or_update_user(user_id, role="customer", phone="+1")
+        for user_id in drivers:
+            await db.create_or_update_user(user_id, role="driver", phone="+2")
+
+        async def create_all():
+            return [
+                await db.create_order(customers[i % CUSTOMERS], "cargo", "a", "b", "+1",
+                                      status=OrderStatus.WAITING_DRIVER)
+                for i in range(orders)
+            ]
+        order_ids = await timed("create_order", orders, create_all)
+
+        async def read_all():
+            for order_id in order_ids:
+                assert await db.get_order(order_id)
+        await timed("get_order", orders, read_all)
+
+        # Все водители одновременно борются за один заказ
+        contested = order_ids[0]
+        results = await asyncio.gather(*(
+            db.reserve_order(contested, driver_id, 0) for driver_id in drivers
+        ))
+        winners = [driver_id for driver_id, order in zip(drivers, results) if order]
+        assert len(winners) == 1, f"expected one winner, got {len(winners)}"
+        assert await db.release_order(contested, winners[0])
+
+        async def lifecycle():
+            for i, order_id in enumerate(order_ids):
+                driver_id = drivers[i % DRIVERS]
+                assert await db.reserve_order(order_id, driver_id, 0)
+                assert await db.complete_order(order_id, driver_id)
+        await timed("reserve+complete", orders, lifecycle)
+    finally:
+        await db.close()
+
+
+def main():
+    url = sys.argv[1] if len(sys.argv) > 1 else os.getenv("DATABASE_URL", "sqlite:///bench.sqlite")
+    orders = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    asyncio.run(run(url, orders))
+
+
+if __name__ == "__main__":
+    main()
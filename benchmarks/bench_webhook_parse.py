@@ -0,0 +1,46 @@
+"""Стоимость разбора одного апдейта вебхука: старый путь против нового.
+
+Запуск: python benchmarks/bench_webhook_parse.py [итераций]
+"""
+import json
+import sys
+import timeit
+
+from aiogram.types import Update
+
+SAMPLE_UPDATE = json.dumps({
+    "update_id": 100500,
+    "message": {
+        "message_id": 42,
+        "date": 1700000000,
+        "chat": {"id": 1001, "type": "private", "first_name": "Ivan"},
+        "from": {"id": 1001, "is_bot": False, "first_name": "Ivan", "username": "ivan"},
+        "contact": {"phone_number": "+998901234567", "first_name": "Ivan", "user_id": 1001},
+    },
+}).encode()
+
+
+def parse_old(body: bytes) -> Update:
+    """json.loads в dict, проверка update_id, затем Update(**dict)."""
+    update_json = json.loads(body)
+    if not isinstance(update_json, dict) or "update_id" not in update_json:
+        return None
+    return Update(**update_json)
+
+
+def parse_new(body: bytes) -> Update:
+    """Байты сразу в модель за один проход."""
+    return Update.model_validate_json(body)
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    assert parse_old(SAMPLE_UPDATE) == parse_new(SAMPLE_UPDATE)
+
+    for name, func in (("old", parse_old), ("new", parse_new)):
+        seconds = min(timeit.repeat(lambda: func(SAMPLE_UPDATE), number=number, repeat=5))
+        print(f"{name}: {seconds / number * 1e6:.2f} us/update")
+
+
+if __name__ == "__main__":
+    main()
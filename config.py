@@ -1,17 +1,162 @@
+import json
 import os
-from typing import List, Tuple
+from typing import Any, Dict, List, Tuple
 
 # Telegram Bot Configuration
 BOT_TOKEN = os.getenv("BOT_TOKEN")  # Telegram bot token
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Full URL for webhook (e.g., https://truckbot.myworkers.dev/)
-ORDERS_CHANNEL_ID = os.getenv("ORDERS_CHANNEL_ID")  # Channel ID for posting orders
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # secret_token for setWebhook (A-Z, a-z, 0-9, _ and -)
+MAX_WEBHOOK_BODY = int(os.getenv("MAX_WEBHOOK_BODY", "262144"))  # Max update size in bytes
+# Channel ID for posting orders (regions without their own channel)
+ORDERS_CHANNEL_ID = os.getenv("ORDERS_CHANNEL_ID")
+
+# Regional Order Channels
+# JSON: {"tashkent": {"title": "Ташкент", "chat_id": "-100...",
+#                     "keywords": ["ташкент", "toshkent"]}, ...}
+# Region -> channel
+ORDER_CHANNELS: Dict[str, Dict[str, Any]] = json.loads(os.getenv("ORDER_CHANNELS") or "{}")
+
+# Admin Access
+# Telegram user IDs
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x}
+# Bearer token for admin HTTP routes (disabled if empty)
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
+
+# Update Deduplication
+# How many recent update_id to remember (0 disables dedup)
+DEDUP_WINDOW = max(int(os.getenv("DEDUP_WINDOW", "2048")), 0)
+# Keep the window in SQLite across restarts
+DEDUP_PERSIST = os.getenv("DEDUP_PERSIST", "0") == "1" and DEDUP_WINDOW > 0
 
 # Database Configuration
+# sqlite:///path or postgresql://...
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///db.sqlite")
+PG_POOL_MIN_SIZE = int(os.getenv("PG_POOL_MIN_SIZE", "1"))  # asyncpg pool bounds (PostgreSQL only)
+PG_POOL_MAX_SIZE = int(os.getenv("PG_POOL_MAX_SIZE", "10"))
 
 # Order Configuration
 ORDER_CONFIRMATION_TIMEOUT = 900  # 15 minutes in seconds
 
+# Order Archive Configuration
+# Finished orders older than this go to orders_archive
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "7"))
+ARCHIVE_INTERVAL = int(os.getenv("ARCHIVE_INTERVAL", "3600"))  # Seconds between archiver runs
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))  # Orders moved per transaction
+
+# SQLite Storage Profile (benchmarks/bench_sqlite_profile.py: NORMAL gives ~2.6x
+# write transactions/s over FULL in WAL mode; cache and mmap give ~1.1-1.5x
+# random reads once the data outgrows the default 2 MB page cache)
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # OFF, NORMAL, FULL or EXTRA
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-16000"))  # Pages, or KiB if negative
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024)))  # Bytes
+SQLITE_TEMP_STORE = os.getenv("SQLITE_TEMP_STORE", "MEMORY")  # DEFAULT, FILE or MEMORY
+
+# SQLite Maintenance
+# Seconds between WAL checkpoints
+MAINTENANCE_INTERVAL = int(os.getenv("MAINTENANCE_INTERVAL", "60"))
+OPTIMIZE_INTERVAL = int(os.getenv("OPTIMIZE_INTERVAL", "21600"))  # Seconds between PRAGMA optimize
+VACUUM_PAGES = int(os.getenv("VACUUM_PAGES", "1000"))  # Pages freed per incremental_vacuum step
+# Largest file converted to incremental auto_vacuum at startup; bigger ones need vacuum_db.py
+VACUUM_CONVERT_MAX_MB = int(os.getenv("VACUUM_CONVERT_MAX_MB", "64"))
+
+# Analytics
+STATS_DAYS = int(os.getenv("STATS_DAYS", "7"))  # Days covered by /stats
+# Rows fetched per batch by /export/orders
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+
+# Bulk Import
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))  # Rows per import transaction
+# Max /import body in bytes
+IMPORT_MAX_BODY = int(os.getenv("IMPORT_MAX_BODY", str(20 * 1024 * 1024)))
+
+# Customer Order History
+MY_ORDERS_PAGE_SIZE = int(os.getenv("MY_ORDERS_PAGE_SIZE", "5"))  # Orders per /myorders page
+
+# Orders REST API
+API_CACHE_SIZE = int(os.getenv("API_CACHE_SIZE", "256"))  # Cached /api responses
+API_CACHE_TTL = float(os.getenv("API_CACHE_TTL", "30"))  # Seconds a cached /api response may live
+API_LIST_LIMIT = int(os.getenv("API_LIST_LIMIT", "100"))  # Max orders returned by /api/orders
+
+# Order Event Stream
+# Undelivered events per SSE client before it is dropped
+EVENTS_BUFFER = int(os.getenv("EVENTS_BUFFER", "256"))
+# Recent events kept for Last-Event-ID resume
+EVENTS_HISTORY = int(os.getenv("EVENTS_HISTORY", "1000"))
+# Seconds between SSE keepalive comments
+EVENTS_KEEPALIVE = float(os.getenv("EVENTS_KEEPALIVE", "15"))
+
+# Media
+# Remembered file_unique_id -> file_id pairs
+FILE_ID_CACHE_SIZE = int(os.getenv("FILE_ID_CACHE_SIZE", "512"))
+
+# Anti-Flood
+# key=requests/seconds per user; key is a command, "take" or a callback prefix; empty disables
+THROTTLE_RULES = os.getenv("THROTTLE_RULES", "*=20/10,orders=3/10,take=3/30,mo=10/10")
+
+# Domain Event Bus
+# Pending events per subscriber before new ones are dropped
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "1000"))
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "4"))  # Concurrent customer notification senders
+# Concurrent channel posters (one order stays on one worker)
+CHANNEL_WORKERS = int(os.getenv("CHANNEL_WORKERS", "4"))
+# Attempts to post a new order before leaving it to the sweep
+CHANNEL_POST_RETRIES = int(os.getenv("CHANNEL_POST_RETRIES", "3"))
+# Seconds between sweeps for unposted waiting orders
+CHANNEL_REPOST_INTERVAL = int(os.getenv("CHANNEL_REPOST_INTERVAL", "60"))
+# Age in seconds after which an unposted order is re-posted
+CHANNEL_REPOST_AFTER = int(os.getenv("CHANNEL_REPOST_AFTER", "60"))
+
+# Lifecycle
+# Seconds to drain updates and queues after SIGTERM
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "25"))
+# Warm-cache file written on shutdown; empty disables
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "cache_snapshot.json")
+# Seconds a snapshot stays usable on boot
+SNAPSHOT_MAX_AGE = int(os.getenv("SNAPSHOT_MAX_AGE", "900"))
+
+# Driver Presence
+# Seconds since last activity a driver on shift counts as available
+PRESENCE_TTL = int(os.getenv("PRESENCE_TTL", "900"))
+# Seconds between presence writes to the DB
+PRESENCE_FLUSH_INTERVAL = int(os.getenv("PRESENCE_FLUSH_INTERVAL", "60"))
+
+# Auto-Dispatch
+# "auto" offers waiting orders to available drivers; "off" keeps channel-only
+DISPATCH_MODE = os.getenv("DISPATCH_MODE", "off")
+DISPATCH_INTERVAL = float(os.getenv("DISPATCH_INTERVAL", "5"))  # Seconds between dispatch batches
+# greedy or hungarian (benchmarks/bench_dispatch.py)
+DISPATCH_MATCHER = os.getenv("DISPATCH_MATCHER", "greedy")
+# Larger batches fall back to greedy
+DISPATCH_HUNGARIAN_MAX = int(os.getenv("DISPATCH_HUNGARIAN_MAX", "50"))
+# Score = sum of weight * criterion in [0, 1]
+DISPATCH_WEIGHTS = os.getenv("DISPATCH_WEIGHTS", "fit=1,wait=1,idle=0.5")
+# Cargo keyword -> car models that fit
+DISPATCH_CARGO_CARS: Dict[str, List[str]] = json.loads(os.getenv("DISPATCH_CARGO_CARS") or "{}")
+# Longest-waiting orders considered per batch
+DISPATCH_BATCH = int(os.getenv("DISPATCH_BATCH", "200"))
+# Most recently active drivers considered per batch
+DISPATCH_MAX_DRIVERS = int(os.getenv("DISPATCH_MAX_DRIVERS", "1000"))
+# Seconds a driver has to confirm an offer
+DISPATCH_OFFER_TIMEOUT = int(os.getenv("DISPATCH_OFFER_TIMEOUT", "120"))
+
+# Driver Digest
+# Seconds between checks for due digests (0 disables digests)
+DIGEST_TICK = int(os.getenv("DIGEST_TICK", "60"))
+# Period for /digest without an argument
+DIGEST_DEFAULT_MINUTES = int(os.getenv("DIGEST_DEFAULT_MINUTES", "15"))
+# Shortest period a driver can choose
+DIGEST_MIN_MINUTES = int(os.getenv("DIGEST_MIN_MINUTES", "5"))
+# Orders listed (with buttons) in one digest
+DIGEST_MAX_ORDERS = int(os.getenv("DIGEST_MAX_ORDERS", "10"))
+DIGEST_BATCH = int(os.getenv("DIGEST_BATCH", "1000"))  # Digests built per tick
+DIGEST_CONCURRENCY = int(os.getenv("DIGEST_CONCURRENCY", "8"))  # Digest messages in flight at once
+# Digest messages per second (Telegram allows ~30)
+DIGEST_RATE = float(os.getenv("DIGEST_RATE", "25"))
+
+# Open Order Book
+# Seconds between DB sync checks
+ORDER_BOOK_RECONCILE_INTERVAL = int(os.getenv("ORDER_BOOK_RECONCILE_INTERVAL", "300"))
+
 # Available Car Models
 CAR_MODELS: List[Tuple[str, str]] = [
     ("labo", "Labo"),
@@ -22,7 +167,21 @@ CAR_MODELS: List[Tuple[str, str]] = [
 ]
 
 # Logging Configuration
-LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
-LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # Root log level
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json (one object per line) or text
+# Line format for LOG_FORMAT=text
+LOG_TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# INFO records per message template per minute kept in full
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "50"))
+# Beyond the burst keep 1 of N (1 disables sampling)
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "10"))
+
+# Tracing
+# Share of updates traced, 0..1 (0 disables tracing)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+# Recent spans kept in memory for /debug/traces
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", "5000"))
+# Also append spans to this JSONL file (empty = memory only)
+TRACE_FILE = os.getenv("TRACE_FILE", "")
 
 # Путь на Railway — для локального теста можно оставить пустым
\ No newline at end of file
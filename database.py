@@ -1,120 +1,272 @@
 import aiosqlite
+import asyncio
 import logging
 import json
-from typing import Optional, Dict, Any, List, Tuple
-from datetime import datetime
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List, Sequence, Tuple
+
+import config
+from services.order_book import OrderBook
+from services.order_events import OrderEventHub, TRANSITION_EVENTS
+from services.presence import PresenceTracker
+from services.tracing import tracer
+from states import (
+    OrderStatus,
+    OPEN_ORDER_STATUSES,
+    FINISHED_ORDER_STATUSES,
+    transition_sources
+)
+from storage.bulk import BulkMixin
+from storage.common import (
+    BOOK_COLUMNS,
+    LEGACY_STATUS_CASE,
+    ORDER_ADDED_COLUMNS,
+    ORDER_COLUMNS,
+    status_list,
+    unix_now
+)
+from storage.drivers import DriverMixin
+from storage.maintenance import MaintenanceMixin
+from storage.sqlite import SQLITE_INDEXES, SQLITE_SCHEMA, SQLiteExecutor
+from storage.stats import StatsMixin
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
-class Database:
+
+class Database(MaintenanceMixin, StatsMixin, BulkMixin, DriverMixin):
+    """Хранилище на SQLite.
+
+    Все запросы пишутся в общем для SQLite и PostgreSQL подмножестве SQL
+    с плейсхолдерами "?" и выполняются через self.sql или транзакцию
+    transaction(); PostgresDatabase подменяет только подключение.
+    Методы отдельных областей — в примесях пакета storage: обслуживание
+    и архив, счетчики и агрегаты, импорт и выгрузка, смены и дайджесты.
+    """
+
+    # Атомарный резерв заказа: обновится только заказ, ожидающий водителя
+    RESERVE_ORDER_SQL = f"""
+        UPDATE orders
+        SET status = {int(OrderStatus.DRIVER_ASSIGNED)}, driver_id = ?,
+            reserved_until = ?, updated_at = ?, reserved_at = ?
+        WHERE id = ? AND status IN ({status_list(transition_sources(OrderStatus.DRIVER_ASSIGNED))})
+        RETURNING {BOOK_COLUMNS}
+    """
+
+    # Создание индексов схемы (после миграций и массовой загрузки)
+    SCHEMA_INDEXES = SQLITE_INDEXES
+
+    # С файлом SQLite работает один процесс: после загрузки из БД книга
+    # заказов точна (см. OrderBook.exact)
+    ORDER_BOOK_EXACT = True
+
+    UPSERT_USER_SQL = """
+        INSERT INTO users (
+            user_id, username, first_name, last_name,
+            role, phone, car_model, updated_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            username = COALESCE(excluded.username, users.username),
+            first_name = COALESCE(excluded.first_name, users.first_name),
+            last_name = COALESCE(excluded.last_name, users.last_name),
+            role = COALESCE(excluded.role, users.role),
+            phone = COALESCE(excluded.phone, users.phone),
+            car_model = COALESCE(excluded.car_model, users.car_model),
+            updated_at = excluded.updated_at
+    """
+
     def __init__(self, path: str = "db.sqlite"):
         self.path = path
         self.db = None
+        self.sql = None
+        self._write_lock = asyncio.Lock()
+        self._tasks: List[asyncio.Task] = []
+        self._vacuum_pending = False
+        # Незавершенные заказы в памяти (см. load_order_book)
+        self.orders = OrderBook()
+        # События заказов для подписчиков (SSE /events/orders)
+        self.events = OrderEventHub(config.EVENTS_BUFFER, config.EVENTS_HISTORY)
+        # Водители на смене в памяти (см. load_presence и flush_presence)
+        self.presence = PresenceTracker(config.PRESENCE_TTL)
 
     async def connect(self):
         """Установить соединение с базой данных и инициализировать таблицы."""
         try:
             # Устанавливаем соединение с SQLite
             self.db = await aiosqlite.connect(self.path)
+            self.sql = SQLiteExecutor(self.db)
 
             # Включаем поддержку внешних ключей
             await self.db.execute("PRAGMA foreign_keys = ON")
 
+            # Инкрементальный vacuum: должен быть задан до создания таблиц
+            await self.db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
             # Устанавливаем режим работы с датами
             await self.db.execute("PRAGMA journal_mode=WAL")
+            await self._apply_profile()
+
+            for statement in SQLITE_SCHEMA:
+                await self.db.execute(statement)
+            await self.db.commit()
 
-            # Создаем таблицу пользователей
-            await self.db.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    role TEXT NOT NULL,
-                    phone TEXT,
-                    car_model TEXT,
-                    active_order INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (active_order) REFERENCES orders(id) ON DELETE SET NULL
-                );
-            """)
-
-            # Создаем таблицу заказов
-            await self.db.execute("""
-                CREATE TABLE IF NOT EXISTS orders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    customer_id INTEGER NOT NULL,
-                    cargo TEXT NOT NULL,
-                    from_addr TEXT NOT NULL,
-                    to_addr TEXT NOT NULL,
-                    phone TEXT NOT NULL,
-                    status TEXT NOT NULL DEFAULT 'created',
-                    driver_id INTEGER,
-                    tg_chat_id TEXT,
-                    tg_message_id INTEGER,
-                    reserved_until INTEGER,
-                    created_at INTEGER DEFAULT (strftime('%s','now')),
-                    updated_at INTEGER DEFAULT (strftime('%s','now')),
-                    FOREIGN KEY (customer_id) REFERENCES users(user_id) ON DELETE CASCADE,
-                    FOREIGN KEY (driver_id) REFERENCES users(user_id) ON DELETE SET NULL
-                );
-            """)
-
-            # Создаем таблицу сессий
-            await self.db.execute("""
-                CREATE TABLE IF NOT EXISTS sessions (
-                    chat_id INTEGER PRIMARY KEY,
-                    user_id INTEGER NOT NULL,
-                    step TEXT,
-                    temp TEXT,  -- JSON данные
-                    created_at INTEGER DEFAULT (strftime('%s','now')),
-                    updated_at INTEGER DEFAULT (strftime('%s','now')),
-                    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-                );
-            """)
-
-            # Создаем индексы для ускорения запросов
-            await self.db.execute("""
-                CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status);
-            """)
-            await self.db.execute("""
-                CREATE INDEX IF NOT EXISTS idx_orders_customer ON orders(customer_id);
-            """)
-            await self.db.execute("""
-                CREATE INDEX IF NOT EXISTS idx_orders_driver ON orders(driver_id);
-            """)
+            await self._migrate()
+            for statement in self.SCHEMA_INDEXES:
+                await self.db.execute(statement)
 
             await self.db.commit()
+            await self._ensure_customer_stats()
+            await self._ensure_incremental_vacuum()
+
+            # Рекомендуемый для долгоживущих соединений вызов при открытии
+            await self.db.execute("PRAGMA optimize=0x10002")
             logger.info("Database connection established and tables are ready")
 
         except Exception as e:
-            logger.error(f"Error connecting to database: {e}")
+            logger.error("Error connecting to database: %s", e)
             raise
 
     async def close(self):
         """Закрыть соединение с базой данных."""
+        await self._cancel_tasks()
+
         if self.db:
+            await self.flush_presence()
             await self.db.close()
             logger.info("Database connection closed")
 
+    async def _cancel_tasks(self):
+        """Остановить фоновые задачи обслуживания."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Транзакция: commit при успехе, rollback при исключении.
+
+        У SQLite одно соединение, поэтому транзакции сериализуются замком,
+        чтобы запросы разных обработчиков не попадали в чужой commit.
+        Span транзакции включает ожидание замка и commit.
+        """
+        with tracer.span("db.transaction"):
+            async with self._write_lock:
+                try:
+                    yield self.sql
+                except BaseException:
+                    await self.db.rollback()
+                    raise
+                await self.db.commit()
+
+    @asynccontextmanager
+    async def read_connection(self):
+        """Отдельное соединение только для чтения (долгие выгрузки).
+
+        В режиме WAL оно читает снимок базы и не мешает записи через
+        основное соединение.
+        """
+        conn = await aiosqlite.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            await conn.execute("PRAGMA query_only = ON")
+            yield SQLiteExecutor(conn)
+        finally:
+            await conn.close()
+
+    # ===== Migrations =====
+
+    async def _migrate(self):
+        """Привести схему существующей базы к текущей."""
+        # Колонки добавляются до пересоздания таблиц: оно копирует ORDER_COLUMNS
+        await self._add_order_columns()
+        await self._migrate_status_to_int()
+
+    async def _add_order_columns(self):
+        """Добавить к заказам колонки из ORDER_ADDED_COLUMNS."""
+        for table in ("orders", "orders_archive"):
+            cursor = await self.db.execute(f"SELECT name FROM pragma_table_info('{table}')")
+            existing = {row[0] for row in await cursor.fetchall()}
+            for column, column_type in ORDER_ADDED_COLUMNS.items():
+                if column not in existing:
+                    await self.db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+        await self.db.commit()
+
+    async def _migrate_status_to_int(self):
+        """Перевести строковые статусы заказов в числа OrderStatus.
+
+        SQLite не меняет тип колонки, поэтому таблицы orders и
+        orders_archive пересоздаются с переносом данных.
+        """
+        cursor = await self.db.execute(
+            "SELECT type FROM pragma_table_info('orders') WHERE name = 'status'"
+        )
+        if (await cursor.fetchone())[0].upper() == "INTEGER":
+            return
+
+        logger.info("Migrating order statuses to integer codes")
+        cursor = await self.db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'orders'")
+        row = await cursor.fetchone()
+        last_id = row[0] if row else 0
+
+        # Иначе DROP TABLE orders обнулит users.active_order через ON DELETE SET NULL
+        await self.db.execute("PRAGMA foreign_keys = OFF")
+        try:
+            tables = (("orders", SQLITE_SCHEMA[1]), ("orders_archive", SQLITE_SCHEMA[2]))
+            for table, schema in tables:
+                archived = ", archived_at" if table == "orders_archive" else ""
+                columns = ORDER_COLUMNS + archived
+                # Новая таблица создается рядом и переименовывается после DROP:
+                # RENAME старой таблицы переписал бы внешние ключи users на нее
+                await self.db.execute(
+                    schema.replace(f"EXISTS {table} (", f"EXISTS {table}_new (", 1)
+                )
+                await self.db.execute(f"""
+                    INSERT INTO {table}_new ({columns})
+                    SELECT {columns.replace("status", LEGACY_STATUS_CASE, 1)}
+                    FROM {table}
+                """)
+                await self.db.execute(f"DROP TABLE {table}")
+                await self.db.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+            # Не допускаем повторного использования id архивных заказов
+            cursor = await self.db.execute(
+                "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'orders'",
+                (last_id,)
+            )
+            if cursor.rowcount == 0 and last_id:
+                await self.db.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) VALUES ('orders', ?)",
+                    (last_id,)
+                )
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+        finally:
+            await self.db.execute("PRAGMA foreign_keys = ON")
+
     # ===== User Methods =====
 
     async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Получить данные пользователя по ID."""
         try:
-            cursor = await self.db.execute(
+            return await self.sql.fetchone(
                 "SELECT * FROM users WHERE user_id = ?",
                 (user_id,)
             )
-            row = await cursor.fetchone()
-            if not row:
-                return None
+        except Exception as e:
+            logger.error("Error getting user %s: %s", user_id, e)
+            return None
 
-            return dict(zip([d[0] for d in cursor.description], row))
+    async def get_user_role(self, user_id: int) -> Optional[str]:
+        """Получить роль пользователя."""
+        try:
+            return await self.sql.fetchval(
+                "SELECT role FROM users WHERE user_id = ?",
+                (user_id,)
+            )
         except Exception as e:
-            logger.error(f"Error getting user {user_id}: {e}")
+            logger.error("Error getting role of user %s: %s", user_id, e)
             return None
 
     async def create_or_update_user(
@@ -129,28 +281,78 @@ class Database:
     ) -> bool:
         """Создать или обновить пользователя."""
         try:
-            await self.db.execute("""
-                INSERT INTO users (
-                    user_id, username, first_name, last_name, 
-                    role, phone, car_model, updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, strftime('%s','now'))
-                ON CONFLICT(user_id) DO UPDATE SET
-                    username = COALESCE(excluded.username, username),
-                    first_name = COALESCE(excluded.first_name, first_name),
-                    last_name = COALESCE(excluded.last_name, last_name),
-                    role = COALESCE(excluded.role, role),
-                    phone = COALESCE(excluded.phone, phone),
-                    car_model = COALESCE(excluded.car_model, car_model),
-                    updated_at = strftime('%s','now')
-            """, (user_id, username, first_name, last_name, role, phone, car_model))
+            async with self.transaction() as sql:
+                await sql.execute(
+                    self.UPSERT_USER_SQL,
+                    (user_id, username, first_name, last_name, role, phone, car_model, unix_now())
+                )
+            return True
+        except Exception as e:
+            logger.error("Error creating/updating user %s: %s", user_id, e)
+            return False
 
-            await self.db.commit()
+    async def set_user_phone(self, user_id: int, phone: str) -> bool:
+        """Сохранить телефон пользователя."""
+        try:
+            async with self.transaction() as sql:
+                await sql.execute(
+                    "UPDATE users SET phone = ? WHERE user_id = ?",
+                    (phone, user_id)
+                )
             return True
         except Exception as e:
-            logger.error(f"Error creating/updating user {user_id}: {e}")
-            await self.db.rollback()
+            logger.error("Error setting phone of user %s: %s", user_id, e)
+            return False
+
+    async def set_user_car_model(self, user_id: int, car_model: str) -> bool:
+        """Сохранить модель автомобиля водителя."""
+        try:
+            async with self.transaction() as sql:
+                await sql.execute(
+                    "UPDATE users SET car_model = ? WHERE user_id = ?",
+                    (car_model, user_id)
+                )
+            return True
+        except Exception as e:
+            logger.error("Error setting car model of user %s: %s", user_id, e)
             return False
 
+    async def get_driver_profile(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Получить профиль пользователя вместе с его активным заказом."""
+        try:
+            return await self.sql.fetchone("""
+                SELECT u.role, u.car_model, u.active_order,
+                       o.cargo, o.from_addr, o.to_addr, o.status
+                FROM users u
+                LEFT JOIN orders o ON u.active_order = o.id
+                WHERE u.user_id = ?
+            """, (user_id,))
+        except Exception as e:
+            logger.error("Error getting profile of user %s: %s", user_id, e)
+            return None
+
+    async def get_dispatch_candidates(self, driver_ids: Sequence[int]) -> List[Dict[str, Any]]:
+        """Водители без активного заказа среди driver_ids одним запросом.
+
+        last_reserved — время последнего резерва водителя (для оценки
+        простоя), по индексу idx_orders_driver.
+        """
+        if not driver_ids:
+            return []
+        try:
+            placeholders = ", ".join("?" for _ in driver_ids)
+            return await self.sql.fetchall(f"""
+                SELECT u.user_id, u.username, u.car_model,
+                       (SELECT MAX(o.reserved_at) FROM orders o
+                        WHERE o.driver_id = u.user_id) AS last_reserved
+                FROM users u
+                WHERE u.user_id IN ({placeholders})
+                  AND u.role = 'driver' AND u.active_order IS NULL
+            """, list(driver_ids))
+        except Exception as e:
+            logger.error("Error getting dispatch candidates: %s", e)
+            return []
+
     # ===== Order Methods =====
 
     async def create_order(
@@ -159,68 +361,457 @@ class Database:
         cargo: str,
         from_addr: str,
         to_addr: str,
-        phone: str
+        phone: str,
+        status: OrderStatus = OrderStatus.CREATED,
+        photo_file_id: Optional[str] = None,
+        photo_unique_id: Optional[str] = None,
+        region: Optional[str] = None
     ) -> Optional[int]:
-        """Создать новый заказ."""
+        """Создать новый заказ (с необязательным фото груза и регионом канала)."""
         try:
-            cursor = await self.db.execute("""
-                INSERT INTO orders (
-                    customer_id, cargo, from_addr, to_addr, phone, 
-                    status, created_at, updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, strftime('%s','now'), strftime('%s','now'))
-                RETURNING id
-            """, (customer_id, cargo, from_addr, to_addr, phone, 'created'))
-
-            order_id = (await cursor.fetchone())[0]
-            await self.db.commit()
-            return order_id
+            now = unix_now()
+            async with self.transaction() as sql:
+                order = await sql.fetchone(f"""
+                    INSERT INTO orders (
+                        customer_id, cargo, from_addr, to_addr, phone,
+                        status, created_at, updated_at, posted_at,
+                        photo_file_id, photo_unique_id, region
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    RETURNING {BOOK_COLUMNS}
+                """, (
+                    customer_id, cargo, from_addr, to_addr, phone, int(status), now, now,
+                    now if status == OrderStatus.WAITING_DRIVER else None,
+                    photo_file_id, photo_unique_id, region
+                ))
+                await self._count_customer_order(sql, customer_id, None, status)
+                await self._roll_up(sql, now, created=1)
+            self.orders.apply(order)
+            self.events.publish("created", order)
+            return order["id"]
         except Exception as e:
-            logger.error(f"Error creating order: {e}")
-            await self.db.rollback()
+            logger.error("Error creating order: %s", e)
+            return None
+
+    async def set_order_message(self, order_id: int, chat_id: str, message_id: int) -> bool:
+        """Сохранить, в каком сообщении опубликован заказ."""
+        try:
+            async with self.transaction() as sql:
+                await sql.execute(
+                    "UPDATE orders SET tg_chat_id = ?, tg_message_id = ? WHERE id = ?",
+                    (str(chat_id), message_id, order_id)
+                )
+            self.orders.update(order_id, tg_chat_id=str(chat_id), tg_message_id=message_id)
+            return True
+        except Exception as e:
+            logger.error("Error saving message of order %s: %s", order_id, e)
+            return False
+
+    async def claim_order_repost(self, order_id: int, cutoff: int) -> Optional[Dict[str, Any]]:
+        """Взять для повторной публикации ожидающий заказ без сообщения в канале.
+
+        Условный UPDATE атомарен: из нескольких процессов заказ берет
+        один. updated_at сдвигается на текущее время, поэтому до следующего
+        cutoff заказ повторно не берется. Возвращает строку книги или None.
+        """
+        try:
+            now = unix_now()
+            async with self.transaction() as sql:
+                return await sql.fetchone(f"""
+                    UPDATE orders SET updated_at = ?
+                    WHERE id = ? AND status = {int(OrderStatus.WAITING_DRIVER)}
+                      AND tg_message_id IS NULL AND updated_at < ?
+                    RETURNING {BOOK_COLUMNS}
+                """, (now, order_id, cutoff))
+        except Exception as e:
+            logger.error("Error claiming order %s for re-post: %s", order_id, e)
             return None
 
     async def get_order(self, order_id: int) -> Optional[Dict[str, Any]]:
-        """Получить заказ по ID."""
+        """Получить заказ по ID (если его нет в orders — из архива)."""
         try:
-            cursor = await self.db.execute("""
-                SELECT o.*, 
-                       c.username as customer_username,
-                       c.phone as customer_phone,
-                       d.username as driver_username
-                FROM orders o
-                LEFT JOIN users c ON o.customer_id = c.user_id
-                LEFT JOIN users d ON o.driver_id = d.user_id
-                WHERE o.id = ?
-            """, (order_id,))
-
-            row = await cursor.fetchone()
-            if not row:
-                return None
-
-            return dict(zip([d[0] for d in cursor.description], row))
+            for table in ("orders", "orders_archive"):
+                order = await self.sql.fetchone(f"""
+                    SELECT o.*,
+                           c.username as customer_username,
+                           c.phone as customer_phone,
+                           d.username as driver_username
+                    FROM {table} o
+                    LEFT JOIN users c ON o.customer_id = c.user_id
+                    LEFT JOIN users d ON o.driver_id = d.user_id
+                    WHERE o.id = ?
+                """, (order_id,))
+                if order:
+                    return order
+            return None
         except Exception as e:
-            logger.error(f"Error getting order {order_id}: {e}")
+            logger.error("Error getting order %s: %s", order_id, e)
             return None
 
+    async def list_open_orders(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Получить заказы, ожидающие водителя (новые первыми)."""
+        try:
+            return await self.sql.fetchall(f"""
+                SELECT id, cargo, from_addr, to_addr FROM orders
+                WHERE status = {int(OrderStatus.WAITING_DRIVER)}
+                ORDER BY created_at DESC
+                LIMIT ?
+            """, (limit,))
+        except Exception as e:
+            logger.error("Error listing open orders: %s", e)
+            return []
+
+    async def reserve_order(
+        self,
+        order_id: int,
+        driver_id: int,
+        reserved_until: int
+    ) -> Optional[Dict[str, Any]]:
+        """Зарезервировать заказ за водителем.
+
+        Водитель без активного заказа и заказ, ожидающий водителя,
+        обновляются в одной транзакции условными UPDATE. Если кто-то
+        успел раньше, возвращается None и ничего не меняется.
+        """
+        try:
+            async with self.transaction() as sql:
+                taken = await sql.execute(
+                    "UPDATE users SET active_order = ? "
+                    "WHERE user_id = ? AND active_order IS NULL",
+                    (order_id, driver_id)
+                )
+                if not taken:
+                    return None
+                now = unix_now()
+                order = await sql.fetchone(
+                    self.RESERVE_ORDER_SQL,
+                    (driver_id, reserved_until, now, now, order_id)
+                )
+                if not order:
+                    raise _ReservationLost()
+                car_model = await sql.fetchval(
+                    "SELECT car_model FROM users WHERE user_id = ?", (driver_id,)
+                )
+                posted_at = order["posted_at"] or order["created_at"] or now
+                await self._roll_up(
+                    sql, now, car_model, reserved=1, wait_seconds=max(now - posted_at, 0)
+                )
+            self.orders.apply(order)
+            self.events.publish("reserved", order)
+            return order
+        except _ReservationLost:
+            return None
+        except Exception as e:
+            logger.error("Error reserving order %s: %s", order_id, e)
+            return None
+
+    async def set_driver_message(self, order_id: int, driver_id: int, message_id: int) -> bool:
+        """Сохранить сообщение, в котором водителю отправлен зарезервированный заказ."""
+        try:
+            async with self.transaction() as sql:
+                await sql.execute(f"""
+                    UPDATE orders SET driver_message_id = ?
+                    WHERE id = ? AND driver_id = ? AND status = {int(OrderStatus.DRIVER_ASSIGNED)}
+                """, (message_id, order_id, driver_id))
+            return True
+        except Exception as e:
+            logger.error("Error saving driver message of order %s: %s", order_id, e)
+            return False
+
+    async def get_expired_reservations(self, now: int, limit: int = 100) -> List[Dict[str, Any]]:
+        """Заказы, резерв которых истек, а водитель так и не ответил."""
+        try:
+            return await self.sql.fetchall(f"""
+                SELECT id, driver_id, driver_message_id FROM orders
+                WHERE status = {int(OrderStatus.DRIVER_ASSIGNED)}
+                  AND reserved_until IS NOT NULL AND reserved_until < ?
+                ORDER BY reserved_until
+                LIMIT ?
+            """, (now, limit))
+        except Exception as e:
+            logger.error("Error getting expired reservations: %s", e)
+            return []
+
+    async def complete_order(self, order_id: int, driver_id: int) -> Optional[Dict[str, Any]]:
+        """Подтвердить заказ водителем и освободить водителя.
+
+        Возвращает данные для уведомлений или None, если заказ не
+        принадлежит водителю.
+        """
+        try:
+            async with self.transaction() as sql:
+                now = unix_now()
+                order = await sql.fetchone(f"""
+                    UPDATE orders
+                    SET status = {int(OrderStatus.COMPLETED)}, updated_at = ?, finished_at = ?
+                    WHERE id = ? AND driver_id = ?
+                      AND status IN ({status_list(transition_sources(OrderStatus.COMPLETED))})
+                    RETURNING id, customer_id, phone, tg_chat_id, tg_message_id,
+                              photo_file_id, photo_unique_id
+                """, (now, now, order_id, driver_id))
+                if not order:
+                    return None
+
+                driver = await sql.fetchone(
+                    "SELECT phone, username, car_model FROM users WHERE user_id = ?",
+                    (driver_id,)
+                ) or {}
+                order["driver_phone"] = driver.get("phone")
+                order["driver_username"] = driver.get("username")
+                await self._roll_up(sql, now, driver.get("car_model"), confirmed=1)
+                await self._count_customer_order(
+                    sql, order["customer_id"], OrderStatus.DRIVER_ASSIGNED, OrderStatus.COMPLETED
+                )
+
+                await sql.execute(
+                    "UPDATE users SET active_order = NULL WHERE user_id = ?",
+                    (driver_id,)
+                )
+            self.orders.remove(order_id)
+            self.events.publish(
+                "confirmed", {**order, "status": OrderStatus.COMPLETED, "driver_id": driver_id}
+            )
+            return order
+        except Exception as e:
+            logger.error("Error completing order %s: %s", order_id, e)
+            return None
+
+    async def release_order(self, order_id: int, driver_id: int) -> Optional[Dict[str, Any]]:
+        """Вернуть заказ водителя в ожидание и освободить водителя."""
+        try:
+            async with self.transaction() as sql:
+                now = unix_now()
+                order = await sql.fetchone(f"""
+                    UPDATE orders
+                    SET status = {int(OrderStatus.WAITING_DRIVER)}, driver_id = NULL,
+                        reserved_until = NULL, updated_at = ?
+                    WHERE id = ? AND driver_id = ?
+                      AND status IN ({status_list(transition_sources(OrderStatus.WAITING_DRIVER))})
+                    RETURNING {BOOK_COLUMNS}
+                """, (now, order_id, driver_id))
+                if not order:
+                    return None
+
+                car_model = await sql.fetchval(
+                    "SELECT car_model FROM users WHERE user_id = ?", (driver_id,)
+                )
+                await self._roll_up(sql, now, car_model, released=1)
+                await sql.execute(
+                    "UPDATE users SET active_order = NULL WHERE user_id = ?",
+                    (driver_id,)
+                )
+            self.orders.apply(order)
+            self.events.publish("released", order)
+            return order
+        except Exception as e:
+            logger.error("Error releasing order %s: %s", order_id, e)
+            return None
+
+    async def transition_order(self, order_id: int, new_status: OrderStatus) -> bool:
+        """Перевести заказ в new_status, если переход разрешен.
+
+        Проверка и запись — один условный UPDATE, поэтому параллельный
+        переход того же заказа не пройдет дважды.
+        """
+        sources = transition_sources(new_status)
+        if not sources:
+            logger.warning("No transitions lead to status %s", new_status.name)
+            return False
+        now = unix_now()
+        timestamp = ""
+        if new_status == OrderStatus.WAITING_DRIVER:
+            timestamp = ", posted_at = COALESCE(posted_at, ?)"
+        elif new_status in FINISHED_ORDER_STATUSES:
+            timestamp = ", finished_at = ?"
+        try:
+            async with self.transaction() as sql:
+                order = await sql.fetchone(f"""
+                    UPDATE orders SET status = ?, updated_at = ?{timestamp}
+                    WHERE id = ? AND status IN ({status_list(sources)})
+                    RETURNING {BOOK_COLUMNS}
+                """, (int(new_status), now, *((now,) if timestamp else ()), order_id))
+                if order:
+                    # Все исходные статусы перехода незавершенные
+                    await self._count_customer_order(
+                        sql, order["customer_id"], sources[0], new_status
+                    )
+                    if new_status == OrderStatus.COMPLETED:
+                        await self._roll_up(sql, now, confirmed=1)
+                    elif new_status in FINISHED_ORDER_STATUSES:
+                        await self._roll_up(sql, now, cancelled=1)
+            if not order:
+                return False
+            self.orders.apply(order)
+            self.events.publish(TRANSITION_EVENTS.get(new_status, new_status.name.lower()), order)
+            return True
+        except Exception as e:
+            logger.error("Error moving order %s to %s: %s", order_id, new_status.name, e)
+            return False
+
+    # ===== Customer History =====
+
+    async def list_customer_orders(
+        self,
+        customer_id: int,
+        limit: int,
+        before: Optional[Tuple[int, int]] = None
+    ) -> List[Dict[str, Any]]:
+        """Заказы клиента, новые первыми, с keyset-пагинацией.
+
+        before — (created_at, id) последнего заказа предыдущей страницы.
+        orders и orders_archive читаются по индексу (customer_id, created_at, id),
+        каждая не больше limit строк, независимо от длины истории.
+        """
+        condition = "AND (created_at, id) < (?, ?)" if before else ""
+        part_params = (customer_id, *before, limit) if before else (customer_id, limit)
+        parts = [
+            f"""
+            SELECT * FROM (
+                SELECT id, cargo, from_addr, to_addr, status, created_at
+                FROM {table}
+                WHERE customer_id = ? {condition}
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            ) AS {table}_page
+            """
+            for table in ("orders", "orders_archive")
+        ]
+        try:
+            return await self.sql.fetchall(
+                " UNION ALL ".join(parts) + " ORDER BY created_at DESC, id DESC LIMIT ?",
+                (*part_params, *part_params, limit)
+            )
+        except Exception as e:
+            logger.error("Error listing orders of customer %s: %s", customer_id, e)
+            return []
+
+    # ===== Open Order Book =====
+
+    async def fetch_open_orders(self) -> List[Dict[str, Any]]:
+        """Все незавершенные заказы из БД (для книги заказов)."""
+        return await self.sql.fetchall(f"""
+            SELECT {BOOK_COLUMNS} FROM orders
+            WHERE status IN ({status_list(OPEN_ORDER_STATUSES)})
+        """)
+
+    async def load_order_book(self) -> int:
+        """Загрузить незавершенные заказы в память при старте."""
+        self.orders.load(await self.fetch_open_orders())
+        self.orders.exact = self.ORDER_BOOK_EXACT
+        logger.info("Order book loaded: %s open orders", len(self.orders))
+        return len(self.orders)
+
+    async def reconcile_order_book(self) -> int:
+        """Сверить книгу заказов с БД и вернуть число расхождений.
+
+        Выполняется под блокировкой записи: на SQLite книга меняется сразу
+        после коммита, и сверка не застанет запись между ними.
+        """
+        async with self._write_lock:
+            rows = await self.fetch_open_orders()
+            drift = self.orders.reconcile(rows)
+            self.orders.exact = self.ORDER_BOOK_EXACT
+        if drift:
+            logger.warning("Order book drift: %s orders differed from the database", drift)
+        return drift
+
+    async def run_order_book_reconciler(self, interval: int):
+        """Фоновая задача: периодическая сверка книги заказов."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reconcile_order_book()
+            except Exception as e:
+                logger.error("Error reconciling order book: %s", e)
+
+    # ===== Meta Methods =====
+
+    async def get_meta(self, key: str) -> Optional[str]:
+        """Получить служебное значение по ключу."""
+        try:
+            return await self.sql.fetchval(
+                "SELECT value FROM meta WHERE key = ?",
+                (key,)
+            )
+        except Exception as e:
+            logger.error("Error getting meta %s: %s", key, e)
+            return None
+
+    async def set_meta(self, key: str, value: Optional[str]) -> bool:
+        """Сохранить служебное значение."""
+        try:
+            async with self.transaction() as sql:
+                await sql.execute("""
+                    INSERT INTO meta (key, value, updated_at)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                        value = excluded.value,
+                        updated_at = excluded.updated_at
+                """, (key, value, unix_now()))
+            return True
+        except Exception as e:
+            logger.error("Error setting meta %s: %s", key, e)
+            return False
+
+    # ===== Update Dedup Methods =====
+
+    async def load_seen_updates(self, limit: int) -> List[int]:
+        """Получить последние обработанные update_id (от старых к новым)."""
+        try:
+            rows = await self.sql.fetchall(
+                "SELECT update_id FROM seen_updates ORDER BY update_id DESC LIMIT ?",
+                (limit,)
+            )
+            return [row["update_id"] for row in reversed(rows)]
+        except Exception as e:
+            logger.error("Error loading seen updates: %s", e)
+            return []
+
+    async def remember_update(self, update_id: int, window: int) -> bool:
+        """Сохранить update_id и удалить вышедшие из окна.
+
+        update_id у Telegram монотонно растут, поэтому окно ограничивается
+        удалением по диапазону первичного ключа.
+        """
+        try:
+            async with self.transaction() as sql:
+                await sql.execute(
+                    "INSERT INTO seen_updates (update_id) VALUES (?) "
+                    "ON CONFLICT (update_id) DO NOTHING",
+                    (update_id,)
+                )
+                await sql.execute(
+                    "DELETE FROM seen_updates WHERE update_id <= ?",
+                    (update_id - window,)
+                )
+            return True
+        except Exception as e:
+            logger.error("Error remembering update %s: %s", update_id, e)
+            return False
+
+    async def forget_update(self, update_id: int) -> bool:
+        """Удалить update_id из окна (обработка не удалась)."""
+        try:
+            async with self.transaction() as sql:
+                await sql.execute("DELETE FROM seen_updates WHERE update_id = ?", (update_id,))
+            return True
+        except Exception as e:
+            logger.error("Error forgetting update %s: %s", update_id, e)
+            return False
+
     # ===== Session Methods =====
 
     async def get_session(self, chat_id: int) -> Optional[Dict[str, Any]]:
         """Получить данные сессии по chat_id."""
         try:
-            cursor = await self.db.execute(
+            session = await self.sql.fetchone(
                 "SELECT * FROM sessions WHERE chat_id = ?",
                 (chat_id,)
             )
-            row = await cursor.fetchone()
-            if not row:
-                return None
-
-            session = dict(zip([d[0] for d in cursor.description], row))
-            if session.get('temp'):
+            if session and session.get('temp'):
                 session['temp'] = json.loads(session['temp'])
             return session
         except Exception as e:
-            logger.error(f"Error getting session for chat {chat_id}: {e}")
+            logger.error("Error getting session for chat %s: %s", chat_id, e)
             return None
 
     async def save_session(
@@ -233,38 +824,54 @@ class Database:
         """Сохранить данные сессии."""
         try:
             temp_json = json.dumps(temp) if temp else None
-            await self.db.execute("""
-                INSERT INTO sessions (chat_id, user_id, step, temp, updated_at)
-                VALUES (?, ?, ?, ?, strftime('%s','now'))
-                ON CONFLICT(chat_id) DO UPDATE SET
-                    step = COALESCE(excluded.step, step),
-                    temp = COALESCE(excluded.temp, temp),
-                    updated_at = strftime('%s','now')
-            """, (chat_id, user_id, step, temp_json))
-
-            await self.db.commit()
+            async with self.transaction() as sql:
+                await sql.execute("""
+                    INSERT INTO sessions (chat_id, user_id, step, temp, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(chat_id) DO UPDATE SET
+                        step = COALESCE(excluded.step, sessions.step),
+                        temp = COALESCE(excluded.temp, sessions.temp),
+                        updated_at = excluded.updated_at
+                """, (chat_id, user_id, step, temp_json, unix_now()))
             return True
         except Exception as e:
-            logger.error(f"Error saving session for chat {chat_id}: {e}")
-            await self.db.rollback()
+            logger.error("Error saving session for chat %s: %s", chat_id, e)
             return False
 
     async def delete_session(self, chat_id: int) -> bool:
         """Удалить сессию."""
         try:
-            await self.db.execute(
-                "DELETE FROM sessions WHERE chat_id = ?",
-                (chat_id,)
-            )
-            await self.db.commit()
+            async with self.transaction() as sql:
+                await sql.execute(
+                    "DELETE FROM sessions WHERE chat_id = ?",
+                    (chat_id,)
+                )
             return True
         except Exception as e:
-            logger.error(f"Error deleting session for chat {chat_id}: {e}")
-            await self.db.rollback()
+            logger.error("Error deleting session for chat %s: %s", chat_id, e)
             return False
 
+
+class _ReservationLost(Exception):
+    """Заказ успели взять: откатить резерв водителя."""
+
+
+def create_database(url: str) -> Database:
+    """Выбрать хранилище по DATABASE_URL.
+
+    sqlite:///path — SQLite (по умолчанию), postgres:// или
+    postgresql:// — PostgreSQL с пулом asyncpg.
+    """
+    if url.startswith(("postgres://", "postgresql://")):
+        from database_pg import PostgresDatabase
+        return PostgresDatabase(url, config.PG_POOL_MIN_SIZE, config.PG_POOL_MAX_SIZE)
+    if url.startswith("sqlite:///"):
+        return Database(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported DATABASE_URL: {url}")
+
+
 # Создаем глобальный экземпляр базы данных
-db = Database()
+db = create_database(config.DATABASE_URL)
 
 async def init_db():
     """Инициализировать базу данных при запуске."""
@@ -273,4 +880,4 @@ async def init_db():
 
 async def close_db():
     """Закрыть соединение с базой данных при завершении работы."""
-    await db.close()
\ No newline at end of file
+    await db.close()
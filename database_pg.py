@@ -0,0 +1,358 @@
+import asyncio
+import logging
+import re
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Sequence, AsyncIterator
+
+import asyncpg
+
+import config
+from database import Database
+from services.tracing import traced_query, tracer
+from states import OrderStatus, transition_sources
+from storage.common import (
+    BOOK_COLUMNS,
+    LEGACY_STATUS_CASE,
+    ORDER_ADDED_COLUMNS,
+    ROLLUP_TABLES,
+    status_list
+)
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Схема PostgreSQL, совместимая с запросами Database
+POSTGRES_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id BIGINT PRIMARY KEY,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        role TEXT NOT NULL,
+        phone TEXT,
+        car_model TEXT,
+        active_order BIGINT,
+        created_at BIGINT DEFAULT EXTRACT(EPOCH FROM NOW())::BIGINT,
+        updated_at BIGINT DEFAULT EXTRACT(EPOCH FROM NOW())::BIGINT
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS orders (
+        id BIGSERIAL PRIMARY KEY,
+        customer_id BIGINT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+        cargo TEXT NOT NULL,
+        from_addr TEXT NOT NULL,
+        to_addr TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        status SMALLINT NOT NULL DEFAULT 1,
+        driver_id BIGINT REFERENCES users(user_id) ON DELETE SET NULL,
+        tg_chat_id TEXT,
+        tg_message_id BIGINT,
+        reserved_until BIGINT,
+        created_at BIGINT DEFAULT EXTRACT(EPOCH FROM NOW())::BIGINT,
+        updated_at BIGINT DEFAULT EXTRACT(EPOCH FROM NOW())::BIGINT,
+        posted_at BIGINT,
+        reserved_at BIGINT,
+        finished_at BIGINT,
+        photo_file_id TEXT,
+        photo_unique_id TEXT,
+        region TEXT,
+        driver_message_id BIGINT
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS orders_archive (
+        id BIGINT PRIMARY KEY,
+        customer_id BIGINT NOT NULL,
+        cargo TEXT NOT NULL,
+        from_addr TEXT NOT NULL,
+        to_addr TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        status SMALLINT NOT NULL,
+        driver_id BIGINT,
+        tg_chat_id TEXT,
+        tg_message_id BIGINT,
+        reserved_until BIGINT,
+        created_at BIGINT,
+        updated_at BIGINT,
+        posted_at BIGINT,
+        reserved_at BIGINT,
+        finished_at BIGINT,
+        photo_file_id TEXT,
+        photo_unique_id TEXT,
+        region TEXT,
+        driver_message_id BIGINT,
+        archived_at BIGINT DEFAULT EXTRACT(EPOCH FROM NOW())::BIGINT
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sessions (
+        chat_id BIGINT PRIMARY KEY,
+        user_id BIGINT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+        step TEXT,
+        temp TEXT,
+        created_at BIGINT DEFAULT EXTRACT(EPOCH FROM NOW())::BIGINT,
+        updated_at BIGINT DEFAULT EXTRACT(EPOCH FROM NOW())::BIGINT
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT,
+        updated_at BIGINT DEFAULT EXTRACT(EPOCH FROM NOW())::BIGINT
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS seen_updates (
+        update_id BIGINT PRIMARY KEY
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS driver_presence (
+        user_id BIGINT PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+        last_seen BIGINT NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS driver_digest (
+        user_id BIGINT PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+        period INTEGER NOT NULL,
+        last_sent BIGINT NOT NULL,
+        next_at BIGINT NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS customer_stats (
+        customer_id BIGINT PRIMARY KEY,
+        active INTEGER NOT NULL DEFAULT 0,
+        completed INTEGER NOT NULL DEFAULT 0,
+        cancelled INTEGER NOT NULL DEFAULT 0
+    );
+    """,
+    *[
+        f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            bucket BIGINT NOT NULL,
+            car_model TEXT NOT NULL DEFAULT '',
+            created INTEGER NOT NULL DEFAULT 0,
+            reserved INTEGER NOT NULL DEFAULT 0,
+            confirmed INTEGER NOT NULL DEFAULT 0,
+            released INTEGER NOT NULL DEFAULT 0,
+            cancelled INTEGER NOT NULL DEFAULT 0,
+            wait_seconds BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, car_model)
+        );
+        """
+        for table in ROLLUP_TABLES.values()
+    ],
+]
+
+# Индексы создаются после миграций (см. SQLITE_INDEXES)
+POSTGRES_INDEXES = [
+    "DROP INDEX IF EXISTS idx_orders_status;",
+    f"""
+    CREATE INDEX IF NOT EXISTS idx_orders_waiting ON orders(created_at)
+    WHERE status = {int(OrderStatus.WAITING_DRIVER)};
+    """,
+    "DROP INDEX IF EXISTS idx_orders_customer;",
+    "DROP INDEX IF EXISTS idx_orders_archive_customer;",
+    "CREATE INDEX IF NOT EXISTS idx_orders_customer_created "
+    "ON orders(customer_id, created_at, id);",
+    "CREATE INDEX IF NOT EXISTS idx_orders_archive_customer_created "
+    "ON orders_archive(customer_id, created_at, id);",
+    "CREATE INDEX IF NOT EXISTS idx_orders_driver ON orders(driver_id);",
+    "CREATE INDEX IF NOT EXISTS idx_driver_digest_next ON driver_digest(next_at);",
+]
+
+
+@lru_cache(maxsize=512)
+def to_postgres_sql(sql: str) -> str:
+    """Заменить плейсхолдеры "?" на $1, $2, ... (результат кэшируется)."""
+    counter = iter(range(1, sql.count("?") + 1))
+    return re.sub(r"\?", lambda _: f"${next(counter)}", sql)
+
+
+class PostgresExecutor:
+    """Выполнение запросов через пул или соединение asyncpg.
+
+    asyncpg подготавливает каждое выражение и кэширует его на соединении,
+    поэтому повторные запросы не разбираются сервером заново.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @traced_query
+    async def execute(self, sql: str, params: Sequence = ()) -> int:
+        """Выполнить запрос и вернуть число затронутых строк."""
+        status = await self.conn.execute(to_postgres_sql(sql), *params)
+        # Статус вида "UPDATE 1" / "INSERT 0 1"
+        last = status.rsplit(" ", 1)[-1]
+        return int(last) if last.isdigit() else 0
+
+    @traced_query
+    async def executemany(self, sql: str, rows: Sequence[Sequence]) -> None:
+        """Выполнить запрос для каждого набора параметров."""
+        await self.conn.executemany(to_postgres_sql(sql), rows)
+
+    @traced_query
+    async def fetchone(self, sql: str, params: Sequence = ()) -> Optional[Dict[str, Any]]:
+        """Получить первую строку результата."""
+        row = await self.conn.fetchrow(to_postgres_sql(sql), *params)
+        return dict(row) if row else None
+
+    @traced_query
+    async def fetchall(self, sql: str, params: Sequence = ()) -> List[Dict[str, Any]]:
+        """Получить все строки результата."""
+        return [dict(row) for row in await self.conn.fetch(to_postgres_sql(sql), *params)]
+
+    @traced_query
+    async def fetchval(self, sql: str, params: Sequence = ()) -> Any:
+        """Получить первое значение первой строки."""
+        return await self.conn.fetchval(to_postgres_sql(sql), *params)
+
+    async def stream(
+        self,
+        sql: str,
+        params: Sequence = (),
+        batch_size: int = 500
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Читать результат пачками через серверный курсор (нужна транзакция)."""
+        cursor = await self.conn.cursor(to_postgres_sql(sql), *params)
+        while True:
+            rows = await cursor.fetch(batch_size)
+            if not rows:
+                break
+            yield [dict(row) for row in rows]
+
+
+class PostgresDatabase(Database):
+    """Хранилище на PostgreSQL с пулом соединений asyncpg.
+
+    Запросы наследуются от Database; здесь только подключение,
+    транзакции и отличия диалекта.
+    """
+
+    # Резерв с SKIP LOCKED: если строку уже резервирует другой процесс,
+    # запрос не ждет его транзакцию, а сразу сообщает, что заказ занят
+    RESERVE_ORDER_SQL = f"""
+        UPDATE orders
+        SET status = {int(OrderStatus.DRIVER_ASSIGNED)}, driver_id = ?,
+            reserved_until = ?, updated_at = ?, reserved_at = ?
+        WHERE id = (
+            SELECT id FROM orders
+            WHERE id = ?
+              AND status IN ({status_list(transition_sources(OrderStatus.DRIVER_ASSIGNED))})
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING {BOOK_COLUMNS}
+    """
+
+    SCHEMA_INDEXES = POSTGRES_INDEXES
+
+    # Несколько процессов пишут в одну базу, книга каждого сверяется
+    # только периодически и может отставать
+    ORDER_BOOK_EXACT = False
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10):
+        super().__init__(path=None)
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None
+
+    async def connect(self):
+        """Создать пул соединений и инициализировать таблицы."""
+        try:
+            self.pool = await asyncpg.create_pool(
+                self.dsn,
+                min_size=self.min_size,
+                max_size=self.max_size
+            )
+            self.sql = PostgresExecutor(self.pool)
+
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    for statement in POSTGRES_SCHEMA:
+                        await conn.execute(statement)
+                    await self._add_order_columns(conn)
+                    await self._migrate_status_to_int(conn)
+                    for statement in self.SCHEMA_INDEXES:
+                        await conn.execute(statement)
+            await self._ensure_customer_stats()
+
+            logger.info("PostgreSQL pool established and tables are ready")
+        except Exception as e:
+            logger.error("Error connecting to PostgreSQL: %s", e)
+            raise
+
+    async def _add_order_columns(self, conn):
+        """Добавить к заказам колонки из ORDER_ADDED_COLUMNS."""
+        for table in ("orders", "orders_archive"):
+            for column, column_type in ORDER_ADDED_COLUMNS.items():
+                column_type = "BIGINT" if column_type == "INTEGER" else column_type
+                await conn.execute(
+                    f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {column_type}"
+                )
+
+    async def _migrate_status_to_int(self, conn):
+        """Перевести строковые статусы заказов в числа OrderStatus."""
+        for table in ("orders", "orders_archive"):
+            data_type = await conn.fetchval("""
+                SELECT data_type FROM information_schema.columns
+                WHERE table_schema = current_schema()
+                  AND table_name = $1 AND column_name = 'status'
+            """, table)
+            if data_type != "text":
+                continue
+
+            logger.info("Migrating %s statuses to integer codes", table)
+            await conn.execute(f"ALTER TABLE {table} ALTER COLUMN status DROP DEFAULT")
+            await conn.execute(
+                f"ALTER TABLE {table} ALTER COLUMN status TYPE SMALLINT "
+                f"USING ({LEGACY_STATUS_CASE})"
+            )
+            if table == "orders":
+                await conn.execute(
+                    f"ALTER TABLE orders ALTER COLUMN status SET DEFAULT {int(OrderStatus.CREATED)}"
+                )
+
+    async def close(self):
+        """Закрыть пул соединений."""
+        await self._cancel_tasks()
+
+        if self.pool:
+            await self.flush_presence()
+            await self.pool.close()
+            logger.info("PostgreSQL pool closed")
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Транзакция на отдельном соединении из пула."""
+        with tracer.span("db.transaction"):
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    yield PostgresExecutor(conn)
+
+    @asynccontextmanager
+    async def read_connection(self):
+        """Соединение из пула в транзакции только для чтения (для курсоров)."""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction(readonly=True):
+                yield PostgresExecutor(conn)
+
+    def start_maintenance(self):
+        """Запустить архивацию и сверку книги заказов; остальное делает autovacuum."""
+        self._tasks.append(asyncio.create_task(self.run_archiver(
+            config.ARCHIVE_INTERVAL,
+            config.ARCHIVE_AFTER_DAYS * 86400,
+            config.ARCHIVE_BATCH_SIZE
+        )))
+        self._tasks.append(asyncio.create_task(self.run_order_book_reconciler(
+            config.ORDER_BOOK_RECONCILE_INTERVAL
+        )))
+        self._tasks.append(asyncio.create_task(self.run_presence_flusher(
+            config.PRESENCE_FLUSH_INTERVAL
+        )))
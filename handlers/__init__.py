@@ -0,0 +1,22 @@
+def register_handlers(dp):
+    """Регистрация всех роутеров бота.
+
+    Модули обработчиков импортируются здесь, а не при импорте пакета,
+    чтобы их загрузка попадала в замер фазы старта "handlers".
+    """
+    from handlers.start import register_start
+    from handlers.auth import register_auth
+    from handlers.customer import register_customer
+    from handlers.driver import register_driver
+    from handlers.orders import register_orders
+    from handlers.admin import register_admin
+    from handlers.callbacks import register_callbacks
+
+    register_start(dp)
+    register_auth(dp)
+    register_customer(dp)
+    register_driver(dp)
+    register_orders(dp)
+    register_admin(dp)
+    # Все callback-запросы проходят через один диспетчер по префиксу
+    register_callbacks(dp)
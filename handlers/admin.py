@@ -0,0 +1,57 @@
+from aiogram import Router, F, types
+from aiogram.filters import Command
+
+from config import ADMIN_IDS, CAR_MODELS, STATS_DAYS
+from database import db
+from services.stats import collect_stats
+
+router = Router()
+# Команды роутера доступны только администраторам, остальным они не видны
+router.message.filter(F.from_user.id.in_(ADMIN_IDS))
+
+
+def _percent(ratio) -> str:
+    return f"{ratio * 100:.0f}%" if ratio is not None else "—"
+
+
+def _minutes(seconds) -> str:
+    return f"{seconds / 60:.1f} мин" if seconds is not None else "—"
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: types.Message):
+    """Сводка по заказам из агрегатов (без запросов к orders)."""
+    stats = await collect_stats(db, STATS_DAYS)
+    window, last_24h = stats["window"], stats["last_24h"]
+    car_names = dict(CAR_MODELS)
+
+    text = (
+        f"📊 <b>Статистика за {STATS_DAYS} дн.</b>\n"
+        f"Заказов: {window['orders']} "
+        f"(в среднем {window['orders'] / STATS_DAYS:.1f} в день)\n"
+        f"Публикация → резерв: {_minutes(window['avg_wait_seconds'])}\n"
+        f"Резерв → подтверждение: {_percent(window['confirm_rate'])}\n"
+        f"Отменено заказчиками: {window['cancelled']}\n\n"
+        f"<b>За 24 часа:</b> заказов {last_24h['orders']}, "
+        f"резервов {last_24h['reservations']}, "
+        f"подтверждено {last_24h['confirmed']}\n"
+    )
+
+    if stats["days"]:
+        text += "\n<b>По дням:</b>\n" + "\n".join(
+            f"{day['day']}: {day['orders']} заказов, {day['confirmed']} подтверждено"
+            for day in stats["days"]
+        ) + "\n"
+
+    if stats["car_models"]:
+        text += "\n<b>Отказы водителей по машинам:</b>\n" + "\n".join(
+            f"{car_names.get(m['car_model'], m['car_model'])}: "
+            f"{_percent(m['cancel_rate'])} из {m['reservations']} резервов"
+            for m in stats["car_models"]
+        )
+
+    await message.answer(text)
+
+
+def register_admin(dp):
+    dp.include_router(router)
@@ -1,4 +1,4 @@
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import (
     CallbackQuery, 
     Message, 
@@ -8,16 +8,17 @@ from aiogram.types import (
 )
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.filters import Command, StateFilter
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command
 import logging
 
+from config import CAR_MODELS
 from database import db
+from handlers.callbacks import callbacks
+from keyboards.callbacks import RoleCallback, CarCallback
 from keyboards.auth_buttons import role_keyboard as get_role_keyboard
 from keyboards.driver_buttons import get_car_models_keyboard
 
 # Настройка логирования
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = Router()
@@ -37,15 +38,15 @@ async def cmd_role(message: Message):
             reply_markup=get_role_keyboard()
         )
     except Exception as e:
-        logger.error(f"Error in cmd_role: {e}")
+        logger.error("Error in cmd_role: %s", e)
         await message.answer("❌ Произошла ошибка. Пожалуйста, попробуйте снова.")
 
 
-@router.callback_query(F.data.startswith("role_"))
-async def set_role(callback: CallbackQuery, state: FSMContext):
+@callbacks.handler(RoleCallback, legacy="role")
+async def set_role(callback: CallbackQuery, callback_data: RoleCallback, state: FSMContext):
     """Обработчик выбора роли пользователя."""
     try:
-        role = callback.data.split("_", 1)[1]  # Безопасное разделение
+        role = callback_data.role
         user_id = callback.from_user.id
         
         if role not in ["customer", "driver"]:
@@ -53,15 +54,7 @@ async def set_role(callback: CallbackQuery, state: FSMContext):
             return
         
         # Обновление роли в базе данных
-        await db.db.execute(
-            """
-            INSERT INTO users (user_id, role, created_at) 
-            VALUES (?, ?, datetime('now'))
-            ON CONFLICT(user_id) DO UPDATE SET role = excluded.role
-            """,
-            (user_id, role)
-        )
-        await db.db.commit()
+        await db.create_or_update_user(user_id, role=role)
         
         if role == "driver":
             # Для водителей запрашиваем модель автомобиля
@@ -71,6 +64,8 @@ async def set_role(callback: CallbackQuery, state: FSMContext):
                 reply_markup=get_car_models_keyboard()
             )
         else:
+            # Заказчик не может оставаться на смене водителем
+            db.presence.end_shift(user_id)
             # Для заказчиков запрашиваем номер телефона
             await state.set_state(AuthState.waiting_for_phone)
             await callback.message.answer(
@@ -90,7 +85,7 @@ async def set_role(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
         
     except Exception as e:
-        logger.error(f"Error in set_role: {e}")
+        logger.error("Error in set_role: %s", e)
         try:
             await callback.answer("❌ Ошибка при выборе роли")
         except:
@@ -113,19 +108,10 @@ async def process_phone(message: Message, state: FSMContext):
             return
             
         # Сохраняем номер в базу данных
-        await db.db.execute(
-            "UPDATE users SET phone = ? WHERE user_id = ?",
-            (phone, message.from_user.id)
-        )
-        await db.db.commit()
+        await db.set_user_phone(message.from_user.id, phone)
         
         # Получаем роль пользователя для персонализированного сообщения
-        cur = await db.db.execute(
-            "SELECT role FROM users WHERE user_id = ?",
-            (message.from_user.id,)
-        )
-        role_row = await cur.fetchone()
-        role = role_row[0] if role_row else "пользователь"
+        role = await db.get_user_role(message.from_user.id) or "пользователь"
         
         role_name = "водитель" if role == "driver" else "заказчик"
         
@@ -138,7 +124,7 @@ async def process_phone(message: Message, state: FSMContext):
          )
         
     except Exception as e:
-        logger.error(f"Error in process_phone: {e}")
+        logger.error("Error in process_phone: %s", e)
         await message.answer(
             "❌ Произошла ошибка при обработке номера. Пожалуйста, попробуйте снова."
         )
@@ -146,19 +132,29 @@ async def process_phone(message: Message, state: FSMContext):
         await state.clear()
 
 
-@router.callback_query(F.data.startswith("car_"))
-async def set_car_model(callback: CallbackQuery, state: FSMContext):
-    """Обработчик выбора модели автомобиля."""
+@callbacks.handler(CarCallback, legacy="car")
+async def set_car_model(callback: CallbackQuery, callback_data: CarCallback, state: FSMContext):
+    """Обработчик выбора модели автомобиля (при регистрации и при смене машины)."""
     try:
-        car_model = callback.data.split("_", 1)[1]
+        car_model = callback_data.model
+        model_name = dict(CAR_MODELS).get(car_model)
         user_id = callback.from_user.id
+
+        if not model_name:
+            await callback.answer("❌ Неизвестная модель")
+            return
         
         # Сохраняем модель автомобиля в базу данных
-        await db.db.execute(
-            "UPDATE users SET car_model = ? WHERE user_id = ?",
-            (car_model, user_id)
-        )
-        await db.db.commit()
+        await db.set_user_car_model(user_id, car_model)
+
+        # Вне регистрации только подтверждаем смену машины
+        if await state.get_state() != AuthState.waiting_for_car_model.state:
+            await callback.answer(f"Выбрана машина: {model_name}")
+            await callback.message.answer(
+                f"Отлично! Ваша машина: <b>{model_name}</b>\n"
+                "Теперь вы можете принимать заказы."
+            )
+            return
         
         # Запрашиваем номер телефона
         await state.set_state(AuthState.waiting_for_phone)
@@ -176,10 +172,10 @@ async def set_car_model(callback: CallbackQuery, state: FSMContext):
             )
         )
         
-        await callback.answer(f"Выбрана модель: {car_model}")
+        await callback.answer(f"Выбрана модель: {model_name}")
         
     except Exception as e:
-        logger.error(f"Error in set_car_model: {e}")
+        logger.error("Error in set_car_model: %s", e)
         try:
             await callback.answer("❌ Ошибка при выборе модели")
         except:
@@ -0,0 +1,108 @@
+import inspect
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+
+from aiogram import Router
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery
+from pydantic import ValidationError
+
+from services.tracing import annotate
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+
+class _Route:
+    """Зарегистрированный обработчик callback-запроса."""
+    __slots__ = ("factory", "func", "params")
+
+    def __init__(self, factory: Type[CallbackData], func: Callable):
+        self.factory = factory
+        self.func = func
+        # Какие данные aiogram передавать обработчику (None — все)
+        signature = inspect.signature(func)
+        if any(p.kind is p.VAR_KEYWORD for p in signature.parameters.values()):
+            self.params = None
+        else:
+            self.params = frozenset(signature.parameters)
+
+
+class CallbackDispatcher:
+    """Маршрутизация callback-запросов по префиксу callback_data.
+
+    Вместо цепочки фильтров F.data.startswith(...) по всем роутерам
+    префикс ищется в словаре, поэтому стоимость маршрутизации не зависит
+    от числа обработчиков. Повторная регистрация префикса — ошибка.
+    """
+
+    def __init__(self):
+        self._routes: Dict[str, _Route] = {}
+        # Префиксы старого формата "<prefix>_<value>" для кнопок,
+        # отправленных до перехода на CallbackData
+        self._legacy: Dict[str, _Route] = {}
+
+    def handler(self, factory: Type[CallbackData], legacy: Optional[str] = None):
+        """Декоратор: привязать обработчик к фабрике callback_data."""
+        def decorator(func: Callable) -> Callable:
+            prefix = factory.__prefix__
+            if prefix in self._routes:
+                raise ValueError(f"Callback prefix '{prefix}' is already registered")
+            route = _Route(factory, func)
+            self._routes[prefix] = route
+            if legacy:
+                if legacy in self._legacy:
+                    raise ValueError(f"Legacy callback prefix '{legacy}' is already registered")
+                self._legacy[legacy] = route
+            return func
+        return decorator
+
+    def resolve(self, data: str) -> Optional[Tuple[_Route, CallbackData]]:
+        """Найти обработчик и разобрать callback_data."""
+        prefix, sep, _ = data.partition(":")
+        route = self._routes.get(prefix) if sep else None
+        if route:
+            return route, route.factory.unpack(data)
+
+        # Старый формат: единственное поле фабрики в хвосте строки
+        legacy_prefix, _, value = data.rpartition("_")
+        route = self._legacy.get(legacy_prefix)
+        if route:
+            field = next(iter(route.factory.model_fields))
+            return route, route.factory(**{field: value})
+        return None
+
+    async def dispatch(self, callback: CallbackQuery, data: Dict[str, Any]) -> Any:
+        """Вызвать обработчик для callback-запроса."""
+        try:
+            resolved = self.resolve(callback.data or "")
+        except (ValidationError, ValueError, TypeError) as e:
+            logger.warning("Malformed callback data '%s': %s", callback.data, e)
+            resolved = None
+
+        if not resolved:
+            await callback.answer()
+            return None
+
+        route, callback_data = resolved
+        # Все callback-запросы идут через dispatch_callback: в трассе нужен настоящий обработчик
+        annotate(handler=route.func.__name__)
+        kwargs = {**data, "callback_data": callback_data}
+        if route.params is not None:
+            kwargs = {k: v for k, v in kwargs.items() if k in route.params}
+        return await route.func(callback, **kwargs)
+
+
+callbacks = CallbackDispatcher()
+
+
+@router.callback_query()
+async def dispatch_callback(callback: CallbackQuery, **data: Any):
+    """Единая точка входа для всех callback-запросов."""
+    return await callbacks.dispatch(callback, data)
+
+
+def register_callbacks(dp):
+    """Регистрация диспетчера callback-запросов."""
+    dp.include_router(router)
@@ -1,7 +1,6 @@
-import json
 import logging
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import datetime
+from typing import Optional, Tuple
 
 from aiogram import Router, F, types, Bot
 from aiogram.fsm.context import FSMContext
@@ -12,16 +11,19 @@ from aiogram.types import (
     ReplyKeyboardRemove,
     InlineKeyboardMarkup
 )
-from aiogram.filters import Command, StateFilter
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command
 
 from database import db
-from states import OrderState, OrderStatus, Order
-from config import ORDERS_CHANNEL_ID, ORDER_CONFIRMATION_TIMEOUT
-from keyboards.order_buttons import (
-    get_order_keyboard, 
-    get_order_taken_keyboard,
-    get_order_confirmed_keyboard
-)
+from handlers.callbacks import callbacks
+from services.event_bus import bus, OrderCreated
+from services.logs import bind_log_context
+from keyboards.callbacks import OrderStatusCallback, MyOrdersCallback
+from states import OrderState, OrderStatus, Order, ORDER_STATUS_TITLES
+from config import MY_ORDERS_PAGE_SIZE
+from services.channels import channels
+from services.media import file_ids, fit_caption, photo_of
+from keyboards.order_buttons import get_order_keyboard, get_my_orders_keyboard
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -32,78 +34,80 @@ router = Router()
 
 async def get_user_role(user_id: int) -> str:
     """Получить роль пользователя из базы данных."""
-    try:
-        cur = await db.db.execute(
-            "SELECT role FROM users WHERE user_id = ?",
-            (user_id,)
-        )
-        row = await cur.fetchone()
-        return row[0] if row else None
-    except Exception as e:
-        logger.error(f"Ошибка при получении роли пользователя {user_id}: {e}")
-        return None
+    return await db.get_user_role(user_id)
+
+def order_channel_text(order_data: dict, order_id: int) -> str:
+    """Текст открытого заказа в канале."""
+    return (
+        f"🚚 <b>Новый заказ #{order_id}</b>\n\n"
+        f"📦 <b>Груз:</b> {order_data.get('cargo', 'Не указан')}\n"
+        f"📍 <b>Откуда:</b> {order_data.get('from_addr', 'Не указан')}\n"
+        f"🏁 <b>Куда:</b> {order_data.get('to_addr', 'Не указан')}\n"
+        f"📱 <b>Телефон:</b> {order_data.get('phone', 'Не указан')}"
+    )
 
-async def post_order_to_channel(bot: Bot, order_data: dict, order_id: int) -> int:
-    """Опубликовать новый заказ в канале и вернуть ID сообщения."""
+async def post_order_to_channel(bot: Bot, order_data: dict, order_id: int) -> Tuple[str, int]:
+    """Опубликовать новый заказ в канале его региона; вернуть ID канала и сообщения."""
+    chat_id = channels.chat_for(order_data.get('region'))
     try:
-        text = (
-            f"🚚 <b>Новый заказ #{order_id}</b>\n\n"
-            f"📦 <b>Груз:</b> {order_data.get('cargo', 'Не указан')}\n"
-            f"📍 <b>Откуда:</b> {order_data.get('from_addr', 'Не указан')}\n"
-            f"🏁 <b>Куда:</b> {order_data.get('to_addr', 'Не указан')}\n"
-            f"📱 <b>Телефон:</b> {order_data.get('phone', 'Не указан')}"
-        )
+        text = order_channel_text(order_data, order_id)
         
         # Отправка сообщения в канал
-        if not ORDERS_CHANNEL_ID:
+        if not chat_id:
             logger.error("ORDERS_CHANNEL_ID is not set!")
             raise ValueError("ORDERS_CHANNEL_ID настроен неправильно (отсутствует).")
             
         from main import bot_info
         bot_username = bot_info.get("username", "truck_bot")
         
-        logger.info(f"Trying to post to channel ID: {ORDERS_CHANNEL_ID} with text length {len(text)}")
-        message = await bot.send_message(
-            chat_id=ORDERS_CHANNEL_ID,
-            text=text,
-            reply_markup=get_order_keyboard(order_id, bot_username)
-        )
-        logger.info(f"Successfully posted to channel. Message ID: {message.message_id}")
-        return message.message_id
+        logger.info("Trying to post to channel ID: %s with text length %s", chat_id, len(text))
+        keyboard = get_order_keyboard(order_id, bot_username)
+        if order_data.get('photo_file_id'):
+            message = await bot.send_photo(
+                chat_id=chat_id,
+                photo=file_ids.resolve(
+                    order_data.get('photo_unique_id'), order_data['photo_file_id']
+                ),
+                caption=fit_caption(text, order_data.get('cargo')),
+                reply_markup=keyboard
+            )
+            file_ids.remember_message(message)
+        else:
+            message = await bot.send_message(chat_id=chat_id, text=text, reply_markup=keyboard)
+        logger.info("Successfully posted to channel. Message ID: %s", message.message_id)
+        return str(chat_id), message.message_id
     except Exception as e:
-        logger.error(f"Ошибка при публикации заказа #{order_id} в канал (ID: {ORDERS_CHANNEL_ID}): {e}")
+        logger.error("Ошибка при публикации заказа #%s в канал (ID: %s): %s", order_id, chat_id, e)
         raise
 
 async def get_order(order_id: int) -> Optional[Order]:
-    """Получить заказ по ID."""
+    """Получить заказ по ID.
+
+    Незавершенные заказы берутся из книги заказов в памяти, остальные —
+    из БД (в том числе из архива).
+    """
     try:
-        cur = await db.db.execute(
-            """
-            SELECT id, customer_id, cargo, from_addr, to_addr, phone, 
-                   status, driver_id, created_at, reserved_until
-            FROM orders 
-            WHERE id = ?
-            """,
-            (order_id,)
-        )
-        row = await cur.fetchone()
+        record = db.orders.get(order_id)
+        row = record.as_dict() if record else await db.get_order(order_id)
         if not row:
             return None
             
         return Order(
-            order_id=row[0],
-            customer_id=row[1],
-            cargo=row[2],
-            from_addr=row[3],
-            to_addr=row[4],
-            phone=row[5],
-            status=OrderStatus[row[6]] if row[6] else OrderStatus.CREATED,
-            driver_id=row[7],
-            created_at=datetime.fromtimestamp(row[8]) if row[8] else None,
-            reserved_until=datetime.fromtimestamp(row[9]) if row[9] else None
+            order_id=row['id'],
+            customer_id=row['customer_id'],
+            cargo=row['cargo'],
+            from_addr=row['from_addr'],
+            to_addr=row['to_addr'],
+            phone=row['phone'],
+            status=OrderStatus(row['status']),
+            driver_id=row['driver_id'],
+            created_at=datetime.fromtimestamp(row['created_at']) if row['created_at'] else None,
+            reserved_until=(
+                datetime.fromtimestamp(row['reserved_until']) if row['reserved_until'] else None
+            )
         )
     except Exception as e:
-        logger.error(f"Ошибка при получении заказа #{order_id}: {e}")
+        logger.error("Ошибка при получении заказа #%s: %s", order_id, e)
         return None
 
 
@@ -121,24 +125,73 @@ async def start_order(message: types.Message, state: FSMContext):
     await state.set_state(OrderState.waiting_for_cargo)
     await message.answer(
         "🚛 <b>Оформление нового заказа</b>\n\n"
-        "Опишите, что нужно перевезти:"
+        "Опишите, что нужно перевезти (можно приложить фото груза с подписью):"
     )
 
 
 @router.message(OrderState.waiting_for_cargo)
 async def process_cargo(message: Message, state: FSMContext) -> None:
-    """Обработка ввода описания груза."""
-    await state.update_data(cargo=message.text)
+    """Обработка ввода описания груза (текстом или фото с подписью)."""
+    photo_file_id, photo_unique_id = photo_of(message)
+    if photo_file_id:
+        # Сохраняем только file_id: сам файл остается на серверах Telegram
+        await state.update_data(photo_file_id=photo_file_id, photo_unique_id=photo_unique_id)
+    cargo = message.text or message.caption
+    if not cargo:
+        await message.answer(
+            "📝 Фото сохранено. Теперь опишите груз текстом:" if photo_file_id
+            else "📝 Опишите груз текстом или пришлите фото с подписью:"
+        )
+        return
+    await state.update_data(cargo=cargo)
     await state.set_state(OrderState.waiting_for_from)
     await message.answer("📍 Откуда забрать груз? Напишите адрес отправления:")
 
 
+# Вариант выбора региона, для которого нет отдельного канала
+OTHER_REGION = "🌐 Другой регион"
+
+
+async def ask_to_address(message: Message, state: FSMContext) -> None:
+    """Перейти к вводу адреса доставки."""
+    await state.set_state(OrderState.waiting_for_to)
+    await message.answer(
+        "🏁 Куда доставить груз? Напишите адрес доставки:",
+        reply_markup=ReplyKeyboardRemove()
+    )
+
+
 @router.message(OrderState.waiting_for_from)
 async def process_from_address(message: Message, state: FSMContext) -> None:
     """Обработка ввода адреса отправления."""
-    await state.update_data(from_addr=message.text)
-    await state.set_state(OrderState.waiting_for_to)
-    await message.answer("🏁 Куда доставить груз? Напишите адрес доставки:")
+    region = channels.detect(message.text)
+    await state.update_data(from_addr=message.text, region=region)
+    if region or not len(channels):
+        await ask_to_address(message, state)
+        return
+
+    # Регион по адресу не определился — заказчик выбирает его сам
+    await state.set_state(OrderState.waiting_for_region)
+    await message.answer(
+        "🗺 В каком регионе забрать груз?",
+        reply_markup=ReplyKeyboardMarkup(
+            keyboard=[[KeyboardButton(text=title)] for title in channels.titles()]
+            + [[KeyboardButton(text=OTHER_REGION)]],
+            resize_keyboard=True,
+            one_time_keyboard=True
+        )
+    )
+
+
+@router.message(OrderState.waiting_for_region)
+async def process_region(message: Message, state: FSMContext) -> None:
+    """Обработка выбора региона."""
+    region = channels.by_title(message.text)
+    if region is None and message.text != OTHER_REGION:
+        await message.answer("❌ Выберите регион кнопкой ниже.")
+        return
+    await state.update_data(region=region)
+    await ask_to_address(message, state)
 
 
 @router.message(OrderState.waiting_for_to)
@@ -191,54 +244,37 @@ async def process_phone(
     
     try:
         # Сохраняем заказ в базу данных
-        cur = await db.db.execute(
-            """
-            INSERT INTO orders (
-                customer_id, cargo, from_addr, to_addr, phone, 
-                status, created_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            RETURNING id
-            """,
-            (
-                message.from_user.id, 
-                cargo, 
-                from_addr, 
-                to_addr, 
-                phone,
-                OrderStatus.WAITING_DRIVER.name,
-                int(datetime.now().timestamp())
-            )
+        order_id = await db.create_order(
+            message.from_user.id,
+            cargo,
+            from_addr,
+            to_addr,
+            phone,
+            status=OrderStatus.WAITING_DRIVER,
+            photo_file_id=data.get('photo_file_id'),
+            photo_unique_id=data.get('photo_unique_id'),
+            region=data.get('region')
         )
+        if not order_id:
+            raise RuntimeError("order was not saved")
+        bind_log_context(order_id=order_id)
         
-        order_id = (await cur.fetchone())[0]
-        await db.db.commit()
-        
-        # Публикуем заказ в канале
-        message_id = await post_order_to_channel(
-            bot,
-            {
-                'cargo': cargo,
-                'from_addr': from_addr,
-                'to_addr': to_addr,
-                'phone': phone
-            },
-            order_id
-        )
-        
-        # Обновляем информацию о сообщении в базе данных
-        await db.db.execute(
-            """
-            UPDATE orders 
-            SET tg_chat_id = ?, tg_message_id = ? 
-            WHERE id = ?
-            """,
-            (ORDERS_CHANNEL_ID, message_id, order_id)
-        )
-        await db.db.commit()
+        # Публикацию в канале выполняет подписчик шины событий
+        bus.publish(OrderCreated({
+            'id': order_id,
+            'customer_id': message.from_user.id,
+            'cargo': cargo,
+            'from_addr': from_addr,
+            'to_addr': to_addr,
+            'phone': phone,
+            'region': data.get('region'),
+            'photo_file_id': data.get('photo_file_id'),
+            'photo_unique_id': data.get('photo_unique_id')
+        }))
         
         # Отправляем подтверждение пользователю
         await message.answer(
-            "✅ <b>Ваш заказ создан и отправлен водителям!</b>\n\n"
+            "✅ <b>Ваш заказ создан и публикуется для водителей!</b>\n\n"
             f"<b>Номер заказа:</b> #{order_id}\n"
             f"<b>Груз:</b> {cargo}\n"
             f"<b>Откуда:</b> {from_addr}\n"
@@ -252,7 +288,7 @@ async def process_phone(
         await state.clear()
         
     except Exception as e:
-        logger.error(f"Ошибка при создании заказа: {e}", exc_info=True)
+        logger.error("Ошибка при создании заказа: %s", e, exc_info=True)
         await message.answer(
             "❌ Произошла ошибка при создании заказа. Пожалуйста, попробуйте снова.",
             reply_markup=ReplyKeyboardRemove()
@@ -268,36 +304,83 @@ async def process_phone_invalid(message: Message) -> None:
     )
 
 
-@router.callback_query(F.data.startswith("order_status_"))
-async def check_order_status(callback: CallbackQuery) -> None:
+@callbacks.handler(OrderStatusCallback, legacy="order_status")
+async def check_order_status(callback: CallbackQuery, callback_data: OrderStatusCallback) -> None:
     """Проверить статус заказа."""
     try:
-        order_id = int(callback.data.split("_")[2])
+        order_id = callback_data.order_id
         order = await get_order(order_id)
         
         if not order:
             await callback.answer("❌ Заказ не найден", show_alert=True)
             return
             
-        status_text = {
-            OrderStatus.CREATED: "создан",
-            OrderStatus.WAITING_DRIVER: "ожидает водителя",
-            OrderStatus.DRIVER_ASSIGNED: f"взят водителем (ID: {order.driver_id})",
-            OrderStatus.IN_PROGRESS: "в процессе доставки",
-            OrderStatus.COMPLETED: "завершен",
-            OrderStatus.CANCELLED: "отменен",
-            OrderStatus.EXPIRED: "истекло время ожидания"
-        }.get(order.status, "неизвестен")
+        status_text = ORDER_STATUS_TITLES.get(order.status, "неизвестен")
+        if order.status == OrderStatus.DRIVER_ASSIGNED:
+            status_text += f" (ID: {order.driver_id})"
         
         await callback.answer(
             f"Статус заказа #{order_id}: {status_text}",
             show_alert=True
         )
     except Exception as e:
-        logger.error(f"Ошибка при проверке статуса заказа: {e}")
+        logger.error("Ошибка при проверке статуса заказа: %s", e)
         await callback.answer("❌ Произошла ошибка при проверке статуса", show_alert=True)
 
 
+async def render_my_orders(
+    customer_id: int,
+    before: Optional[Tuple[int, int]] = None
+) -> Tuple[str, InlineKeyboardMarkup]:
+    """Страница истории заказов клиента: текст и клавиатура."""
+    stats = await db.get_customer_stats(customer_id)
+    # Лишняя строка показывает, есть ли следующая страница
+    rows = await db.list_customer_orders(customer_id, MY_ORDERS_PAGE_SIZE + 1, before)
+    orders, has_more = rows[:MY_ORDERS_PAGE_SIZE], len(rows) > MY_ORDERS_PAGE_SIZE
+
+    text = (
+        "📋 <b>Мои заказы</b>\n"
+        f"Активных: {stats['active']} · Выполнено: {stats['completed']} · "
+        f"Отменено: {stats['cancelled']}\n\n"
+    )
+    if not orders:
+        text += "Заказов пока нет. Создать заказ: /order"
+    for order in orders:
+        created = datetime.fromtimestamp(order['created_at']).strftime("%d.%m.%Y %H:%M")
+        text += (
+            f"<b>#{order['id']}</b> от {created} — "
+            f"{ORDER_STATUS_TITLES.get(OrderStatus(order['status']), 'неизвестен')}\n"
+            f"📦 {order['cargo']}\n"
+            f"📍 {order['from_addr']} → {order['to_addr']}\n\n"
+        )
+
+    last = orders[-1] if orders else None
+    next_cursor = (last['created_at'], last['id']) if has_more else None
+    return text, get_my_orders_keyboard(orders, next_cursor, first_page=before is None)
+
+
+@router.message(Command("myorders"))
+async def cmd_my_orders(message: Message) -> None:
+    """Показать историю заказов клиента, новые первыми."""
+    text, keyboard = await render_my_orders(message.from_user.id)
+    await message.answer(text, reply_markup=keyboard)
+
+
+@callbacks.handler(MyOrdersCallback)
+async def page_my_orders(callback: CallbackQuery, callback_data: MyOrdersCallback) -> None:
+    """Перелистнуть историю заказов."""
+    before = None
+    if callback_data.before_id:
+        before = (callback_data.before_ts, callback_data.before_id)
+    text, keyboard = await render_my_orders(callback.from_user.id, before)
+    try:
+        await callback.message.edit_text(text, reply_markup=keyboard)
+    except TelegramBadRequest:
+        # Страница не изменилась ("message is not modified")
+        pass
+    await callback.answer()
+
+
 def register_customer(dp):
     """Регистрация обработчиков для заказчиков."""
     dp.include_router(router)
\ No newline at end of file
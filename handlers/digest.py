@@ -0,0 +1,151 @@
+import asyncio
+import html
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+
+from config import (
+    DIGEST_TICK, DIGEST_MAX_ORDERS, DIGEST_BATCH, DIGEST_CONCURRENCY, DIGEST_RATE,
+    DISPATCH_CARGO_CARS
+)
+from database import db
+from keyboards.order_buttons import get_digest_keyboard
+from services.broadcast import BatchSender
+from services.dispatch import allowed_cars
+from services.logs import log_context
+from services.order_book import OrderRecord
+from services.tracing import tracer
+from states import OrderStatus
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+def digest_text(records: List[OrderRecord], total: int) -> str:
+    """Текст дайджеста: по строке на заказ, новые первыми."""
+    lines = [f"📬 <b>Новые заказы: {total}</b>\n"]
+    for record in records:
+        lines.append(
+            f"<b>#{record.id}</b> 📦 {html.escape(record.cargo or '')}\n"
+            f"📍 {html.escape(record.from_addr or '')} → {html.escape(record.to_addr or '')}"
+        )
+    if total > len(records):
+        lines.append(f"\n…и еще {total - len(records)} в канале заказов.")
+    lines.append("\nОтключить дайджест: /digest off")
+    return "\n".join(lines)
+
+
+class DigestSender:
+    """Дайджест новых заказов для водителей, подписанных командой /digest.
+
+    Раз в DIGEST_TICK секунд одним запросом выбираются подписки, которым
+    пора отправить дайджест; заказы берутся из книги открытых заказов в
+    памяти. Водитель получает одно сообщение со списком ожидающих
+    заказов, опубликованных после его прошлого дайджеста и подходящих
+    его машине (DISPATCH_CARGO_CARS), вместо сообщения на каждый заказ.
+    Сообщения уходят через BatchSender с ограничением параллельности.
+    """
+
+    def __init__(self, bot: Bot, sender: BatchSender):
+        self.bot = bot
+        self.sender = sender
+        self._running = True
+        self.ticks = 0
+        self.digests = 0
+        self.empty = 0
+        self.unsubscribed = 0
+
+    def stop(self) -> None:
+        """Не начинать новых рассылок (при остановке приложения)."""
+        self._running = False
+
+    async def run(self, interval: float) -> None:
+        """Фоновая задача: проверка подписок каждые interval секунд."""
+        while self._running:
+            log_context.set({})
+            try:
+                with tracer.trace("digest.tick"):
+                    await self.tick()
+            except Exception as e:
+                logger.error("Digest tick failed: %s", e)
+            await asyncio.sleep(interval)
+
+    async def tick(self) -> int:
+        """Одна рассылка; возвращает число отправленных дайджестов."""
+        from main import bot_info
+
+        now = int(time.time())
+        self.ticks += 1
+        due = await db.get_due_digests(now, DIGEST_BATCH)
+        if not due:
+            return 0
+
+        # Заказы, новые хотя бы для одной подписки, новые первыми. Граница
+        # включается: заказ той же секунды лучше повторить, чем пропустить
+        since = min(row["last_sent"] for row in due)
+        waiting = db.orders.count(OrderStatus.WAITING_DRIVER)
+        fresh = [
+            (record, record.posted_at or record.created_at,
+             allowed_cars(record.cargo, DISPATCH_CARGO_CARS))
+            for record in db.orders.newest(OrderStatus.WAITING_DRIVER, waiting)
+            if (record.posted_at or record.created_at) >= since
+        ]
+
+        bot_username = bot_info.get("username", "truck_bot")
+        jobs = []
+        for row in due:
+            matching = [
+                record for record, posted_at, cars in fresh
+                if posted_at >= row["last_sent"] and (cars is None or row["car_model"] in cars)
+            ]
+            if not matching:
+                self.empty += 1
+                continue
+            shown = matching[:DIGEST_MAX_ORDERS]
+            jobs.append((row["user_id"], self._send_job(
+                row["user_id"], digest_text(shown, len(matching)),
+                [record.id for record in shown], bot_username
+            )))
+
+        result = await self.sender.send(jobs)
+        self.digests += result.sent
+        # Граница сдвигается и для пустых дайджестов (неподходящие заказы
+        # не проверяются повторно); неотправленный уйдет на следующем тике
+        failed = set(result.failed)
+        await db.mark_digests_sent([row for row in due if row["user_id"] not in failed], now)
+        for driver_id in result.blocked:
+            # Водитель заблокировал бота: подписка больше не нужна
+            await db.set_digest(driver_id, None)
+            self.unsubscribed += 1
+        if result.sent or result.failed or result.blocked:
+            logger.info(
+                "Digest sent to %s drivers (%s failed, %s blocked, %s due)",
+                result.sent, len(result.failed), len(result.blocked), len(due)
+            )
+        return result.sent
+
+    def _send_job(self, chat_id: int, text: str, order_ids: List[int], bot_username: str):
+        def send():
+            return self.bot.send_message(
+                chat_id, text, reply_markup=get_digest_keyboard(order_ids, bot_username)
+            )
+        return send
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ticks": self.ticks,
+            "digests": self.digests,
+            "empty": self.empty,
+            "failed": self.sender.failed,
+            "rate_limited": self.sender.retried,
+            "unsubscribed": self.unsubscribed,
+        }
+
+
+def create_digest(bot: Bot) -> Optional[DigestSender]:
+    """Рассылка дайджестов, если DIGEST_TICK > 0, иначе None."""
+    if DIGEST_TICK <= 0:
+        return None
+    return DigestSender(bot, BatchSender(DIGEST_CONCURRENCY, DIGEST_RATE))
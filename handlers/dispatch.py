@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.types import Message
+
+from config import (
+    DISPATCH_MODE, DISPATCH_MATCHER, DISPATCH_HUNGARIAN_MAX, DISPATCH_WEIGHTS,
+    DISPATCH_CARGO_CARS, DISPATCH_BATCH, DISPATCH_MAX_DRIVERS, DISPATCH_OFFER_TIMEOUT
+)
+from database import db
+from handlers.driver import send_order_to_driver, edit_order_message
+from services.dispatch import (
+    MATCHERS, SATURATION, Candidate, Job, allowed_cars, parse_weights, plan_assignments
+)
+from services.event_bus import bus, OrderReserved, OrderCancelled
+from services.logs import bind_log_context, log_context
+from services.tracing import tracer
+from states import OrderStatus
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+class _Offer:
+    """Заказ, зарезервированный за водителем до ответа на предложение."""
+    __slots__ = ("driver_id", "deadline", "message")
+
+    def __init__(self, driver_id: int, deadline: float, message: Optional[Message]):
+        self.driver_id = driver_id
+        self.deadline = deadline
+        self.message = message
+
+
+class AutoDispatcher:
+    """Пакетное распределение ожидающих заказов по доступным водителям.
+
+    Каждые DISPATCH_INTERVAL секунд берутся дольше всех ожидающие заказы
+    и водители на смене без активного заказа, пары оцениваются
+    (машина, ожидание заказа, простой водителя) и решаются одним
+    назначением. Заказ резервируется за выбранным водителем на
+    DISPATCH_OFFER_TIMEOUT секунд; не ответил или отказался — резерв
+    снимается, и этому водителю заказ больше не предлагается.
+    Канал и ссылка "Взять заказ" при этом работают как раньше.
+
+    Предложения хранятся только в памяти, поэтому истекшие резервы
+    (reserved_until) дополнительно ищутся в БД: так снимаются резервы,
+    сделанные до перезапуска, и брошенные резервы по ссылке.
+    """
+
+    def __init__(self, bot: Bot, matcher: str, weights: Dict[str, float]):
+        if matcher not in MATCHERS:
+            raise ValueError(f"Unknown dispatch matcher '{matcher}'")
+        self.bot = bot
+        self.matcher = matcher
+        self.weights = weights
+        self._offers: Dict[int, _Offer] = {}
+        # Пары (заказ, водитель), которые больше не предлагаются
+        self._declined: Set[Tuple[int, int]] = set()
+        self._running = True
+        self.ticks = 0
+        self.offered = 0
+        self.expired = 0
+        self.declined = 0
+        self.last_batch: Dict[str, Any] = {}
+
+    def stop(self) -> None:
+        """Не начинать новых пакетов (при остановке приложения)."""
+        self._running = False
+
+    async def run(self, interval: float) -> None:
+        """Фоновая задача: пакет каждые interval секунд."""
+        while self._running:
+            log_context.set({})
+            try:
+                with tracer.trace("dispatch.tick"):
+                    await self.tick()
+            except Exception as e:
+                logger.error("Dispatch batch failed: %s", e)
+            await asyncio.sleep(interval)
+
+    async def tick(self) -> int:
+        """Один пакет распределения; возвращает число новых предложений."""
+        now = time.time()
+        self.ticks += 1
+        await self._settle_offers(now)
+
+        orders = [
+            record for record in db.orders.oldest(OrderStatus.WAITING_DRIVER, DISPATCH_BATCH)
+            if record.id not in self._offers
+        ]
+        if not orders:
+            return 0
+        offered_drivers = {offer.driver_id for offer in self._offers.values()}
+        driver_ids = [
+            driver_id for driver_id in db.presence.available(DISPATCH_MAX_DRIVERS)
+            if driver_id not in offered_drivers
+        ]
+        rows = await db.get_dispatch_candidates(driver_ids)
+        if not rows:
+            return 0
+
+        jobs = [
+            Job(record.id, now - (record.posted_at or record.created_at),
+                allowed_cars(record.cargo, DISPATCH_CARGO_CARS))
+            for record in orders
+        ]
+        candidates = [
+            Candidate(
+                row["user_id"], row["car_model"],
+                now - row["last_reserved"] if row["last_reserved"] else SATURATION,
+                row["username"]
+            )
+            for row in rows
+        ]
+        started = time.perf_counter()
+        declined = frozenset(self._declined)
+        # Решение — чистые вычисления: в потоке, чтобы не задерживать апдейты
+        assignments = await asyncio.to_thread(
+            plan_assignments,
+            jobs, candidates, self.weights, self.matcher, DISPATCH_HUNGARIAN_MAX,
+            lambda order_id, driver_id: (order_id, driver_id) in declined
+        )
+        self.last_batch = {
+            "orders": len(jobs),
+            "drivers": len(candidates),
+            "pairs": len(assignments),
+            "solve_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+        offered = 0
+        for job, candidate, _ in assignments:
+            if await self._offer(job.order_id, candidate, now):
+                offered += 1
+        if offered:
+            logger.info("Dispatch offered %s orders (%s)", offered, self.last_batch)
+        return offered
+
+    async def _offer(self, order_id: int, candidate: Candidate, now: float) -> bool:
+        bind_log_context(order_id=order_id)
+        deadline = now + DISPATCH_OFFER_TIMEOUT
+        order = await db.reserve_order(order_id, candidate.driver_id, int(deadline))
+        if not order:
+            # Заказ успели взять по ссылке или водитель взял другой
+            return False
+        bus.publish(OrderReserved(order, candidate.username or "driver"))
+        self._offers[order_id] = _Offer(candidate.driver_id, deadline, None)
+        self.offered += 1
+        try:
+            self._offers[order_id].message = await send_order_to_driver(
+                self.bot, candidate.driver_id, order,
+                f"🚚 <b>Вам предложен заказ #{order_id}</b>",
+                f"{max(DISPATCH_OFFER_TIMEOUT // 60, 1)} мин."
+            )
+        except Exception as e:
+            # Водитель заблокировал бота: снимаем резерв, не дожидаясь срока
+            logger.error("Failed to send dispatch offer %s to %s: %s",
+                         order_id, candidate.driver_id, e)
+            self._offers[order_id].deadline = 0
+        return True
+
+    async def _settle_offers(self, now: float) -> None:
+        """Убрать отвеченные предложения и снять резерв с просроченных."""
+        for order_id, offer in list(self._offers.items()):
+            record = db.orders.get(order_id)
+            if record is None or record.status != OrderStatus.DRIVER_ASSIGNED \
+                    or record.driver_id != offer.driver_id:
+                # Водитель ответил: подтвердил (заказ ушел из книги) или отказался
+                if record is not None and record.status == OrderStatus.WAITING_DRIVER:
+                    self._declined.add((order_id, offer.driver_id))
+                    self.declined += 1
+                del self._offers[order_id]
+                continue
+            if offer.deadline > now:
+                continue
+
+            del self._offers[order_id]
+            self._declined.add((order_id, offer.driver_id))
+            order = await db.release_order(order_id, offer.driver_id)
+            if not order:
+                continue
+            self.expired += 1
+            bus.publish(OrderCancelled(order))
+            if offer.message is not None:
+                try:
+                    await edit_order_message(
+                        offer.message, f"⌛ Время на ответ по заказу #{order_id} истекло."
+                    )
+                except Exception as e:
+                    logger.error("Failed to close dispatch offer %s: %s", order_id, e)
+
+        # Резервы, о которых этот процесс не знает (предложения до
+        # перезапуска или остановки, взятые по ссылке), снимаются по сроку из БД
+        for row in await db.get_expired_reservations(int(now)):
+            if row["id"] in self._offers:
+                continue
+            order = await db.release_order(row["id"], row["driver_id"])
+            if order:
+                self.expired += 1
+                bus.publish(OrderCancelled(order))
+                logger.info("Released expired reservation of order %s by %s",
+                            row["id"], row["driver_id"])
+                await self._notify_expired(row["id"], row["driver_id"], row["driver_message_id"])
+
+        # Отказы по заказам, которых уже нет среди ожидающих, не нужны
+        self._declined = {
+            (order_id, driver_id) for order_id, driver_id in self._declined
+            if order_id in db.orders
+        }
+
+    async def _notify_expired(
+        self, order_id: int, driver_id: int, message_id: Optional[int]
+    ) -> None:
+        """Убрать кнопки резерва у водителя и сообщить, что время истекло."""
+        try:
+            if message_id is not None:
+                await self.bot.edit_message_reply_markup(
+                    chat_id=driver_id, message_id=message_id, reply_markup=None
+                )
+            await self.bot.send_message(
+                driver_id, f"⌛ Время на оформление заказа #{order_id} истекло, резерв снят."
+            )
+        except Exception as e:
+            logger.error("Failed to notify %s about expired order %s: %s", driver_id, order_id, e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "matcher": self.matcher,
+            "ticks": self.ticks,
+            "pending_offers": len(self._offers),
+            "offered": self.offered,
+            "declined": self.declined,
+            "expired": self.expired,
+            "last_batch": self.last_batch,
+        }
+
+
+def create_dispatcher(bot: Bot) -> Optional[AutoDispatcher]:
+    """Автораспределение при DISPATCH_MODE=auto, иначе None."""
+    if DISPATCH_MODE != "auto":
+        return None
+    return AutoDispatcher(bot, DISPATCH_MATCHER, parse_weights(DISPATCH_WEIGHTS))
@@ -1,254 +1,155 @@
 import time
 from datetime import datetime, timedelta
-from aiogram import Router, types, F
-from aiogram.filters import Command, StateFilter
-from aiogram.fsm.context import FSMContext
+from aiogram import Bot, Router, types
+from aiogram.filters import Command, CommandObject
 from aiogram.types import Message, CallbackQuery
 from database import db
-from config import ORDERS_CHANNEL_ID, CAR_MODELS
-from keyboards.order_buttons import get_order_taken_keyboard, get_order_keyboard, get_order_confirmed_keyboard
-from keyboards.driver_buttons import get_car_models_keyboard
+from config import CAR_MODELS, PRESENCE_TTL, DIGEST_TICK, DIGEST_DEFAULT_MINUTES, DIGEST_MIN_MINUTES
+from states import OrderStatus, ORDER_STATUS_TITLES
+from handlers.callbacks import callbacks
+from services.event_bus import bus, OrderReserved, OrderConfirmed, OrderCancelled
+from services.logs import bind_log_context
+from services.media import file_ids, fit_caption
+from keyboards.callbacks import OrderTakeCallback, OrderConfirmCallback, OrderCancelCallback
+from keyboards.order_buttons import get_order_taken_keyboard
 
 router = Router()
 
 
-@router.callback_query(F.data.startswith("car_"))
-async def set_car_model(callback: CallbackQuery):
-    """Handle car model selection."""
-    model_id = callback.data.split("_", 1)[1]
-    model_name = next((name for id, name in CAR_MODELS if id == model_id), "Неизвестно")
-    
-    await db.db.execute(
-        "UPDATE users SET car_model = ? WHERE user_id = ?",
-        (model_name, callback.from_user.id)
-    )
-    await db.db.commit()
-    
-    await callback.answer(f"Выбрана машина: {model_name}")
-    await callback.message.answer(
-        f"Отлично! Ваша машина: <b>{model_name}</b>\n"
-        "Теперь вы можете принимать заказы."
-    )
-
-
 async def start_taking_order(message: Message, order_id: int):
     """Handle the start of taking an order (triggered via deep link)."""
     driver_id = message.from_user.id
     driver_username = message.from_user.username or "driver"
-    bot = message.bot
+    bind_log_context(order_id=order_id)
+
+    # Fast path: the order book already knows the order is taken. Only when the
+    # book is exact (single process, loaded from the DB, not a snapshot);
+    # otherwise reserve_order below decides atomically
+    if db.orders.exact and db.orders.is_waiting(order_id) is False:
+        await message.answer("❌ Этот заказ уже взят другим водителем или отменен.")
+        return
     
     # Check if user is a driver
-    cur = await db.db.execute("SELECT role, active_order FROM users WHERE user_id = ?", (driver_id,))
-    user_data = await cur.fetchone()
+    user_data = await db.get_user(driver_id)
     
-    if not user_data or user_data[0] != "driver":
+    if not user_data or user_data["role"] != "driver":
         await message.answer("❌ Вы не зарегистрированы как водитель. Нажмите /start и выберите роль.")
         return
 
-    if user_data[1]:
+    if user_data["active_order"]:
         await message.answer("❌ У вас уже есть активный заказ. Сначала завершите его.")
         return
 
-    # Check order availability
-    cur = await db.db.execute(
-        "SELECT status, cargo, from_addr, to_addr, phone, tg_message_id FROM orders WHERE id = ?",
-        (order_id,)
-    )
-    order = await cur.fetchone()
+    # Reserve order (atomically: fails if the order is no longer waiting)
+    reserved_until = int((datetime.now() + timedelta(minutes=15)).timestamp())
+    order = await db.reserve_order(order_id, driver_id, reserved_until)
     
-    if not order or order[0] != "WAITING_DRIVER":
+    if not order:
         await message.answer("❌ Этот заказ уже взят другим водителем или отменен.")
         return
 
-    cargo, from_addr, to_addr, phone, tg_message_id = order[1], order[2], order[3], order[4], order[5]
+    # Channel message is updated by the event bus subscriber
+    bus.publish(OrderReserved(order, driver_username))
 
-    # Reserve order
-    reserved_until = int((datetime.now() + timedelta(minutes=15)).timestamp())
-    
-    await db.db.execute("""
-        UPDATE orders 
-        SET status = 'reserved',
-            driver_id = ?,
-            reserved_until = ?
-        WHERE id = ?
-    """, (driver_id, reserved_until, order_id))
-    
-    await db.db.execute(
-        "UPDATE users SET active_order = ? WHERE user_id = ?",
-        (order_id, driver_id)
+    await send_order_to_driver(
+        message.bot, message.chat.id, order,
+        f"✅ <b>Вы начали оформление заказа #{order_id}</b>", "15 минут"
     )
-    await db.db.commit()
-    
-    # Update Channel Message
-    try:
-        from config import ORDERS_CHANNEL_ID
-        channel_text = (
-            f"❗ <b>Заказ обрабатывается...</b>\n"
-            f"Водитель: @{driver_username}\n\n"
-            f"📦 <b>Груз:</b> {cargo}\n"
-            f"📍 <b>Откуда:</b> {from_addr}\n"
-            f"🏁 <b>Куда:</b> {to_addr}"
-        )
-        # Remove buttons from channel message while processing
-        await bot.edit_message_text(
-            chat_id=ORDERS_CHANNEL_ID,
-            message_id=tg_message_id,
-            text=channel_text,
-            reply_markup=None
-        )
-    except Exception as e:
-        print(f"Error updating channel message: {e}")
 
-    # Send Private Message to Driver
+
+async def send_order_to_driver(
+    bot: Bot, chat_id: int, order: dict, header: str, deadline: str
+) -> Message:
+    """Send a reserved order with confirm/cancel buttons to the driver.
+
+    The message id is saved with the order, so the buttons can be removed
+    when the reservation expires (see AutoDispatcher._settle_offers).
+    """
+    cargo = order["cargo"]
     text = (
-        f"✅ <b>Вы начали оформление заказа #{order_id}</b>\n\n"
+        f"{header}\n\n"
         f"📦 <b>Груз:</b> {cargo}\n"
-        f"📍 <b>Откуда:</b> {from_addr}\n"
-        f"🏁 <b>Куда:</b> {to_addr}\n"
-        f"📱 <b>Телефон заказчика:</b> {phone}\n\n"
-        f"⏳ <b>У вас есть 15 минут</b>, чтобы принять решение."
+        f"📍 <b>Откуда:</b> {order['from_addr']}\n"
+        f"🏁 <b>Куда:</b> {order['to_addr']}\n"
+        f"📱 <b>Телефон заказчика:</b> {order['phone']}\n\n"
+        f"⏳ <b>У вас есть {deadline}</b>, чтобы принять решение."
     )
-    await message.answer(text, reply_markup=get_order_taken_keyboard(order_id))
+    keyboard = get_order_taken_keyboard(order["id"])
+    if order["photo_file_id"]:
+        # Photo is sent by file_id: Telegram reuses the stored file
+        sent = await bot.send_photo(
+            chat_id,
+            file_ids.resolve(order["photo_unique_id"], order["photo_file_id"]),
+            caption=fit_caption(text, cargo),
+            reply_markup=keyboard
+        )
+        file_ids.remember_message(sent)
+    else:
+        sent = await bot.send_message(chat_id, text, reply_markup=keyboard)
+    await db.set_driver_message(order["id"], chat_id, sent.message_id)
+    return sent
+
+
+async def edit_order_message(message: Message, text: str) -> None:
+    """Edit the driver's order message (caption if it carries the cargo photo)."""
+    if message.photo:
+        await message.edit_caption(caption=text, reply_markup=None)
+    else:
+        await message.edit_text(text, reply_markup=None)
 
 
-@router.callback_query(F.data.startswith("order_take_"))
+@callbacks.handler(OrderTakeCallback, legacy="order_take")
 async def take_order_deprecated(callback: CallbackQuery):
     """Deprecated callback handler (kept for backward compatibility or accidental clicks on old buttons)."""
     await callback.answer("Пожалуйста, используйте новую кнопку (ссылку) в канале.", show_alert=True)
 
 
-@router.callback_query(F.data.startswith("order_confirm_"))
-async def confirm_order(callback: CallbackQuery):
+@callbacks.handler(OrderConfirmCallback, legacy="order_confirm")
+async def confirm_order(callback: CallbackQuery, callback_data: OrderConfirmCallback):
     """Handle order confirmation by driver from private chat."""
-    order_id = int(callback.data.split("_")[2])
+    order_id = callback_data.order_id
     driver_id = callback.from_user.id
+    bind_log_context(order_id=order_id)
     
-    # Verify order and fetch details including tg_message_id for channel update
-    cur = await db.db.execute("""
-        SELECT o.id, o.customer_id, o.phone, u.phone as driver_phone, u.username as driver_username, o.tg_message_id
-        FROM orders o
-        LEFT JOIN users u ON o.driver_id = u.user_id
-        WHERE o.id = ? AND o.driver_id = ?
-    """, (order_id, driver_id))
-    
-    order = await cur.fetchone()
+    # Update order status and clear driver's active order
+    order = await db.complete_order(order_id, driver_id)
     if not order:
         await callback.answer("Заказ не найден или истекло время.", show_alert=True)
         return
     
-    customer_id, customer_phone, driver_phone, driver_username, tg_message_id = order[1], order[2], order[3], order[4] or "driver", order[5]
-    
-    # Update order status
-    await db.db.execute(
-        "UPDATE orders SET status = 'completed' WHERE id = ?",
-        (order_id,)
-    )
-    
-    # Clear active order
-    await db.db.execute(
-        "UPDATE users SET active_order = NULL WHERE user_id = ?",
-        (driver_id,)
-    )
-    await db.db.commit()
-    
+    # Channel message and customer notification are handled by subscribers
+    bus.publish(OrderConfirmed(order))
+
     # Update Private Message
-    await callback.message.edit_text(
+    await edit_order_message(
+        callback.message,
         f"✅ <b>Заказ #{order_id} успешно подтверждён!</b>\n"
-        f"Телефон заказчика: {customer_phone}\n\n"
-        "Свяжитесь с заказчиком как можно скорее.",
-        reply_markup=None
+        f"Телефон заказчика: {order['phone']}\n\n"
+        "Свяжитесь с заказчиком как можно скорее."
     )
     
-    # Update Channel Message
-    try:
-        from config import ORDERS_CHANNEL_ID
-        channel_text = (
-            f"✅ <b>Заказ выполнен</b>\n"
-            f"Водитель: @{driver_username}\n"
-            f"Больше недоступен."
-        )
-        await callback.bot.edit_message_text(
-            chat_id=ORDERS_CHANNEL_ID,
-            message_id=tg_message_id,
-            text=channel_text,
-            reply_markup=get_order_confirmed_keyboard()
-        )
-    except Exception as e:
-        print(f"Failed to update channel: {e}")
-    
-    # Notify Customer
-    try:
-        await callback.bot.send_message(
-            customer_id,
-            f"✅ Ваш заказ #{order_id} подтверждён водителем!\n"
-            f"Телефон водителя: {driver_phone}"
-        )
-    except Exception as e:
-        print(f"Failed to notify customer: {e}")
-    
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("order_cancel_"))
-async def cancel_order(callback: CallbackQuery):
+@callbacks.handler(OrderCancelCallback, legacy="order_cancel")
+async def cancel_order(callback: CallbackQuery, callback_data: OrderCancelCallback):
     """Handle order cancellation by driver from private chat."""
-    order_id = int(callback.data.split("_")[2])
+    order_id = callback_data.order_id
     driver_id = callback.from_user.id
+    bind_log_context(order_id=order_id)
     
-    # Verify and fetch details to restore channel post
-    cur = await db.db.execute(
-        "SELECT id, customer_id, cargo, from_addr, to_addr, phone, tg_message_id FROM orders WHERE id = ? AND driver_id = ?",
-        (order_id, driver_id)
-    )
-    order = await cur.fetchone()
+    # Restore status to WAITING_DRIVER and clear driver's active order
+    order = await db.release_order(order_id, driver_id)
     
     if not order:
         await callback.answer("Заказ не найден.", show_alert=True)
         return
 
-    cargo, from_addr, to_addr, phone, tg_message_id = order[2], order[3], order[4], order[5], order[6]
-    
-    # Restore status to WAITING_DRIVER
-    await db.db.execute(
-        "UPDATE orders SET status = ?, driver_id = NULL, reserved_until = NULL WHERE id = ?",
-        ('WAITING_DRIVER', order_id)
-    )
-    
-    # Clear active order
-    await db.db.execute(
-        "UPDATE users SET active_order = NULL WHERE user_id = ?",
-        (driver_id,)
-    )
-    await db.db.commit()
-    
+    # Channel message is restored by the event bus subscriber
+    bus.publish(OrderCancelled(order))
+
     # Update Private Message
-    await callback.message.edit_text(
-        "❌ Вы отказались от выполнения заказа.",
-        reply_markup=None
-    )
-    
-    # Restore Channel Message
-    try:
-        from config import ORDERS_CHANNEL_ID
-        from main import bot_info
-        from keyboards.order_buttons import get_order_keyboard
-        
-        bot_username = bot_info.get("username", "truck_bot")
-        channel_text = (
-            f"🚚 <b>Новый заказ #{order_id}</b>\n\n"
-            f"📦 <b>Груз:</b> {cargo}\n"
-            f"📍 <b>Откуда:</b> {from_addr}\n"
-            f"🏁 <b>Куда:</b> {to_addr}\n"
-            f"📱 <b>Телефон:</b> {phone}"
-        )
-        await callback.bot.edit_message_text(
-            chat_id=ORDERS_CHANNEL_ID,
-            message_id=tg_message_id,
-            text=channel_text,
-            reply_markup=get_order_keyboard(order_id, bot_username)
-        )
-    except Exception as e:
-        print(f"Failed to restore channel message: {e}")
+    await edit_order_message(callback.message, "❌ Вы отказались от выполнения заказа.")
     
     await callback.answer()
 
@@ -256,26 +157,24 @@ async def cancel_order(callback: CallbackQuery):
 @router.message(Command("me"))
 async def cmd_me(message: types.Message):
     """Show driver's current status and active order."""
-    cur = await db.db.execute("""
-        SELECT u.role, u.car_model, u.active_order, 
-               o.cargo, o.from_addr, o.to_addr, o.status
-        FROM users u
-        LEFT JOIN orders o ON u.active_order = o.id
-        WHERE u.user_id = ?
-    """, (message.from_user.id,))
-    
-    row = await cur.fetchone()
+    row = await db.get_driver_profile(message.from_user.id)
     if not row:
         await message.answer("Вы не зарегистрированы. Нажмите /start и выберите роль.")
         return
     
-    role, car_model, active_order, cargo, from_addr, to_addr, status = row
+    role, car_model, active_order = row["role"], row["car_model"], row["active_order"]
+    cargo, from_addr, to_addr = row["cargo"], row["from_addr"], row["to_addr"]
+    status = row["status"]
+    car_name = dict(CAR_MODELS).get(car_model, car_model)
     
     text = (
         f"👤 <b>Ваш профиль</b>\n"
         f"Роль: {role}\n"
-        f"Машина: {car_model or 'не указана'}\n"
+        f"Машина: {car_name or 'не указана'}\n"
     )
+    if role == "driver":
+        on_shift = db.presence.is_on_shift(message.from_user.id)
+        text += f"Смена: {'на смене' if on_shift else 'не на смене'} (/shift)\n"
     
     if active_order:
         text += (
@@ -283,11 +182,64 @@ async def cmd_me(message: types.Message):
             f"Груз: {cargo}\n"
             f"Откуда: {from_addr}\n"
             f"Куда: {to_addr}\n"
-            f"Статус: {status}"
+            f"Статус: {ORDER_STATUS_TITLES.get(OrderStatus(status), status)}"
         )
     
     await message.answer(text)
 
 
+@router.message(Command("shift"))
+async def cmd_shift(message: types.Message):
+    """Toggle the driver's shift: only drivers on shift count as available."""
+    driver_id = message.from_user.id
+    if db.presence.is_on_shift(driver_id):
+        db.presence.end_shift(driver_id)
+        await message.answer("🔴 Смена закончена. Чтобы снова выйти на линию, нажмите /shift.")
+        return
+
+    if await db.get_user_role(driver_id) != "driver":
+        await message.answer("❌ Вы не зарегистрированы как водитель. Нажмите /start и выберите роль.")
+        return
+
+    db.presence.start_shift(driver_id)
+    await message.answer(
+        "🟢 Вы на смене.\n"
+        f"Пока вы пользуетесь ботом, вы считаетесь доступным; "
+        f"после {PRESENCE_TTL // 60} мин без активности — нет. Закончить смену: /shift."
+    )
+
+
+@router.message(Command("digest"))
+async def cmd_digest(message: types.Message, command: CommandObject):
+    """Subscribe to a periodic digest of new orders: /digest [minutes|off]."""
+    driver_id = message.from_user.id
+    args = (command.args or "").strip().lower()
+    if DIGEST_TICK <= 0:
+        await message.answer("Дайджест заказов сейчас недоступен.")
+        return
+
+    if args in ("off", "выкл", "0"):
+        await db.set_digest(driver_id, None)
+        await message.answer("🔕 Дайджест отключен. Новые заказы по-прежнему публикуются в канале.")
+        return
+
+    if args and not args.isdigit():
+        await message.answer("Использование: /digest [минуты] или /digest off")
+        return
+    minutes = max(int(args) if args else DIGEST_DEFAULT_MINUTES, DIGEST_MIN_MINUTES)
+
+    if await db.get_user_role(driver_id) != "driver":
+        await message.answer("❌ Вы не зарегистрированы как водитель. Нажмите /start и выберите роль.")
+        return
+
+    if not await db.set_digest(driver_id, minutes * 60):
+        await message.answer("❌ Не удалось сохранить настройку. Попробуйте позже.")
+        return
+    await message.answer(
+        f"📬 Дайджест включен: раз в {minutes} мин. одно сообщение с новыми заказами, "
+        f"подходящими вашей машине. Отключить: /digest off"
+    )
+
+
 def register_driver(dp):
     dp.include_router(router)
\ No newline at end of file
@@ -7,17 +7,13 @@ router = Router()
 
 @router.message(Command("orders"))
 async def cmd_orders(message: types.Message):
-    # simple list of open orders (for testing)
-    cur = await db.db.execute(
-        "SELECT id, cargo, from_addr, to_addr FROM orders "
-        "WHERE status = 'WAITING_DRIVER' ORDER BY created_at DESC LIMIT 20"
-    )
-    rows = await cur.fetchall()
-    if not rows:
+    # simple list of open orders (for testing), served from the in-memory order book
+    orders = db.orders.newest(limit=20)
+    if not orders:
         await message.answer("Открытых заказов нет.")
         return
     text = "Открытые заказы:\n\n" + "\n".join(
-        [f"ID:{r[0]} Cargo:{r[1]} From:{r[2]} To:{r[3]}" for r in rows]
+        [f"ID:{o.id} Cargo:{o.cargo} From:{o.from_addr} To:{o.to_addr}" for o in orders]
     )
     await message.answer(text)
 
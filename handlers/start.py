@@ -22,12 +22,7 @@ async def cmd_start(message: types.Message, command: CommandObject):
     user_id = message.from_user.id
 
     # проверяем, есть ли уже роль в БД
-    cur = await db.db.execute(
-        "SELECT role FROM users WHERE user_id = ?",
-        (user_id,),
-    )
-    row = await cur.fetchone()
-    role = row[0] if row else None
+    role = await db.get_user_role(user_id)
 
     if role:
         # роль уже есть — не просим выбирать заново
@@ -53,7 +48,10 @@ async def cmd_help(message: types.Message):
         "/role - Сменить роль (Заказчик/Водитель)\n"
         "/order - Создать новый заказ (для заказчиков)\n"
         "/orders - Список открытых заказов\n"
+        "/myorders - Мои заказы (для заказчиков)\n"
         "/me - Мой профиль и активный заказ\n"
+        "/shift - Начать или закончить смену (для водителей)\n"
+        "/digest - Дайджест новых заказов раз в N минут (для водителей)\n"
         "/id - Узнать ID чата\n"
         "\n"
         "Если бот не отвечает, попробуйте написать /start снова."
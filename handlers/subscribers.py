@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Set
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import (
+    ORDERS_CHANNEL_ID, NOTIFY_WORKERS, CHANNEL_WORKERS,
+    CHANNEL_POST_RETRIES, CHANNEL_REPOST_AFTER
+)
+from database import db
+from handlers.customer import post_order_to_channel, order_channel_text
+from keyboards.order_buttons import get_order_keyboard, get_order_confirmed_keyboard
+from services.media import fit_caption
+from services.event_bus import (
+    EventBus, OrderEvent, OrderCreated, OrderReserved, OrderConfirmed, OrderCancelled
+)
+from states import OrderStatus
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+class ChannelUpdater:
+    """Публикация и правка сообщений о заказах в каналах регионов.
+
+    События разбиты по воркерам по id заказа: правки одного сообщения
+    идут в порядке событий, а медленный канал не задерживает остальные.
+
+    Публикация нового заказа повторяется несколько раз; заказ, который
+    так и не попал в канал (ошибки Telegram, событие потеряно при
+    переполнении очереди или остановке), repost_missing снова публикует
+    событием OrderCreated — в той же партиции, что и остальные события
+    заказа.
+    """
+
+    def __init__(self, bot: Bot, bus: EventBus):
+        self.bot = bot
+        self.bus = bus
+        # Заказы, которые сейчас публикуются (их не трогает repost_missing)
+        self._posting: Set[int] = set()
+        self.reposted = 0
+
+    async def on_created(self, event: OrderCreated) -> None:
+        order = event.order
+        if order.get("repost"):
+            # Пока событие ждало в очереди, заказ могли взять или опубликовать
+            current = await db.get_order(order["id"])
+            if (not current or current["status"] != OrderStatus.WAITING_DRIVER
+                    or current["tg_message_id"] is not None):
+                logger.info("Order %s no longer needs a channel post", order["id"])
+                return
+        await self._post(order)
+
+    async def _post(self, order: Dict[str, Any]) -> None:
+        """Опубликовать заказ, повторяя при ошибках с растущей паузой."""
+        order_id = order["id"]
+        self._posting.add(order_id)
+        try:
+            attempt = 1
+            while True:
+                try:
+                    chat_id, message_id = await post_order_to_channel(self.bot, order, order_id)
+                    break
+                except Exception as e:
+                    if attempt >= CHANNEL_POST_RETRIES:
+                        raise
+                    delay = e.retry_after if isinstance(e, TelegramRetryAfter) else 2 ** attempt
+                attempt += 1
+                await asyncio.sleep(delay)
+            await db.set_order_message(order_id, chat_id, message_id)
+        finally:
+            self._posting.discard(order_id)
+
+    async def repost_missing(self) -> int:
+        """Снова опубликовать ожидающие заказы, у которых нет сообщения в канале.
+
+        Кандидаты берутся из книги в памяти; моложе CHANNEL_REPOST_AFTER
+        секунд пропускаются, чтобы не опередить подписчика шины. Каждый
+        заказ берется в БД атомарно (claim_order_repost), поэтому при
+        нескольких процессах его публикует один; канал выбирается по
+        сохраненному в заказе региону. Возвращает число заказов,
+        отправленных на публикацию.
+        """
+        cutoff = int(time.time() - CHANNEL_REPOST_AFTER)
+        candidates = [
+            record for record in db.orders.oldest(
+                OrderStatus.WAITING_DRIVER, db.orders.count(OrderStatus.WAITING_DRIVER)
+            )
+            if record.tg_message_id is None and record.id not in self._posting
+            and (record.posted_at or record.created_at) < cutoff
+        ]
+        queued = 0
+        for record in candidates:
+            order = await db.claim_order_repost(record.id, cutoff)
+            if order is None:
+                continue
+            order["repost"] = True
+            self.bus.publish(OrderCreated(order))
+            queued += 1
+        if queued:
+            logger.warning("Re-posting %s orders missing from the channel", queued)
+        self.reposted += queued
+        return queued
+
+    async def run_repost(self, interval: int) -> None:
+        """Фоновая задача: периодическая проверка неопубликованных заказов."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.repost_missing()
+            except Exception as e:
+                logger.error("Channel re-post sweep failed: %s", e)
+
+    async def _edit(self, order: Dict[str, Any], text: str, reply_markup=None) -> None:
+        chat_id, message_id = order.get("tg_chat_id"), order.get("tg_message_id")
+        if message_id is None:
+            # Заказ мог быть взят раньше, чем сохранился id сообщения
+            record = db.orders.get(order["id"])
+            if record:
+                chat_id, message_id = record.tg_chat_id, record.tg_message_id
+        if message_id is None:
+            logger.warning("Order %s has no channel message to edit", order['id'])
+            return
+        # Сообщение редактируется там, где опубликовано
+        chat_id = chat_id or ORDERS_CHANNEL_ID
+        if order.get("photo_file_id"):
+            # У поста с фото меняется подпись, само фото остается
+            await self.bot.edit_message_caption(
+                chat_id=chat_id,
+                message_id=message_id,
+                caption=fit_caption(text, order.get("cargo")),
+                reply_markup=reply_markup
+            )
+            return
+        await self.bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=message_id,
+            text=text,
+            reply_markup=reply_markup
+        )
+
+    async def on_reserved(self, event: OrderReserved) -> None:
+        order = event.order
+        # Кнопки убираются, пока водитель оформляет заказ
+        await self._edit(order, (
+            f"❗ <b>Заказ обрабатывается...</b>\n"
+            f"Водитель: @{event.driver_username}\n\n"
+            f"📦 <b>Груз:</b> {order['cargo']}\n"
+            f"📍 <b>Откуда:</b> {order['from_addr']}\n"
+            f"🏁 <b>Куда:</b> {order['to_addr']}"
+        ))
+
+    async def on_confirmed(self, event: OrderConfirmed) -> None:
+        await self._edit(event.order, (
+            f"✅ <b>Заказ выполнен</b>\n"
+            f"Водитель: @{event.order.get('driver_username') or 'driver'}\n"
+            f"Больше недоступен."
+        ), get_order_confirmed_keyboard())
+
+    async def on_cancelled(self, event: OrderCancelled) -> None:
+        from main import bot_info
+
+        bot_username = bot_info.get("username", "truck_bot")
+        await self._edit(
+            event.order,
+            order_channel_text(event.order, event.order_id),
+            get_order_keyboard(event.order_id, bot_username)
+        )
+
+
+class CustomerNotifier:
+    """Личные уведомления заказчикам."""
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+
+    async def on_confirmed(self, event: OrderConfirmed) -> None:
+        order = event.order
+        await self.bot.send_message(
+            order["customer_id"],
+            f"✅ Ваш заказ #{order['id']} подтверждён водителем!\n"
+            f"Телефон водителя: {order.get('driver_phone')}"
+        )
+
+
+class OrderMetrics:
+    """Счетчики событий и задержка от публикации до обработки."""
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+
+    async def on_event(self, event: OrderEvent) -> None:
+        name = type(event).__name__
+        self.counts[name] = self.counts.get(name, 0) + 1
+        lag = time.monotonic() - event.published_at
+        self.lag_total += lag
+        self.lag_max = max(self.lag_max, lag)
+
+    def snapshot(self) -> Dict[str, Any]:
+        total = sum(self.counts.values())
+        return {
+            "events": dict(self.counts),
+            "avg_lag_ms": round(self.lag_total / total * 1000, 2) if total else None,
+            "max_lag_ms": round(self.lag_max * 1000, 2),
+        }
+
+
+metrics = OrderMetrics()
+
+
+def register_subscribers(bus: EventBus, bot: Bot) -> ChannelUpdater:
+    """Подписать обработчики побочных действий на события заказов.
+
+    Возвращает ChannelUpdater (его проверку неопубликованных заказов
+    запускает приложение).
+    """
+    channel = ChannelUpdater(bot, bus)
+    bus.subscribe("channel", {
+        OrderCreated: channel.on_created,
+        OrderReserved: channel.on_reserved,
+        OrderConfirmed: channel.on_confirmed,
+        OrderCancelled: channel.on_cancelled,
+    }, workers=CHANNEL_WORKERS, partition_key=lambda event: event.order_id)
+
+    # Уведомления разным заказчикам независимы, порядок не важен
+    notifier = CustomerNotifier(bot)
+    bus.subscribe("customer_notifier", {
+        OrderConfirmed: notifier.on_confirmed,
+    }, workers=NOTIFY_WORKERS)
+
+    bus.subscribe("metrics", {
+        event_type: metrics.on_event
+        for event_type in (OrderCreated, OrderReserved, OrderConfirmed, OrderCancelled)
+    })
+    return channel
@@ -0,0 +1,69 @@
+"""Массовый импорт пользователей и исторических заказов.
+
+Примеры:
+    python import_data.py users fleet.csv
+    python import_data.py orders history.json --rebuild-indexes --chunk-size 2000
+    python import_data.py orders history.csv --dry-run
+
+Колонки users: user_id, role, phone, car_model, username, first_name, last_name.
+Колонки orders: customer_id, cargo, from_addr, to_addr, phone, status,
+driver_id, created_at, finished_at. Статус — только завершенный
+(COMPLETED, CANCELLED, EXPIRED).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+import config
+from database import create_database
+from services.importer import IMPORT_FORMATS, IMPORT_KINDS, run_import
+from services.logs import setup_logging
+
+
+async def run(args) -> int:
+    fmt = args.format or os.path.splitext(args.path)[1].lstrip(".").lower()
+    if fmt == "ndjson":
+        fmt = "json"
+    if fmt not in IMPORT_FORMATS:
+        print(f"Unknown format '{fmt}', use --format", file=sys.stderr)
+        return 2
+
+    with open(args.path, encoding="utf-8-sig") as f:
+        data = f.read()
+
+    db = create_database(config.DATABASE_URL)
+    await db.connect()
+    try:
+        report = await run_import(
+            db, args.kind, data, fmt,
+            chunk_size=args.chunk_size,
+            rebuild_indexes=args.rebuild_indexes,
+            dry_run=args.dry_run
+        )
+    finally:
+        await db.close()
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if report["errors"] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import of users and orders")
+    parser.add_argument("kind", choices=IMPORT_KINDS)
+    parser.add_argument("path", help="CSV, JSON array or NDJSON file")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="default: by file extension")
+    parser.add_argument("--chunk-size", type=int, default=config.IMPORT_CHUNK_SIZE)
+    parser.add_argument("--rebuild-indexes", action="store_true",
+                        help="drop secondary order indexes during the load")
+    parser.add_argument("--dry-run", action="store_true", help="only validate")
+    args = parser.parse_args()
+
+    setup_logging(config.LOG_LEVEL, config.LOG_FORMAT, config.LOG_TEXT_FORMAT,
+                  config.LOG_SAMPLE_BURST, config.LOG_SAMPLE_EVERY)
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,19 @@
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 from config import CAR_MODELS
+from keyboards.callbacks import (
+    RoleCallback,
+    CarCallback,
+    OrderConfirmCallback,
+    OrderCancelCallback
+)
 
 
 def role_keyboard():
     """Create keyboard for role selection."""
     kb = InlineKeyboardBuilder()
-    kb.button(text="👤 Заказчик", callback_data="role_customer")
-    kb.button(text="🚚 Водитель", callback_data="role_driver")
+    kb.button(text="👤 Заказчик", callback_data=RoleCallback(role="customer"))
+    kb.button(text="🚚 Водитель", callback_data=RoleCallback(role="driver"))
     kb.adjust(2)
     return kb.as_markup()
 
@@ -28,7 +34,7 @@ def car_models_keyboard():
     """Create inline keyboard for car model selection."""
     kb = InlineKeyboardBuilder()
     for model_id, model_name in CAR_MODELS:
-        kb.button(text=model_name, callback_data=f"car_{model_id}")
+        kb.button(text=model_name, callback_data=CarCallback(model=model_id))
     kb.adjust(2)
     return kb.as_markup()
 
@@ -36,8 +42,8 @@ def car_models_keyboard():
 def confirm_order_keyboard(order_id: int):
     """Create inline keyboard for order confirmation."""
     kb = InlineKeyboardBuilder()
-    kb.button(text="✅ Подтвердить заказ", callback_data=f"order_confirm_{order_id}")
-    kb.button(text="❌ Отменить заказ", callback_data=f"order_cancel_{order_id}")
+    kb.button(text="✅ Подтвердить заказ", callback_data=OrderConfirmCallback(order_id=order_id))
+    kb.button(text="❌ Отменить заказ", callback_data=OrderCancelCallback(order_id=order_id))
     kb.adjust(1)
     return kb.as_markup()
 
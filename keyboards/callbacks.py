@@ -0,0 +1,40 @@
+from aiogram.filters.callback_data import CallbackData
+
+# Фабрики callback_data. Префиксы короткие и уникальные: по ним
+# handlers.callbacks находит обработчик одним обращением к словарю.
+
+
+class RoleCallback(CallbackData, prefix="r"):
+    """Выбор роли пользователя."""
+    role: str
+
+
+class CarCallback(CallbackData, prefix="c"):
+    """Выбор модели автомобиля."""
+    model: str
+
+
+class OrderTakeCallback(CallbackData, prefix="ot"):
+    """Старая кнопка "Взять заказ" (сейчас используется deep link)."""
+    order_id: int
+
+
+class OrderConfirmCallback(CallbackData, prefix="oc"):
+    """Подтверждение заказа водителем."""
+    order_id: int
+
+
+class OrderCancelCallback(CallbackData, prefix="ox"):
+    """Отказ водителя от заказа."""
+    order_id: int
+
+
+class OrderStatusCallback(CallbackData, prefix="os"):
+    """Проверка статуса заказа."""
+    order_id: int
+
+
+class MyOrdersCallback(CallbackData, prefix="mo"):
+    """Страница истории заказов клиента (курсор — последний показанный заказ)."""
+    before_ts: int
+    before_id: int
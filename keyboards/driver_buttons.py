@@ -1,6 +1,7 @@
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardMarkup
 from config import CAR_MODELS
+from keyboards.callbacks import CarCallback
 
 def get_car_models_keyboard() -> InlineKeyboardMarkup:
     """Create inline keyboard for car model selection."""
@@ -9,7 +10,7 @@ def get_car_models_keyboard() -> InlineKeyboardMarkup:
     for model_id, model_name in CAR_MODELS:
         builder.button(
             text=model_name,
-            callback_data=f"car_{model_id}"
+            callback_data=CarCallback(model=model_id)
         )
     
     builder.adjust(2)  # 2 buttons per row
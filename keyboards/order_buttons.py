@@ -1,26 +1,45 @@
+from typing import Any, Dict, List, Optional, Tuple
+
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from keyboards.callbacks import (
+    OrderConfirmCallback,
+    OrderCancelCallback,
+    OrderStatusCallback,
+    MyOrdersCallback
+)
 
-def get_order_keyboard(order_id: int, bot_username: str) -> InlineKeyboardMarkup:
+def get_order_keyboard(
+    order_id: int, bot_username: str, text: str = "Взять заказ"
+) -> InlineKeyboardMarkup:
     """Create inline keyboard for a new order."""
     builder = InlineKeyboardBuilder()
     builder.button(
-        text="Взять заказ",
+        text=text,
         url=f"https://t.me/{bot_username}?start=take_{order_id}"
     )
     return builder.as_markup()
 
+def get_digest_keyboard(order_ids: List[int], bot_username: str) -> InlineKeyboardMarkup:
+    """Create inline keyboard for a driver digest: one deep-link button per order."""
+    builder = InlineKeyboardBuilder()
+    for order_id in order_ids:
+        builder.attach(InlineKeyboardBuilder.from_markup(
+            get_order_keyboard(order_id, bot_username, f"Взять заказ #{order_id}")
+        ))
+    return builder.as_markup()
+
 def get_order_taken_keyboard(order_id: int) -> InlineKeyboardMarkup:
     """Create inline keyboard for a taken order (confirm/cancel)."""
     builder = InlineKeyboardBuilder()
     builder.row(
         InlineKeyboardButton(
             text="✅ Подтвердить",
-            callback_data=f"order_confirm_{order_id}"
+            callback_data=OrderConfirmCallback(order_id=order_id).pack()
         ),
         InlineKeyboardButton(
             text="❌ Отменить",
-            callback_data=f"order_cancel_{order_id}"
+            callback_data=OrderCancelCallback(order_id=order_id).pack()
         )
     )
     return builder.as_markup()
@@ -30,3 +49,32 @@ def get_order_confirmed_keyboard() -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     return builder.as_markup()
 
+def get_my_orders_keyboard(
+    orders: List[Dict[str, Any]],
+    next_cursor: Optional[Tuple[int, int]],
+    first_page: bool
+) -> InlineKeyboardMarkup:
+    """Create inline keyboard for a page of customer's orders (status buttons + paging)."""
+    builder = InlineKeyboardBuilder()
+    for order in orders:
+        builder.row(InlineKeyboardButton(
+            text=f"🔎 Статус заказа #{order['id']}",
+            callback_data=OrderStatusCallback(order_id=order["id"]).pack()
+        ))
+
+    paging = []
+    if not first_page:
+        paging.append(InlineKeyboardButton(
+            text="« К новым",
+            callback_data=MyOrdersCallback(before_ts=0, before_id=0).pack()
+        ))
+    if next_cursor:
+        paging.append(InlineKeyboardButton(
+            text="Старше »",
+            callback_data=MyOrdersCallback(
+                before_ts=next_cursor[0], before_id=next_cursor[1]
+            ).pack()
+        ))
+    if paging:
+        builder.row(*paging)
+    return builder.as_markup()
@@ -1,24 +1,63 @@
+import time
+
+_import_started = time.perf_counter()
+
 import asyncio
-import json
-from fastapi import FastAPI, Request
+import hashlib
+import hmac
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.types import Update
-from config import BOT_TOKEN, WEBHOOK_URL
+from pydantic import ValidationError
+from config import (
+    BOT_TOKEN, WEBHOOK_URL, WEBHOOK_SECRET, MAX_WEBHOOK_BODY,
+    DEDUP_WINDOW, DEDUP_PERSIST, ADMIN_API_TOKEN, STATS_DAYS, EXPORT_BATCH_SIZE,
+    IMPORT_CHUNK_SIZE, IMPORT_MAX_BODY, API_CACHE_SIZE, API_CACHE_TTL, API_LIST_LIMIT,
+    EVENTS_KEEPALIVE, SHUTDOWN_TIMEOUT, SNAPSHOT_PATH, SNAPSHOT_MAX_AGE,
+    DISPATCH_INTERVAL, DIGEST_TICK, CHANNEL_REPOST_INTERVAL,
+    LOG_LEVEL, LOG_FORMAT, LOG_TEXT_FORMAT, LOG_SAMPLE_BURST, LOG_SAMPLE_EVERY, TRACE_FILE
+)
 from database import db
+from handlers import register_handlers
+from services.dedup import UpdateDeduplicator
+from services.stats import collect_stats
+from services.export import EXPORT_FORMATS, export_stream, serialize_order
+from services.response_cache import ResponseCache, etag_matches
+from services.order_events import sse_stream
+from services.event_bus import bus
+from services.lifecycle import Lifecycle, save_snapshot, load_snapshot
+from services.logs import setup_logging, log_context
+from services.tracing import tracer
+from services.importer import IMPORT_FORMATS, IMPORT_KINDS, run_import
+from states import OrderStatus
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
-# handlers registration
-from handlers.start import register_start
-from handlers.auth import register_auth
-from handlers.customer import register_customer
-from handlers.driver import register_driver
-from handlers.orders import register_orders
+# Записи уходят в очередь, в поток вывода их пишет отдельный поток
+log_sampling = setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_TEXT_FORMAT,
+                             LOG_SAMPLE_BURST, LOG_SAMPLE_EVERY)
+
+# Длительность фаз старта в миллисекундах (отдается в /debug)
+startup_timings: Dict[str, float] = {}
+
+
+@contextmanager
+def timed_phase(name: str):
+    """Замерить длительность фазы старта."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = round((time.perf_counter() - started) * 1000, 1)
 
-logging.basicConfig(level=logging.INFO)
 
 bot = Bot(
     token=BOT_TOKEN,
@@ -28,38 +67,188 @@ dp = Dispatcher()
 
 app = FastAPI()
 
+# Кэш ответов /api: сбрасывается при любом изменении заказа в книге
+api_cache = ResponseCache(API_CACHE_SIZE, API_CACHE_TTL)
+db.orders.subscribe(api_cache.invalidate_order)
+
 # include handlers
-register_start(dp)
-register_auth(dp)
-register_customer(dp)
-register_driver(dp)
-register_orders(dp)
+with timed_phase("handlers"):
+    register_handlers(dp)
+    from middlewares.throttling import register_throttling, limiter as throttle_limiter
+    register_throttling(dp)
+    from middlewares.presence import register_presence
+    register_presence(dp)
+    from middlewares.tracing import register_tracing
+    register_tracing(dp, bot)
+    from handlers.subscribers import register_subscribers, metrics as event_metrics
+    channel_updater = register_subscribers(bus, bot)
+    from handlers.dispatch import create_dispatcher
+    auto_dispatcher = create_dispatcher(bot)
+    from handlers.digest import create_digest
+    digest_sender = create_digest(bot)
+
+startup_timings["imports"] = round((time.perf_counter() - _import_started) * 1000, 1)
 
 
 # Global variable to store bot information
 bot_info = {}
 
-@app.on_event("startup")
-async def startup():
-    await db.connect()
-    
-    # Get bot info
+# Окно недавних update_id: повторные доставки Telegram не обрабатываются дважды
+deduplicator = UpdateDeduplicator(DEDUP_WINDOW)
+
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора
+_background_tasks = set()
+
+# Остановка: прием апдейтов, учет апдейтов в обработке, срок
+lifecycle = Lifecycle()
+# SSE-потоки бесконечны: закрываем их сразу, иначе uvicorn будет их ждать
+lifecycle.on_drain(db.events.close)
+if auto_dispatcher:
+    # Новых предложений при остановке не делаем
+    lifecycle.on_drain(auto_dispatcher.stop)
+if digest_sender:
+    lifecycle.on_drain(digest_sender.stop)
+
+
+def spawn_background(coro) -> None:
+    """Запустить фоновую задачу и держать на нее ссылку до завершения."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def _secret_fingerprint() -> str:
+    """Отпечаток секрета вебхука: в БД храним хэш, а не сам секрет."""
+    return hashlib.sha256((WEBHOOK_SECRET or "").encode()).hexdigest()
+
+
+async def refresh_bot_info():
+    """Запросить данные бота у Telegram и обновить кэш в БД."""
     me = await bot.get_me()
     bot_info["username"] = me.username
-    logger.info(f"Bot initialized: @{me.username}")
-    
+    await db.set_meta("bot_username", me.username)
+    logger.info("Bot initialized: @%s", me.username)
+
+
+async def ensure_webhook(force: bool = False) -> bool:
+    """Установить вебхук, если сохраненные URL или секрет отличаются от текущих."""
+    fingerprint = _secret_fingerprint()
+    if not force:
+        stored_url = await db.get_meta("webhook_url")
+        stored_secret = await db.get_meta("webhook_secret")
+        if stored_url == WEBHOOK_URL and stored_secret == fingerprint:
+            logger.info("Webhook is up to date, skipping set_webhook")
+            return False
+
+    await bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+    await db.set_meta("webhook_url", WEBHOOK_URL)
+    await db.set_meta("webhook_secret", fingerprint)
+    logger.info("Webhook set to %s", WEBHOOK_URL)
+    return True
+
+
+async def verify_remote_state():
+    """Фоновая сверка кэша с Telegram: данные бота и фактический URL вебхука."""
+    try:
+        await refresh_bot_info()
+    except Exception as e:
+        logger.error("Failed to refresh bot info: %s", e)
+
+    if not WEBHOOK_URL:
+        return
+    try:
+        info = await bot.get_webhook_info()
+        if info.url != WEBHOOK_URL:
+            logger.warning("Webhook URL drifted ('%s'), setting it again", info.url)
+            await ensure_webhook(force=True)
+    except Exception as e:
+        logger.error("Failed to verify webhook: %s", e)
+
+
+@app.on_event("startup")
+async def startup():
+    started = time.perf_counter()
+
+    with timed_phase("db"):
+        await db.connect()
+        db.start_maintenance()
+        bus.start()
+
+    # Кэши из снимка прошлой остановки; сверка с БД — в фоне
+    with timed_phase("warm_caches"):
+        snapshot = load_snapshot(SNAPSHOT_PATH, SNAPSHOT_MAX_AGE) if SNAPSHOT_PATH else None
+        if snapshot:
+            db.orders.load(snapshot["orders"])
+            deduplicator.load(snapshot["seen_updates"])
+            spawn_background(db.reconcile_order_book())
+            logger.info("Warmed caches from snapshot: %s open orders", len(db.orders))
+        else:
+            await db.load_order_book()
+            if DEDUP_PERSIST:
+                deduplicator.load(await db.load_seen_updates(DEDUP_WINDOW))
+        # Присутствие сохраняется в БД при остановке, снимок для него не нужен
+        await db.load_presence()
+
+    # Данные бота берем из кэша, обновляем в фоне
+    with timed_phase("bot_info"):
+        cached_username = await db.get_meta("bot_username")
+        if cached_username:
+            bot_info["username"] = cached_username
+        else:
+            await refresh_bot_info()
+
     # set webhook on startup if WEBHOOK_URL provided
-    logger.info(f"Current WEBHOOK_URL value: '{WEBHOOK_URL}'")
-    if WEBHOOK_URL:
+    with timed_phase("webhook"):
+        if WEBHOOK_URL:
+            try:
+                await ensure_webhook()
+            except Exception as e:
+                logger.error("Failed to set webhook: %s", e)
+        else:
+            logger.warning("WEBHOOK_URL is missing or empty!")
+
+    spawn_background(verify_remote_state())
+    # Заказы, не попавшие в канал (в том числе до перезапуска)
+    spawn_background(channel_updater.run_repost(CHANNEL_REPOST_INTERVAL))
+    if auto_dispatcher:
+        spawn_background(auto_dispatcher.run(DISPATCH_INTERVAL))
+    if digest_sender:
+        spawn_background(digest_sender.run(DIGEST_TICK))
+    lifecycle.install_signal_handlers()
+
+    startup_timings["startup"] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info("Startup done, phases (ms): %s", startup_timings)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Доработать начатое в пределах SHUTDOWN_TIMEOUT и сохранить кэши."""
+    lifecycle.begin_drain()
+    lifecycle.start_deadline(SHUTDOWN_TIMEOUT)
+
+    await lifecycle.wait_idle()
+    # Побочные действия уже зафиксированных заказов стоит доделать
+    await bus.stop(lifecycle.remaining())
+
+    tasks = list(_background_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    if SNAPSHOT_PATH:
         try:
-            await bot.set_webhook(WEBHOOK_URL)
-            info = await bot.get_webhook_info()
-            logger.info(f"Webhook set successfully. Info: {info}")
-        except Exception as e:
-            logger.error(f"Failed to set webhook: {e}")
-    else:
-        logger.warning("WEBHOOK_URL is missing or empty!")
-    logging.info("Startup done")
+            save_snapshot(SNAPSHOT_PATH, {
+                "orders": db.orders.snapshot(),
+                "seen_updates": deduplicator.recent(),
+            })
+            logger.info("Saved cache snapshot to %s", SNAPSHOT_PATH)
+        except OSError as e:
+            logger.error("Failed to save cache snapshot: %s", e)
+
+    await db.close()
+    await bot.session.close()
+    tracer.close()
+    logger.info("Shutdown complete")
 
 
 @app.get("/")
@@ -82,25 +271,331 @@ async def debug_info():
                 "pending_update_count": info.pending_update_count,
                 "last_error_date": info.last_error_date,
                 "last_error_message": info.last_error_message,
-            }
+            },
+            "startup_timings": startup_timings,
+            "updates_in_flight": lifecycle.inflight,
+            "logs_sampled_out": log_sampling.dropped,
+            "tracing": {
+                "sample_rate": tracer.sample_rate,
+                "traces_sampled": tracer.sampled,
+                "spans_buffered": len(tracer.ring),
+                "file": TRACE_FILE or None,
+            },
+            "throttle": {
+                "buckets": len(throttle_limiter),
+                "suppressed": throttle_limiter.suppressed,
+            },
+            "duplicate_updates": deduplicator.duplicates,
+            "channel_reposted": channel_updater.reposted,
+            "order_book": {"open": len(db.orders), "drift": db.orders.drift},
+            "presence": {
+                "on_shift": len(db.presence),
+                "available": db.presence.count_available(),
+                "heartbeats": db.presence.heartbeats,
+            },
+            "dispatch": auto_dispatcher.stats() if auto_dispatcher else None,
+            "digest": digest_sender.stats() if digest_sender else None,
+            "api_cache": {"size": len(api_cache), "hits": api_cache.hits,
+                          "misses": api_cache.misses, "stale": api_cache.stale},
+            "event_bus": {"subscribers": bus.stats(), "metrics": event_metrics.snapshot()},
+            "order_events": {
+                "subscribers": len(db.events),
+                "published": db.events.published,
+                "dropped": db.events.dropped,
+            },
         }
     except Exception as e:
         return {"error": str(e)}
 
 
+def secret_matches(given: str, expected: str) -> bool:
+    """Сравнить секрет за постоянное время.
+
+    Сравниваются байты: compare_digest на строках с не-ASCII символами
+    (заголовки Starlette декодирует как latin-1) бросает TypeError.
+    """
+    return hmac.compare_digest(given.encode(), expected.encode())
+
+
+def is_admin_request(request: Request) -> bool:
+    """Проверить заголовок Authorization: Bearer <ADMIN_API_TOKEN>."""
+    if not ADMIN_API_TOKEN:
+        return False
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    return scheme.lower() == "bearer" and secret_matches(token, ADMIN_API_TOKEN)
+
+
+@app.get("/debug/traces")
+async def debug_traces(request: Request, trace_id: Optional[str] = None, limit: int = 20):
+    """Последние трассы из буфера в памяти (только для администраторов).
+
+    Пример: /debug/traces?limit=5 или /debug/traces?trace_id=<id>
+    """
+    if not is_admin_request(request):
+        return Response(status_code=403)
+    return {"traces": tracer.ring.traces(trace_id, max(1, min(limit, 200)))}
+
+
+@app.get("/debug/throttle")
+async def debug_throttle(request: Request, limit: int = 10):
+    """Пользователи с наибольшим числом подавленных апдейтов (только для администраторов)."""
+    if not is_admin_request(request):
+        return Response(status_code=403)
+    return {
+        "buckets": len(throttle_limiter),
+        "suppressed": throttle_limiter.suppressed,
+        "top_offenders": throttle_limiter.top_offenders(max(1, min(limit, 100))),
+    }
+
+
+@app.get("/stats")
+async def stats(request: Request, days: int = STATS_DAYS):
+    """Показатели заказов из агрегатов (только для администраторов)."""
+    if not is_admin_request(request):
+        return Response(status_code=403)
+    return await collect_stats(db, max(1, min(days, 90)))
+
+
+def parse_export_date(value: Optional[str]) -> Optional[int]:
+    """Дата или дата-время ISO 8601 (без зоны — UTC) в секунды Unix."""
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+
+@app.get("/export/orders")
+async def export_orders(
+    request: Request,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    status: Optional[str] = None,
+    format: str = "csv",
+    gzip: bool = False
+):
+    """Потоковая выгрузка заказов (только для администраторов).
+
+    Пример: /export/orders?since=2026-09-01&until=2026-10-01&status=COMPLETED&format=csv&gzip=1
+    """
+    if not is_admin_request(request):
+        return Response(status_code=403)
+    if format not in EXPORT_FORMATS:
+        return Response(f"format must be one of: {', '.join(EXPORT_FORMATS)}", status_code=400)
+    try:
+        since_ts, until_ts = parse_export_date(since), parse_export_date(until)
+        statuses = (
+            [OrderStatus[name.strip().upper()] for name in status.split(",")] if status else None
+        )
+    except (ValueError, KeyError) as e:
+        return Response(f"invalid filter: {e}", status_code=400)
+
+    batches = db.iter_orders(since_ts, until_ts, statuses, EXPORT_BATCH_SIZE)
+    filename = f"orders.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_stream(batches, format, gzip),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@app.post("/import/{kind}")
+async def import_data(
+    kind: str,
+    request: Request,
+    format: str = "csv",
+    rebuild_indexes: bool = False,
+    dry_run: bool = False
+):
+    """Массовый импорт пользователей или заказов (только для администраторов).
+
+    Тело — CSV с заголовком, JSON-массив или NDJSON (см. import_data.py).
+    """
+    if not is_admin_request(request):
+        return Response(status_code=403)
+    if kind not in IMPORT_KINDS or format not in IMPORT_FORMATS:
+        return Response(status_code=404)
+    body = await read_body_limited(request, IMPORT_MAX_BODY)
+    if body is None:
+        return Response(status_code=413)
+    try:
+        data = body.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return Response("body must be UTF-8", status_code=400)
+
+    report = await run_import(
+        db, kind, data, format,
+        chunk_size=IMPORT_CHUNK_SIZE,
+        rebuild_indexes=rebuild_indexes,
+        dry_run=dry_run
+    )
+    return JSONResponse(report, status_code=422 if report["errors"] else 200)
+
+
+def _record_json(record) -> dict:
+    data = record.as_dict()
+    data["status"] = record.status.name
+    return data
+
+
+async def cached_json(request: Request, key: str, build) -> Response:
+    """Ответ JSON из api_cache с ETag; 304, если у клиента та же версия.
+
+    build — корутина, возвращающая данные ответа или None (404).
+    """
+    cached = api_cache.get(key)
+    if cached is None:
+        # Заказ может измениться, пока собирается ответ: тогда put его не сохранит
+        generation = api_cache.generation
+        data = await build()
+        if data is None:
+            return Response(status_code=404)
+        body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        etag = api_cache.put(key, body, generation)
+    else:
+        etag, body = cached
+
+    # no-cache: клиент хранит ответ, но каждый раз сверяет ETag
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+@app.get("/api/orders")
+async def api_open_orders(request: Request, limit: int = 50):
+    """Незавершенные заказы, новые первыми (только для администраторов)."""
+    if not is_admin_request(request):
+        return Response(status_code=403)
+    limit = max(1, min(limit, API_LIST_LIMIT))
+
+    async def build():
+        return {"orders": [_record_json(record) for record in db.orders.newest_open(limit)]}
+
+    return await cached_json(request, f"open:{limit}", build)
+
+
+@app.get("/api/orders/{order_id}")
+async def api_order(request: Request, order_id: int):
+    """Заказ в форме Database.get_order (только для администраторов)."""
+    if not is_admin_request(request):
+        return Response(status_code=403)
+
+    async def build():
+        order = await db.get_order(order_id)
+        return serialize_order(order) if order else None
+
+    return await cached_json(request, f"order:{order_id}", build)
+
+
+@app.get("/api/drivers/{driver_id}/orders")
+async def api_driver_orders(request: Request, driver_id: int):
+    """Незавершенные заказы водителя (только для администраторов)."""
+    if not is_admin_request(request):
+        return Response(status_code=403)
+
+    async def build():
+        return {"orders": [_record_json(record) for record in db.orders.for_driver(driver_id)]}
+
+    return await cached_json(request, f"driver:{driver_id}", build)
+
+
+@app.get("/events/orders")
+async def order_events(request: Request, token: Optional[str] = None):
+    """Поток событий заказов (Server-Sent Events, только для администраторов).
+
+    EventSource в браузере не умеет передавать заголовки, поэтому токен
+    можно передать параметром ?token=. При переподключении браузер сам
+    присылает Last-Event-ID, и пропущенные события досылаются.
+    """
+    by_query = bool(ADMIN_API_TOKEN and token and secret_matches(token, ADMIN_API_TOKEN))
+    if not (by_query or is_admin_request(request)):
+        return Response(status_code=403)
+    last_event_id = (
+        request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+    )
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return Response("invalid Last-Event-ID", status_code=400)
+    return StreamingResponse(
+        sse_stream(db.events, last_event_id, EVENTS_KEEPALIVE),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: nginx не должен копить события в буфере
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def update_user_id(update: Update) -> Optional[int]:
+    """id автора апдейта, если у события он есть."""
+    try:
+        user = getattr(update.event, "from_user", None)
+    except Exception:
+        # Тип апдейта, неизвестный aiogram
+        return None
+    return user.id if user else None
+
+
+async def read_body_limited(request: Request, limit: int) -> Optional[bytes]:
+    """Прочитать тело запроса, прервав чтение при превышении лимита."""
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
 @app.post("/")
 async def telegram_webhook(request: Request):
+    # При остановке не берем новых апдейтов: Telegram доставит их повторно
+    if not lifecycle.accepting:
+        return Response(status_code=503)
+
+    # Секрет проверяем до чтения тела: чужие запросы не стоят нам парсинга
+    if WEBHOOK_SECRET:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not secret_matches(token, WEBHOOK_SECRET):
+            return Response(status_code=403)
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_WEBHOOK_BODY:
+        return Response(status_code=413)
+
+    body = await read_body_limited(request, MAX_WEBHOOK_BODY)
+    if body is None:
+        return Response(status_code=413)
+
+    # Байты разбираются сразу в модель за один проход. Невалидное тело
+    # (health‑check или мусор) — просто отвечаем 200, чтобы не засорять логи 500‑ками.
     try:
-        update_json = await request.json()
-    except json.JSONDecodeError:
-        # Пришёл невалидный JSON (health‑check или мусор) — просто отвечаем 200,
-        # чтобы не засорять логи 500‑ками.
+        update = Update.model_validate_json(body, context={"bot": bot})
+    except ValidationError:
         return {"ok": True}
 
-    # На всякий случай отсечём странные тела без update_id
-    if not isinstance(update_json, dict) or "update_id" not in update_json:
+    # Поля update_id и user_id попадут во все записи лога этого апдейта
+    log_context.set({"update_id": update.update_id, "user_id": update_user_id(update)})
+
+    # Повторная доставка (Telegram не дождался ответа) — уже обработано
+    if deduplicator.check_and_add(update.update_id):
+        logger.info("Skipping duplicate update %s", update.update_id)
         return {"ok": True}
+    # Трасса апдейта: spans обработчика, запросов к БД и к Bot API (при TRACE_SAMPLE_RATE > 0)
+    with tracer.trace("update", update_id=update.update_id, user_id=log_context.get()["user_id"]):
+        if DEDUP_PERSIST:
+            await db.remember_update(update.update_id, DEDUP_WINDOW)
 
-    update = Update(**update_json)
-    await dp.feed_update(bot, update)
-    return {"ok": True}
\ No newline at end of file
+        try:
+            with lifecycle.update():
+                await dp.feed_update(bot, update)
+        except Exception:
+            # Апдейт не обработан: Telegram доставит его повторно, и повтор
+            # не должен быть отброшен как дубликат
+            deduplicator.discard(update.update_id)
+            if DEDUP_PERSIST:
+                await db.forget_update(update.update_id)
+            raise
+    return {"ok": True}
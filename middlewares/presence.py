@@ -0,0 +1,30 @@
+from typing import Any, Awaitable, Callable, Dict, Union
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message
+
+from database import db
+
+
+class PresenceMiddleware(BaseMiddleware):
+    """Любой апдейт водителя на смене продлевает его доступность.
+
+    Проверка — одно обращение к словарю в памяти, без запросов к БД.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Union[Message, CallbackQuery],
+        data: Dict[str, Any]
+    ) -> Any:
+        if event.from_user is not None:
+            db.presence.heartbeat(event.from_user.id)
+        return await handler(event, data)
+
+
+def register_presence(dp) -> None:
+    """Подключить учет активности к сообщениям и callback-запросам."""
+    middleware = PresenceMiddleware()
+    dp.message.outer_middleware(middleware)
+    dp.callback_query.outer_middleware(middleware)
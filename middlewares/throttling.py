@@ -0,0 +1,76 @@
+import logging
+from typing import Any, Awaitable, Callable, Dict, Union
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message
+
+from config import ADMIN_IDS, THROTTLE_RULES
+from services.throttle import TokenBucketLimiter, parse_rules
+
+logger = logging.getLogger(__name__)
+
+limiter = TokenBucketLimiter(parse_rules(THROTTLE_RULES))
+
+
+def throttle_key(event: Union[Message, CallbackQuery]) -> str:
+    """Ключ лимита: команда, "take" для ссылки взятия заказа или префикс callback_data."""
+    if isinstance(event, CallbackQuery):
+        data = event.data or ""
+        prefix, sep, _ = data.partition(":")
+        # Старый формат callback_data: "<prefix>_<value>"
+        return (prefix if sep else data.rpartition("_")[0]).lower()
+
+    text = event.text or ""
+    if not text.startswith("/"):
+        return "*"
+    command, _, args = text[1:].partition(" ")
+    command = command.split("@")[0].lower()
+    if command == "start" and args.startswith("take_"):
+        return "take"
+    return command
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Отбрасывает апдейты пользователя сверх лимита до вызова обработчика.
+
+    Отброшенный апдейт не доходит до БД. Пользователь получает одно
+    уведомление о паузе на серию отказов, а не ответ на каждый апдейт.
+    """
+
+    def __init__(self, limiter: TokenBucketLimiter):
+        self.limiter = limiter
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Union[Message, CallbackQuery],
+        data: Dict[str, Any]
+    ) -> Any:
+        user = event.from_user
+        if user is None or user.id in ADMIN_IDS:
+            return await handler(event, data)
+
+        key = throttle_key(event)
+        allowed, notify, retry_after = self.limiter.hit(user.id, key)
+        if allowed:
+            return await handler(event, data)
+
+        if notify:
+            logger.warning("Throttling user %s on '%s'", user.id, key)
+            # Для callback-запроса это всплывающая подсказка, для сообщения — ответ
+            try:
+                await event.answer(
+                    f"⏳ Слишком много запросов. Подождите {max(1, round(retry_after))} сек."
+                )
+            except Exception as e:
+                logger.error("Failed to send cooldown notice to %s: %s", user.id, e)
+        return None
+
+
+def register_throttling(dp) -> None:
+    """Подключить ограничение частоты к сообщениям и callback-запросам."""
+    if not limiter.rules:
+        return
+    middleware = ThrottlingMiddleware(limiter)
+    dp.message.outer_middleware(middleware)
+    dp.callback_query.outer_middleware(middleware)
@@ -0,0 +1,54 @@
+from typing import Any, Awaitable, Callable, Dict, Union
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import CallbackQuery, Message
+
+from services.tracing import current_span, tracer
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Span "handler" вокруг обработчика aiogram.
+
+    Внутренний middleware: вызывается, только когда фильтры уже выбрали
+    обработчик. Вне трассы (апдейт не попал в выборку) сразу передает
+    управление дальше.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Union[Message, CallbackQuery],
+        data: Dict[str, Any]
+    ) -> Any:
+        if current_span() is None:
+            return await handler(event, data)
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", None)
+        with tracer.span("handler", event=type(event).__name__, handler=name):
+            return await handler(event, data)
+
+
+class TracingRequestMiddleware(BaseRequestMiddleware):
+    """Span "bot.<метод>" вокруг каждого запроса к Bot API."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        if current_span() is None:
+            return await make_request(bot, method)
+        with tracer.span(f"bot.{method.__api_method__}", chat_id=getattr(method, "chat_id", None)):
+            return await make_request(bot, method)
+
+
+def register_tracing(dp, bot: Bot) -> None:
+    """Подключить spans обработчиков и запросов к Bot API."""
+    middleware = TracingMiddleware()
+    dp.message.middleware(middleware)
+    dp.callback_query.middleware(middleware)
+    bot.session.middleware(TracingRequestMiddleware())
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Hashable, Iterable, List, Tuple
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Отправка одному получателю: (ключ получателя, фабрика корутины)
+SendJob = Tuple[Hashable, Callable[[], Awaitable[Any]]]
+
+
+class BatchResult:
+    """Итог рассылки: число доставленных, получатели с ошибкой и заблокировавшие бота."""
+    __slots__ = ("sent", "failed", "blocked")
+
+    def __init__(self):
+        self.sent = 0
+        self.failed: List[Hashable] = []
+        self.blocked: List[Hashable] = []
+
+
+class BatchSender:
+    """Рассылка пачки сообщений не больше чем в concurrency запросов сразу.
+
+    Сообщения отправляют concurrency воркеров, разбирающих общий список,
+    поэтому задач столько же, сколько воркеров, а не сообщений. rate
+    ограничивает число отправок в секунду на весь процесс (Telegram
+    отвечает 429 примерно после 30 сообщений в секунду); ответ 429
+    выдерживается паузой retry_after и одним повтором.
+    """
+
+    def __init__(self, concurrency: int, rate: float = 0):
+        self.concurrency = max(concurrency, 1)
+        self._spacing = 1 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    async def _pace(self) -> None:
+        """Дождаться своего слота по rate."""
+        if not self._spacing:
+            return
+        now = asyncio.get_running_loop().time()
+        slot = max(self._next_slot, now)
+        self._next_slot = slot + self._spacing
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _deliver(
+        self, key: Hashable, send: Callable[[], Awaitable[Any]], result: BatchResult
+    ) -> None:
+        for attempt in range(2):
+            await self._pace()
+            try:
+                await send()
+                result.sent += 1
+                return
+            except TelegramRetryAfter as e:
+                if attempt:
+                    break
+                self.retried += 1
+                await asyncio.sleep(e.retry_after)
+            except TelegramForbiddenError:
+                result.blocked.append(key)
+                return
+            except Exception as e:
+                logger.error("Failed to send batch message to %s: %s", key, e)
+                break
+        result.failed.append(key)
+
+    async def send(self, jobs: Iterable[SendJob]) -> BatchResult:
+        """Отправить все сообщения и вернуть итог; ошибки не пробрасываются."""
+        result = BatchResult()
+        pending = iter(jobs)
+
+        async def worker() -> None:
+            for key, send in pending:
+                await self._deliver(key, send, result)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        self.sent += result.sent
+        self.failed += len(result.failed)
+        return result
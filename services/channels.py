@@ -0,0 +1,61 @@
+from typing import Any, Dict, List, Mapping, Optional
+
+from config import ORDER_CHANNELS, ORDERS_CHANNEL_ID
+
+
+class Region:
+    """Регион с собственным каналом заказов."""
+    __slots__ = ("key", "title", "chat_id", "keywords")
+
+    def __init__(self, key: str, title: str, chat_id: str, keywords: List[str]):
+        self.key = key
+        self.title = title
+        self.chat_id = chat_id
+        self.keywords = keywords
+
+
+class ChannelRegistry:
+    """Каналы публикации заказов по регионам.
+
+    Регион определяется по адресу забора (подстроки-ключевые слова,
+    без учета регистра) или выбирается заказчиком. Заказы без региона
+    и регионов без канала публикуются в канал по умолчанию.
+    """
+
+    def __init__(self, config: Mapping[str, Mapping[str, Any]], default_chat_id: Optional[str]):
+        self.default_chat_id = default_chat_id
+        self.regions: Dict[str, Region] = {}
+        for key, entry in config.items():
+            title = entry.get("title") or key
+            keywords = [word.lower() for word in entry.get("keywords", [])] or [title.lower()]
+            self.regions[key] = Region(key, title, str(entry["chat_id"]), keywords)
+
+    def __len__(self) -> int:
+        return len(self.regions)
+
+    def detect(self, address: str) -> Optional[str]:
+        """Регион по адресу; None, если ни одно ключевое слово не встретилось."""
+        address = (address or "").lower()
+        for region in self.regions.values():
+            if any(word in address for word in region.keywords):
+                return region.key
+        return None
+
+    def by_title(self, title: str) -> Optional[str]:
+        """Регион по названию (ответ на выбор региона)."""
+        title = (title or "").strip().lower()
+        for region in self.regions.values():
+            if region.title.lower() == title or region.key == title:
+                return region.key
+        return None
+
+    def titles(self) -> List[str]:
+        return [region.title for region in self.regions.values()]
+
+    def chat_for(self, region: Optional[str]) -> Optional[str]:
+        """Канал для публикации заказа региона."""
+        entry = self.regions.get(region) if region else None
+        return entry.chat_id if entry else self.default_chat_id
+
+
+channels = ChannelRegistry(ORDER_CHANNELS, ORDERS_CHANNEL_ID)
@@ -0,0 +1,65 @@
+from typing import Iterable, List, Optional, Set
+
+
+class UpdateDeduplicator:
+    """Окно недавно обработанных update_id.
+
+    Кольцевой буфер фиксированного размера хранит порядок поступления,
+    множество дает проверку за O(1). Память не зависит от трафика:
+    при заполнении окна самый старый id вытесняется. Окно размером 0
+    отключает дедупликацию.
+    """
+
+    def __init__(self, capacity: int = 2048):
+        self.capacity = max(capacity, 0)
+        self._ring: List[Optional[int]] = [None] * self.capacity
+        self._pos = 0
+        self._seen: Set[int] = set()
+        self.duplicates = 0
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def __contains__(self, update_id: int) -> bool:
+        return update_id in self._seen
+
+    def add(self, update_id: int) -> None:
+        """Запомнить update_id, вытеснив самый старый при заполненном окне."""
+        if not self.capacity:
+            return
+        evicted = self._ring[self._pos]
+        if evicted is not None:
+            self._seen.discard(evicted)
+        self._ring[self._pos] = update_id
+        self._seen.add(update_id)
+        self._pos = (self._pos + 1) % self.capacity
+
+    def discard(self, update_id: int) -> None:
+        """Забыть update_id (апдейт не обработан и будет доставлен повторно)."""
+        if update_id not in self._seen:
+            return
+        self._seen.discard(update_id)
+        # Ошибка обработки — редкий путь, поэтому линейный поиск по окну
+        for pos, seen in enumerate(self._ring):
+            if seen == update_id:
+                self._ring[pos] = None
+                break
+
+    def check_and_add(self, update_id: int) -> bool:
+        """Вернуть True, если апдейт уже встречался; иначе запомнить его."""
+        if update_id in self._seen:
+            self.duplicates += 1
+            return True
+        self.add(update_id)
+        return False
+
+    def load(self, update_ids: Iterable[int]) -> None:
+        """Заполнить окно сохраненными id (от старых к новым)."""
+        for update_id in update_ids:
+            if update_id not in self._seen:
+                self.add(update_id)
+
+    def recent(self) -> List[int]:
+        """id из окна от старых к новым (для снимка при остановке)."""
+        ordered = self._ring[self._pos:] + self._ring[:self._pos]
+        return [update_id for update_id in ordered if update_id is not None]
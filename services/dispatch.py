@@ -0,0 +1,263 @@
+import heapq
+from typing import Callable, Dict, FrozenSet, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+# Ожидание заказа и простой водителя дольше этого считаются максимальными
+SATURATION = 1800
+
+# Оценка пары для каждого из критериев лежит в [0, 1]
+CRITERIA = ("fit", "wait", "idle")
+
+# Соответствие машины, когда по грузу ограничений нет
+NEUTRAL_FIT = 0.5
+
+# Матрица оценок: строки — заказы, столбцы — водители, None — пара недопустима
+Scores = List[List[Optional[float]]]
+
+# Допустимые пары (оценка, строка, столбец)
+Pairs = List[Tuple[float, int, int]]
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """Разобрать "fit=1,wait=1,idle=0.5" в веса критериев (не указанные — 0)."""
+    weights = dict.fromkeys(CRITERIA, 0.0)
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        key, _, value = item.partition("=")
+        key = key.strip().lower()
+        if key not in weights:
+            raise ValueError(f"Unknown dispatch criterion '{key}'")
+        weights[key] = float(value)
+    return weights
+
+
+def allowed_cars(
+    cargo: Optional[str], cargo_cars: Mapping[str, Iterable[str]]
+) -> Optional[FrozenSet[str]]:
+    """Машины, подходящие для груза по ключевым словам; None — подходит любая."""
+    text = (cargo or "").lower()
+    cars = set()
+    matched = False
+    for keyword, models in cargo_cars.items():
+        if keyword.lower() in text:
+            matched = True
+            cars.update(models)
+    return frozenset(cars) if matched else None
+
+
+class Job:
+    """Заказ в пакете распределения."""
+    __slots__ = ("order_id", "waited", "cars")
+
+    def __init__(self, order_id: int, waited: float, cars: Optional[FrozenSet[str]]):
+        self.order_id = order_id
+        self.waited = waited
+        self.cars = cars
+
+
+class Candidate:
+    """Доступный водитель в пакете распределения."""
+    __slots__ = ("driver_id", "car_model", "idle", "username")
+
+    def __init__(self, driver_id: int, car_model: Optional[str], idle: float,
+                 username: Optional[str] = None):
+        self.driver_id = driver_id
+        self.car_model = car_model
+        self.idle = idle
+        self.username = username
+
+
+def pair_score(job: Job, candidate: Candidate, weights: Mapping[str, float]) -> Optional[float]:
+    """Оценка пары заказ — водитель; None, если машина не подходит для груза."""
+    if job.cars is None:
+        fit = NEUTRAL_FIT
+    elif candidate.car_model in job.cars:
+        fit = 1.0
+    else:
+        return None
+    return (
+        weights.get("fit", 0.0) * fit
+        + weights.get("wait", 0.0) * min(job.waited / SATURATION, 1.0)
+        + weights.get("idle", 0.0) * min(candidate.idle / SATURATION, 1.0)
+    )
+
+
+def score_matrix(
+    jobs: Sequence[Job],
+    candidates: Sequence[Candidate],
+    weights: Mapping[str, float],
+    excluded: Callable[[int, int], bool] = lambda order_id, driver_id: False
+) -> Scores:
+    """Оценки всех пар заказ — водитель."""
+    return [
+        [
+            None if excluded(job.order_id, candidate.driver_id)
+            else pair_score(job, candidate, weights)
+            for candidate in candidates
+        ]
+        for job in jobs
+    ]
+
+
+def best_pairs(
+    jobs: Sequence[Job],
+    candidates: Sequence[Candidate],
+    weights: Mapping[str, float],
+    excluded: Callable[[int, int], bool] = lambda order_id, driver_id: False
+) -> Pairs:
+    """Для каждого заказа — len(jobs) лучших водителей, без полной матрицы.
+
+    При фиксированном заказе оценка зависит от водителя только через
+    соответствие машины (одно значение на модель) и простой, поэтому
+    водители группируются по модели и сортируются по простою один раз,
+    а лучшие для заказа получаются слиянием подходящих групп.
+    Жадному назначению этого достаточно: пока заказ ждет своей очереди,
+    другие заказы могут занять не больше len(jobs) - 1 его водителей.
+    """
+    limit = len(jobs)
+    idle_weight = weights.get("idle", 0.0)
+    fit_weight = weights.get("fit", 0.0)
+    # (-простой, столбец): тот же порядок при равных оценках, что в match_greedy
+    groups: Dict[Optional[str], List[Tuple[float, int]]] = {}
+    for j, candidate in enumerate(candidates):
+        idle_term = idle_weight * min(candidate.idle / SATURATION, 1.0)
+        groups.setdefault(candidate.car_model, []).append((-idle_term, j))
+    for group in groups.values():
+        group.sort()
+    everyone = sorted(item for group in groups.values() for item in group)
+
+    pairs = []
+    for i, job in enumerate(jobs):
+        base = weights.get("wait", 0.0) * min(job.waited / SATURATION, 1.0)
+        if job.cars is None:
+            ranked, fit = everyone, fit_weight * NEUTRAL_FIT
+        else:
+            ranked = heapq.merge(*(groups[car] for car in job.cars if car in groups))
+            fit = fit_weight
+        taken = 0
+        for neg_idle, j in ranked:
+            if excluded(job.order_id, candidates[j].driver_id):
+                continue
+            pairs.append((base + fit - neg_idle, i, j))
+            taken += 1
+            if taken >= limit:
+                break
+    return pairs
+
+
+def match_greedy(pairs: Pairs) -> List[Tuple[int, int]]:
+    """Пары (строка, столбец) по убыванию оценки, каждая сторона — не больше раза.
+
+    O(P log P) по числу пар; итог не хуже половины оптимума. Равные
+    оценки разрешаются по номеру строки, затем столбца.
+    """
+    pairs = sorted(pairs, key=lambda pair: (-pair[0], pair[1], pair[2]))
+    used_rows, used_cols = set(), set()
+    matched = []
+    for _, i, j in pairs:
+        if i in used_rows or j in used_cols:
+            continue
+        used_rows.add(i)
+        used_cols.add(j)
+        matched.append((i, j))
+    return matched
+
+
+def match_hungarian(scores: Scores) -> List[Tuple[int, int]]:
+    """Назначение с максимальной суммой оценок (венгерский алгоритм).
+
+    Сначала максимизируется число допустимых пар, затем сумма оценок.
+    O(n^2 * m) для n строк и m столбцов (n <= m).
+    """
+    n = len(scores)
+    m = len(scores[0]) if n else 0
+    if not n or not m:
+        return []
+    transposed = n > m
+    if transposed:
+        scores = [list(column) for column in zip(*scores)]
+        n, m = m, n
+
+    # Недопустимая пара дороже любой суммы допустимых
+    top = max((s for row in scores for s in row if s is not None), default=0.0)
+    forbidden = (top + 1) * (n + 1)
+    cost = [[0.0] + [forbidden if s is None else top - s for s in row] for row in scores]
+
+    # Потенциалы и паросочетание, индексы с 1 (e-maxx)
+    inf = float("inf")
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    p = [0] * (m + 1)
+    way = [0] * (m + 1)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            row = cost[i0 - 1]
+            ui0 = u[i0]
+            delta = inf
+            j1 = 0
+            for j in range(1, m + 1):
+                if used[j]:
+                    continue
+                cur = row[j] - ui0 - v[j]
+                if cur < minv[j]:
+                    minv[j] = cur
+                    way[j] = j0
+                if minv[j] < delta:
+                    delta = minv[j]
+                    j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    matched = []
+    for j in range(1, m + 1):
+        i = p[j]
+        if i and scores[i - 1][j - 1] is not None:
+            matched.append((j - 1, i - 1) if transposed else (i - 1, j - 1))
+    matched.sort()
+    return matched
+
+
+MATCHERS = ("greedy", "hungarian")
+
+
+def plan_assignments(
+    jobs: Sequence[Job],
+    candidates: Sequence[Candidate],
+    weights: Mapping[str, float],
+    matcher: str = "greedy",
+    hungarian_max: int = 50,
+    excluded: Callable[[int, int], bool] = lambda order_id, driver_id: False
+) -> List[Tuple[Job, Candidate, float]]:
+    """Решить пакет: пары (заказ, водитель, оценка).
+
+    Венгерский алгоритм кубический и строит полную матрицу, поэтому
+    пакет, у которого меньшая сторона больше hungarian_max, решается
+    жадно по лучшим парам (best_pairs).
+    """
+    if not jobs or not candidates:
+        return []
+    if matcher == "hungarian" and min(len(jobs), len(candidates)) <= hungarian_max:
+        matched = match_hungarian(score_matrix(jobs, candidates, weights, excluded))
+    else:
+        matched = match_greedy(best_pairs(jobs, candidates, weights, excluded))
+    return [
+        (jobs[i], candidates[j], pair_score(jobs[i], candidates[j], weights))
+        for i, j in matched
+    ]
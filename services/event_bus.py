@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Type
+
+from config import EVENT_QUEUE_SIZE
+from services.logs import log_context
+from services.tracing import current_span, tracer
+
+logger = logging.getLogger(__name__)
+
+
+# ===== События =====
+
+class OrderEvent:
+    """Событие заказа, опубликованное после фиксации транзакции.
+
+    order — строка, которую вернул метод Database (набор полей зависит
+    от метода); published_at нужен метрикам задержки доставки, trace —
+    span, в котором событие создано (подписчики продолжают его трассу).
+    """
+    __slots__ = ("order", "published_at", "trace")
+
+    def __init__(self, order: Dict[str, Any]):
+        self.order = order
+        self.published_at = time.monotonic()
+        self.trace = current_span()
+
+    @property
+    def order_id(self) -> int:
+        return self.order["id"]
+
+
+class OrderCreated(OrderEvent):
+    """Заказ создан и ожидает водителя (строка create_order/get_order)."""
+    __slots__ = ()
+
+
+class OrderReserved(OrderEvent):
+    """Водитель взял заказ (строка reserve_order)."""
+    __slots__ = ("driver_username",)
+
+    def __init__(self, order: Dict[str, Any], driver_username: str):
+        super().__init__(order)
+        self.driver_username = driver_username
+
+
+class OrderConfirmed(OrderEvent):
+    """Водитель подтвердил заказ (строка complete_order с контактами водителя)."""
+    __slots__ = ()
+
+
+class OrderCancelled(OrderEvent):
+    """Водитель отказался от заказа, заказ снова ждет водителя (строка release_order)."""
+    __slots__ = ()
+
+
+EventHandler = Callable[[Any], Awaitable[None]]
+
+
+# ===== Шина =====
+
+class Subscription:
+    """Подписчик шины: свои очереди, свои обработчики и счетчики.
+
+    С partition_key у каждого воркера своя очередь, и событие попадает
+    в очередь по ключу: события с одним ключом (например, одного заказа)
+    обрабатываются по порядку, с разными — параллельно. Без ключа все
+    воркеры разбирают одну общую очередь.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handlers: Dict[Type[OrderEvent], EventHandler],
+        queue_size: int,
+        workers: int,
+        partition_key: Optional[Callable[[OrderEvent], int]] = None
+    ):
+        self.name = name
+        self.handlers = handlers
+        self.workers = workers
+        self.partition_key = partition_key
+        partitions = workers if partition_key else 1
+        self.queues: List["asyncio.Queue[OrderEvent]"] = [
+            asyncio.Queue(queue_size) for _ in range(partitions)
+        ]
+        self.tasks: List[asyncio.Task] = []
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def queue_for(self, event: OrderEvent) -> "asyncio.Queue[OrderEvent]":
+        if self.partition_key is None:
+            return self.queues[0]
+        return self.queues[hash(self.partition_key(event)) % len(self.queues)]
+
+    def qsize(self) -> int:
+        return sum(queue.qsize() for queue in self.queues)
+
+    async def run(self, queue: "asyncio.Queue[OrderEvent]") -> None:
+        while True:
+            event = await queue.get()
+            # Записи лога обработчиков относятся к заказу события
+            log_context.set({"order_id": event.order_id})
+            try:
+                with tracer.resume(event.trace, f"subscriber.{self.name}",
+                                   event=type(event).__name__):
+                    await self.handlers[type(event)](event)
+                self.processed += 1
+            except Exception as e:
+                # Ошибка одного подписчика не затрагивает остальных
+                self.failed += 1
+                logger.error(
+                    "Subscriber %s failed on %s of order %s: %s",
+                    self.name, type(event).__name__, event.order_id, e
+                )
+            finally:
+                queue.task_done()
+
+
+class EventBus:
+    """Внутренняя шина событий заказов.
+
+    Обработчики бота фиксируют изменение в БД, публикуют событие и
+    отвечают пользователю; побочные действия (канал, уведомления,
+    метрики) выполняют подписчики в фоне. У каждого подписчика своя
+    ограниченная очередь и свои воркеры, поэтому подписчики работают
+    параллельно и не мешают друг другу. Внутри подписчика с одним
+    воркером (или в одной партиции, см. Subscription) события
+    обрабатываются в порядке публикации — это важно для правок одного
+    и того же сообщения в канале.
+    """
+
+    def __init__(self, queue_size: int = 1000):
+        self.queue_size = queue_size
+        self._subscriptions: List[Subscription] = []
+        self._routes: Dict[Type[OrderEvent], List[Subscription]] = {}
+        self._started = False
+
+    def subscribe(
+        self,
+        name: str,
+        handlers: Dict[Type[OrderEvent], EventHandler],
+        workers: int = 1,
+        partition_key: Optional[Callable[[OrderEvent], int]] = None
+    ) -> Subscription:
+        """Подписать обработчики на типы событий под общим именем."""
+        subscription = Subscription(name, handlers, self.queue_size, workers, partition_key)
+        self._subscriptions.append(subscription)
+        for event_type in handlers:
+            self._routes.setdefault(event_type, []).append(subscription)
+        if self._started:
+            self._spawn(subscription)
+        return subscription
+
+    def publish(self, event: OrderEvent) -> None:
+        """Поставить событие в очереди подписчиков, не дожидаясь обработки.
+
+        Если очередь подписчика заполнена, событие для него теряется:
+        публикующий обработчик не должен ждать медленного подписчика.
+        """
+        for subscription in self._routes.get(type(event), ()):
+            try:
+                subscription.queue_for(event).put_nowait(event)
+            except asyncio.QueueFull:
+                subscription.dropped += 1
+                logger.warning(
+                    "Subscriber %s queue is full, dropped %s of order %s",
+                    subscription.name, type(event).__name__, event.order_id
+                )
+
+    def _spawn(self, subscription: Subscription) -> None:
+        for worker in range(subscription.workers):
+            queue = subscription.queues[worker % len(subscription.queues)]
+            subscription.tasks.append(asyncio.create_task(subscription.run(queue)))
+
+    def start(self) -> None:
+        """Запустить воркеры подписчиков (нужен работающий цикл событий)."""
+        if self._started:
+            return
+        self._started = True
+        for subscription in self._subscriptions:
+            self._spawn(subscription)
+
+    async def stop(self, timeout: Optional[float] = None) -> bool:
+        """Дождаться обработки очередей (не дольше timeout) и остановить воркеры.
+
+        Возвращает False, если за timeout очереди не опустели.
+        """
+        drained = True
+        if self._started:
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(q.join() for s in self._subscriptions for q in s.queues)),
+                    timeout
+                )
+            except asyncio.TimeoutError:
+                drained = False
+                logger.warning("Event bus stopped with pending events: %s", self.pending())
+        for subscription in self._subscriptions:
+            for task in subscription.tasks:
+                task.cancel()
+            await asyncio.gather(*subscription.tasks, return_exceptions=True)
+            subscription.tasks.clear()
+        self._started = False
+        return drained
+
+    def pending(self) -> int:
+        return sum(s.qsize() for s in self._subscriptions)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            s.name: {
+                "queued": s.qsize(),
+                "processed": s.processed,
+                "failed": s.failed,
+                "dropped": s.dropped,
+            }
+            for s in self._subscriptions
+        }
+
+
+bus = EventBus(EVENT_QUEUE_SIZE)
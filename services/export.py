@@ -0,0 +1,73 @@
+import csv
+import io
+import json
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from states import OrderStatus
+
+# Колонки выгрузки: заказ в форме Database.get_order
+EXPORT_COLUMNS = [
+    "id", "customer_id", "customer_username", "customer_phone", "cargo",
+    "from_addr", "to_addr", "phone", "status", "driver_id", "driver_username",
+    "tg_chat_id", "tg_message_id", "reserved_until", "created_at", "updated_at",
+    "posted_at", "reserved_at", "finished_at",
+]
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def serialize_order(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Заказ для выгрузки и API: только колонки EXPORT_COLUMNS, статус — именем."""
+    row = {column: row.get(column) for column in EXPORT_COLUMNS}
+    if row["status"] is not None:
+        row["status"] = OrderStatus(row["status"]).name
+    return row
+
+
+def _encode_csv(rows: List[Dict[str, Any]], header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    if header:
+        writer.writeheader()
+    writer.writerows(serialize_order(row) for row in rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+def _encode_ndjson(rows: List[Dict[str, Any]]) -> bytes:
+    return "".join(
+        json.dumps(serialize_order(row), ensure_ascii=False) + "\n" for row in rows
+    ).encode("utf-8")
+
+
+async def export_stream(
+    batches: AsyncIterator[List[Dict[str, Any]]],
+    fmt: str = "csv",
+    compress: bool = False
+) -> AsyncIterator[bytes]:
+    """Кодировать пачки строк в CSV/NDJSON, при необходимости в gzip.
+
+    В памяти одновременно находится только одна пачка и буфер
+    компрессора, сколько бы строк ни выгружалось.
+    """
+    encode = _encode_csv if fmt == "csv" else _encode_ndjson
+    # wbits=31 — формат gzip (заголовок и контрольная сумма)
+    compressor: Optional[Any] = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    if fmt == "csv":
+        # Заголовок отдается даже для пустой выгрузки
+        chunk = _encode_csv([], header=True)
+        yield compressor.compress(chunk) if compressor else chunk
+
+    async for batch in batches:
+        chunk = encode(batch)
+        if compressor:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+
+    if compressor:
+        yield compressor.flush()
@@ -0,0 +1,202 @@
+import csv
+import io
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import CAR_MODELS
+from states import OrderStatus, UserRole, LEGACY_ORDER_STATUSES, FINISHED_ORDER_STATUSES
+
+logger = logging.getLogger(__name__)
+
+IMPORT_KINDS = ("users", "orders")
+IMPORT_FORMATS = ("csv", "json")
+
+# Ошибки показываются не все: отчет должен оставаться небольшим
+MAX_REPORTED_ERRORS = 50
+
+
+def read_records(data: str, fmt: str) -> Iterator[Dict[str, Any]]:
+    """Записи из CSV с заголовком, JSON-массива или NDJSON."""
+    if fmt == "csv":
+        yield from csv.DictReader(io.StringIO(data))
+        return
+    text = data.strip()
+    if text.startswith("["):
+        yield from json.loads(text)
+        return
+    for line in text.splitlines():
+        if line.strip():
+            yield json.loads(line)
+
+
+def _text(record: Dict[str, Any], field: str, required: bool = False) -> Optional[str]:
+    value = record.get(field)
+    value = str(value).strip() if value is not None else ""
+    if not value:
+        if required:
+            raise ValueError(f"{field} is required")
+        return None
+    return value
+
+
+def _int(record: Dict[str, Any], field: str, required: bool = False) -> Optional[int]:
+    value = _text(record, field, required)
+    return int(value) if value is not None else None
+
+
+def _phone(record: Dict[str, Any], field: str, required: bool = False) -> Optional[str]:
+    """Номер в формате +<цифры>, как его сохраняет process_phone."""
+    value = _text(record, field, required)
+    if value is None:
+        return None
+    digits = "".join(filter(str.isdigit, value))
+    if not digits:
+        raise ValueError(f"{field} has no digits")
+    return f"+{digits}"
+
+
+def _timestamp(record: Dict[str, Any], field: str) -> Optional[int]:
+    """Секунды Unix или дата ISO 8601 (без зоны — UTC)."""
+    value = _text(record, field)
+    if value is None:
+        return None
+    if value.isdigit():
+        return int(value)
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+
+_CAR_MODEL_IDS = {key: key for key, _ in CAR_MODELS}
+_CAR_MODEL_IDS.update({name.lower(): key for key, name in CAR_MODELS})
+_ROLES = {role.value for role in UserRole}
+
+
+def validate_user(record: Dict[str, Any]) -> Tuple:
+    """Строка для Database.import_users."""
+    role = _text(record, "role", required=True).lower()
+    if role not in _ROLES:
+        raise ValueError(f"role must be one of: {', '.join(sorted(_ROLES))}")
+    car_model = _text(record, "car_model")
+    if car_model is not None:
+        car_model = _CAR_MODEL_IDS.get(car_model.lower())
+        if car_model is None:
+            raise ValueError(f"unknown car_model '{record.get('car_model')}'")
+    username = _text(record, "username")
+    return (
+        _int(record, "user_id", required=True),
+        username.lstrip("@") if username else None,
+        _text(record, "first_name"),
+        _text(record, "last_name"),
+        role,
+        _phone(record, "phone"),
+        car_model,
+    )
+
+
+def validate_order(record: Dict[str, Any]) -> Tuple:
+    """Строка для Database.import_orders.
+
+    Импортируются только завершенные заказы: у открытого нет поста в
+    канале и активного заказа у водителя, а книга заказов, автораспределение
+    и дайджесты предлагали бы его водителям.
+    """
+    status_value = _text(record, "status") or OrderStatus.COMPLETED.name
+    if status_value.isdigit():
+        status = OrderStatus(int(status_value))
+    else:
+        status = LEGACY_ORDER_STATUSES.get(status_value) or OrderStatus[status_value.upper()]
+    if status not in FINISHED_ORDER_STATUSES:
+        raise ValueError(
+            "only finished orders can be imported "
+            f"({', '.join(s.name for s in sorted(FINISHED_ORDER_STATUSES))}), got {status.name}"
+        )
+    created_at = _timestamp(record, "created_at") or int(time.time())
+    finished_at = _timestamp(record, "finished_at") or created_at
+    return (
+        _int(record, "customer_id", required=True),
+        _text(record, "cargo", required=True),
+        _text(record, "from_addr", required=True),
+        _text(record, "to_addr", required=True),
+        _phone(record, "phone", required=True),
+        int(status),
+        _int(record, "driver_id"),
+        created_at,
+        finished_at,
+    )
+
+
+VALIDATORS: Dict[str, Callable[[Dict[str, Any]], Tuple]] = {
+    "users": validate_user,
+    "orders": validate_order,
+}
+
+
+def validate(kind: str, data: str, fmt: str) -> Tuple[List[Tuple], List[str]]:
+    """Разобрать и проверить записи; вернуть строки для загрузки и ошибки.
+
+    Номер записи в ошибке считается с 1 (для CSV — без строки заголовка).
+    """
+    validator = VALIDATORS[kind]
+    rows, errors = [], []
+    try:
+        for number, record in enumerate(read_records(data, fmt), start=1):
+            try:
+                if not isinstance(record, dict):
+                    raise ValueError("record must be an object")
+                rows.append(validator(record))
+            except (ValueError, KeyError, TypeError) as e:
+                errors.append(f"record {number}: {e}")
+    except (ValueError, csv.Error) as e:
+        errors.append(f"cannot parse {fmt}: {e}")
+    return rows, errors
+
+
+async def run_import(
+    db,
+    kind: str,
+    data: str,
+    fmt: str,
+    chunk_size: int = 1000,
+    rebuild_indexes: bool = False,
+    dry_run: bool = False
+) -> Dict[str, Any]:
+    """Проверить и загрузить записи; вернуть отчет со скоростью загрузки.
+
+    Если хоть одна запись не прошла проверку, ничего не загружается.
+    """
+    rows, errors = validate(kind, data, fmt)
+    report: Dict[str, Any] = {
+        "kind": kind,
+        "valid": len(rows),
+        "invalid": len(errors),
+        "errors": errors[:MAX_REPORTED_ERRORS],
+        "imported": 0,
+    }
+    if errors or dry_run or not rows:
+        return report
+
+    started = time.perf_counter()
+    try:
+        if kind == "users":
+            imported = await db.import_users(rows, chunk_size)
+        else:
+            imported = await db.import_orders(rows, chunk_size, rebuild_indexes)
+    except Exception as e:
+        # Уже загруженные пачки остаются в базе
+        logger.error("Error importing %s: %s", kind, e)
+        report["errors"].append(f"import failed: {e}")
+        return report
+    elapsed = time.perf_counter() - started
+    logger.info("Imported %s %s in %.2fs", imported, kind, elapsed)
+
+    report.update({
+        "imported": imported,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(imported / elapsed) if elapsed else None,
+    })
+    return report
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Сигналы, по которым начинается остановка (их же перехватывает uvicorn)
+STOP_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+class Lifecycle:
+    """Остановка приложения в пределах общего срока.
+
+    По сигналу приложение перестает принимать апдейты (вебхук отвечает
+    503, и Telegram повторит доставку позже) и сразу выполняет колбэки
+    on_drain — например, закрывает бесконечные SSE-потоки, которых иначе
+    ждал бы uvicorn. Затем shutdown-хук дожидается апдейтов в обработке
+    и выполняет остальные шаги, пока не истечет срок.
+    """
+
+    def __init__(self):
+        self.accepting = True
+        self._inflight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._on_drain: List[Callable[[], None]] = []
+        self._deadline: Optional[float] = None
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    @contextmanager
+    def update(self):
+        """Учесть апдейт на время его обработки."""
+        self._inflight += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self._inflight -= 1
+            if not self._inflight:
+                self._idle.set()
+
+    def on_drain(self, callback: Callable[[], None]) -> None:
+        self._on_drain.append(callback)
+
+    def begin_drain(self) -> None:
+        """Перестать принимать апдейты (повторный вызов ничего не делает)."""
+        if not self.accepting:
+            return
+        self.accepting = False
+        logger.info("Draining: new updates are rejected")
+        for callback in self._on_drain:
+            try:
+                callback()
+            except Exception as e:
+                logger.error("Drain callback failed: %s", e)
+
+    def install_signal_handlers(self) -> None:
+        """Начинать остановку сразу по сигналу, сохранив обработчики uvicorn.
+
+        Вызывается после того, как uvicorn установил свои обработчики
+        (в startup-хуке); вне главного потока ничего не делает.
+        """
+        loop = asyncio.get_running_loop()
+        for sig in STOP_SIGNALS:
+            try:
+                previous = signal.getsignal(sig)
+            except ValueError:
+                return
+
+            def handler(signum, frame, previous=previous):
+                loop.call_soon_threadsafe(self.begin_drain)
+                if callable(previous):
+                    previous(signum, frame)
+
+            try:
+                signal.signal(sig, handler)
+            except ValueError:
+                # Не главный поток
+                return
+
+    def start_deadline(self, timeout: float) -> None:
+        self._deadline = time.monotonic() + timeout
+
+    def remaining(self) -> float:
+        """Секунды до истечения срока остановки (не меньше нуля)."""
+        if self._deadline is None:
+            return 0.0
+        return max(self._deadline - time.monotonic(), 0.0)
+
+    async def wait_idle(self) -> bool:
+        """Дождаться окончания обработки апдейтов; False — не успели к сроку."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), self.remaining())
+            return True
+        except asyncio.TimeoutError:
+            logger.warning("Shutdown deadline hit with %s updates in flight", self._inflight)
+            return False
+
+
+# ===== Снимок кэшей =====
+
+def save_snapshot(path: str, data: Dict[str, Any]) -> None:
+    """Записать снимок атомарно: читатель не увидит недописанный файл."""
+    temp = f"{path}.tmp"
+    with open(temp, "w", encoding="utf-8") as f:
+        json.dump({"saved_at": time.time(), **data}, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(temp, path)
+
+
+def load_snapshot(path: str, max_age: float) -> Optional[Dict[str, Any]]:
+    """Прочитать и удалить снимок; None, если его нет, он поврежден или устарел.
+
+    Снимок одноразовый: после аварийного завершения следующий старт не
+    должен подхватить состояние от предыдущей штатной остановки.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable snapshot %s: %s", path, e)
+        data = None
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    if not data or time.time() - data.get("saved_at", 0) > max_age:
+        return None
+    return data
@@ -0,0 +1,167 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional, Tuple
+
+# Поля контекста, которые попадают в каждую запись
+CONTEXT_FIELDS = ("update_id", "user_id", "order_id")
+
+# Контекст текущего апдейта (или события шины): свой у каждой задачи asyncio
+log_context: ContextVar[Dict[str, Any]] = ContextVar("log_context", default={})
+
+# Логгеры uvicorn пишут через свои обработчики напрямую в поток
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+_listener: Optional[QueueListener] = None
+
+
+def bind_log_context(**fields: Any) -> None:
+    """Добавить поля к контексту логов текущей задачи."""
+    log_context.set({**log_context.get(), **fields})
+
+
+class ContextFilter(logging.Filter):
+    """Переносит поля log_context в запись (в потоке, который пишет лог)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for field, value in log_context.get().items():
+            if not hasattr(record, field):
+                setattr(record, field, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Прореживание частых записей уровня INFO и ниже.
+
+    Записи группируются по шаблону сообщения (поэтому логировать надо
+    с ленивым форматированием, а не f-строкой): первые burst записей
+    шаблона за окно пишутся все, дальше — каждая every-я с полем
+    sampled (сколько записей она представляет). WARNING и выше не
+    прореживаются. Отброшенная запись не форматируется.
+    """
+
+    def __init__(self, burst: int, every: int, window: float = 60.0, max_templates: int = 1000):
+        super().__init__()
+        self.burst = burst
+        self.every = max(every, 1)
+        self.window = window
+        self.max_templates = max_templates
+        self._counts: Dict[Tuple[str, Any], list] = {}
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or self.every == 1:
+            return True
+        now = time.monotonic()
+        key = (record.name, record.msg)
+        state = self._counts.get(key)
+        if state is None or now - state[0] > self.window:
+            if len(self._counts) >= self.max_templates:
+                self._counts.clear()
+            state = self._counts[key] = [now, 0]
+        state[1] += 1
+        over = state[1] - self.burst
+        if over <= 0:
+            return True
+        if over % self.every:
+            self.dropped += 1
+            return False
+        record.sampled = self.every
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Кладет запись в очередь; вывод делает поток QueueListener.
+
+    Сообщение и трассировка форматируются здесь, пока аргументы записи
+    еще не изменились, но без обращения к потоку вывода.
+    """
+
+    _exc_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        created = datetime.fromtimestamp(record.created, timezone.utc)
+        data = {
+            "ts": created.isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        sampled = getattr(record, "sampled", None)
+        if sampled:
+            data["sampled"] = sampled
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def setup_logging(
+    level: str, output: str, text_format: str, burst: int, every: int
+) -> SamplingFilter:
+    """Настроить корневой логгер: очередь в памяти и фоновый поток вывода.
+
+    output — "json" или "text" (text_format). Повторный вызов заменяет
+    прежнюю настройку. Возвращает фильтр прореживания (для счетчиков).
+    """
+    global _listener
+    stop_logging()
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if output == "json" else logging.Formatter(text_format))
+    records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _listener = QueueListener(records, stream, respect_handler_level=False)
+
+    sampling = SamplingFilter(burst, every)
+    handler = NonBlockingQueueHandler(records)
+    handler.addFilter(sampling)
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+    # Логи uvicorn (в том числе access) идут в ту же очередь
+    for name in UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+
+    _listener.start()
+    return sampling
+
+
+def stop_logging() -> None:
+    """Дописать записи из очереди и остановить поток вывода."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
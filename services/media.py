@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from aiogram.types import Message
+
+from config import FILE_ID_CACHE_SIZE
+
+# Максимальная длина подписи к фото в Telegram
+CAPTION_LIMIT = 1024
+
+
+class FileIdCache:
+    """file_unique_id -> последний известный file_id.
+
+    file_unique_id у файла постоянный, а file_id Telegram может выдавать
+    разные; после каждой отправки запоминаем свежий file_id и дальше
+    отправляем по нему, не скачивая и не загружая файл заново.
+    """
+
+    def __init__(self, capacity: int = 512):
+        self.capacity = capacity
+        self._file_ids: "OrderedDict[str, str]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._file_ids)
+
+    def remember(self, unique_id: Optional[str], file_id: Optional[str]) -> None:
+        if not unique_id or not file_id:
+            return
+        self._file_ids[unique_id] = file_id
+        self._file_ids.move_to_end(unique_id)
+        if len(self._file_ids) > self.capacity:
+            self._file_ids.popitem(last=False)
+
+    def remember_message(self, message: Optional[Message]) -> None:
+        """Запомнить фото из отправленного сообщения."""
+        file_id, unique_id = photo_of(message) if message else (None, None)
+        self.remember(unique_id, file_id)
+
+    def resolve(self, unique_id: Optional[str], file_id: str) -> str:
+        """file_id для отправки: из кэша, иначе сохраненный с заказом."""
+        cached = self._file_ids.get(unique_id) if unique_id else None
+        if cached is None:
+            return file_id
+        self._file_ids.move_to_end(unique_id)
+        return cached
+
+
+def photo_of(message: Message) -> Tuple[Optional[str], Optional[str]]:
+    """file_id и file_unique_id самого крупного размера фото в сообщении."""
+    if not message.photo:
+        return None, None
+    largest = message.photo[-1]
+    return largest.file_id, largest.file_unique_id
+
+
+def fit_caption(text: str, cargo: Optional[str]) -> str:
+    """Укоротить описание груза, чтобы текст поместился в подпись к фото.
+
+    Длина считается вместе с HTML-разметкой, то есть с запасом.
+    """
+    overflow = len(text) - CAPTION_LIMIT
+    if overflow <= 0 or not cargo:
+        return text
+    return text.replace(cargo, cargo[:max(len(cargo) - overflow - 1, 0)] + "…", 1)
+
+
+file_ids = FileIdCache(FILE_ID_CACHE_SIZE)
@@ -0,0 +1,195 @@
+import heapq
+import logging
+from bisect import bisect_left, insort
+from itertools import chain
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from states import OrderStatus, OPEN_ORDER_STATUSES
+
+logger = logging.getLogger(__name__)
+
+
+class OrderRecord:
+    """Незавершенный заказ в памяти (поля совпадают с колонками orders)."""
+    __slots__ = (
+        "id", "customer_id", "cargo", "from_addr", "to_addr", "phone", "status",
+        "driver_id", "tg_chat_id", "tg_message_id", "reserved_until", "created_at",
+        "posted_at", "photo_file_id", "photo_unique_id", "region",
+    )
+
+    def __init__(self, row: Mapping[str, Any]):
+        for field in self.__slots__:
+            setattr(self, field, row.get(field))
+        self.status = OrderStatus(self.status)
+        self.created_at = self.created_at or 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, OrderRecord):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+
+class OrderBook:
+    """Все незавершенные заказы процесса.
+
+    Индексы: словарь по id и для каждого статуса список (created_at, id),
+    отсортированный по времени создания. Книга меняется только методами
+    Database после успешной записи в БД; завершенные заказы из нее
+    удаляются. Расхождение с БД (например, записи другого процесса)
+    находит и исправляет reconcile().
+
+    Подписчики (subscribe) узнают об изменении заказа по его id;
+    None означает, что книга перезагружена целиком.
+
+    exact — книга загружена из БД и других писателей нет; только тогда
+    отсутствие заказа в статусе ожидания можно не перепроверять в БД.
+    """
+
+    def __init__(self):
+        self._by_id: Dict[int, OrderRecord] = {}
+        self._by_status: Dict[OrderStatus, List[Tuple[int, int]]] = {
+            status: [] for status in OPEN_ORDER_STATUSES
+        }
+        self.drift = 0
+        self.exact = False
+        self._listeners: List[Callable[[Optional[int]], None]] = []
+
+    def subscribe(self, listener: Callable[[Optional[int]], None]) -> None:
+        self._listeners.append(listener)
+
+    def _changed(self, order_id: Optional[int]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(order_id)
+            except Exception as e:
+                logger.error("Order book listener failed: %s", e)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, order_id: int) -> bool:
+        return order_id in self._by_id
+
+    def get(self, order_id: int) -> Optional[OrderRecord]:
+        return self._by_id.get(order_id)
+
+    def count(self, status: OrderStatus) -> int:
+        return len(self._by_status.get(status, ()))
+
+    def _index(self, record: OrderRecord) -> None:
+        insort(self._by_status[record.status], (record.created_at, record.id))
+
+    def _unindex(self, record: OrderRecord) -> None:
+        index = self._by_status[record.status]
+        pos = bisect_left(index, (record.created_at, record.id))
+        if pos < len(index) and index[pos][1] == record.id:
+            del index[pos]
+
+    def apply(self, row: Mapping[str, Any]) -> None:
+        """Применить состояние заказа из БД: добавить, обновить или удалить."""
+        status = OrderStatus(row["status"])
+        if status not in OPEN_ORDER_STATUSES:
+            self.remove(row["id"])
+            return
+
+        record = self._by_id.get(row["id"])
+        if record is None:
+            record = OrderRecord(row)
+            self._by_id[record.id] = record
+            self._index(record)
+            self._changed(record.id)
+            return
+
+        self._unindex(record)
+        for field in OrderRecord.__slots__:
+            if field in row:
+                setattr(record, field, row[field])
+        record.status = status
+        record.created_at = record.created_at or 0
+        self._index(record)
+        self._changed(record.id)
+
+    def update(self, order_id: int, **fields: Any) -> None:
+        """Обновить поля заказа, не затрагивающие индексы (сообщение в канале)."""
+        record = self._by_id.get(order_id)
+        if record is not None:
+            for field, value in fields.items():
+                setattr(record, field, value)
+        self._changed(order_id)
+
+    def remove(self, order_id: int) -> None:
+        # Подписчики уведомляются, даже если заказа в книге не было:
+        # карточка завершенного заказа все равно изменилась
+        record = self._by_id.pop(order_id, None)
+        if record is not None:
+            self._unindex(record)
+        self._changed(order_id)
+
+    def is_waiting(self, order_id: int) -> Optional[bool]:
+        """Ожидает ли заказ водителя; None — заказа в книге нет."""
+        record = self._by_id.get(order_id)
+        if record is None:
+            return None
+        return record.status == OrderStatus.WAITING_DRIVER
+
+    def newest(
+        self, status: OrderStatus = OrderStatus.WAITING_DRIVER, limit: int = 20
+    ) -> List[OrderRecord]:
+        """Заказы в статусе status, новые первыми."""
+        index = self._by_status.get(status, [])
+        if limit <= 0:
+            return []
+        return [self._by_id[order_id] for _, order_id in reversed(index[-limit:])]
+
+    def oldest(
+        self, status: OrderStatus = OrderStatus.WAITING_DRIVER, limit: int = 20
+    ) -> List[OrderRecord]:
+        """Заказы в статусе status, давно созданные первыми."""
+        index = self._by_status.get(status, [])
+        return [self._by_id[order_id] for _, order_id in index[:limit]] if limit > 0 else []
+
+    def newest_open(self, limit: int = 50) -> List[OrderRecord]:
+        """Незавершенные заказы во всех статусах, новые первыми."""
+        keys = heapq.nlargest(limit, chain.from_iterable(self._by_status.values()))
+        return [self._by_id[order_id] for _, order_id in keys]
+
+    def for_driver(self, driver_id: int) -> List[OrderRecord]:
+        """Незавершенные заказы водителя."""
+        return [record for record in self._by_id.values() if record.driver_id == driver_id]
+
+    def load(self, rows: Iterable[Mapping[str, Any]]) -> None:
+        """Заменить содержимое книги строками из БД."""
+        self._by_id.clear()
+        for index in self._by_status.values():
+            index.clear()
+        for row in rows:
+            record = OrderRecord(row)
+            if record.status in OPEN_ORDER_STATUSES:
+                self._by_id[record.id] = record
+                self._by_status[record.status].append((record.created_at, record.id))
+        for index in self._by_status.values():
+            index.sort()
+        self._changed(None)
+
+    def reconcile(self, rows: Iterable[Mapping[str, Any]]) -> int:
+        """Сверить книгу со строками из БД и заменить ее ими.
+
+        Возвращает число расходящихся заказов (лишних, недостающих
+        или отличающихся) и накапливает его в self.drift.
+        """
+        fresh = {row["id"]: OrderRecord(row) for row in rows}
+        drift = len(self._by_id.keys() - fresh.keys())
+        drift += sum(
+            1 for order_id, record in fresh.items()
+            if self._by_id.get(order_id) != record
+        )
+        self.load(record.as_dict() for record in fresh.values())
+        self.drift += drift
+        return drift
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Все заказы книги строками (для снимка при остановке)."""
+        return [record.as_dict() for record in self._by_id.values()]
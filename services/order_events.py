@@ -0,0 +1,141 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Mapping, Optional, Set, Tuple
+
+from states import OrderStatus
+
+logger = logging.getLogger(__name__)
+
+# Событие для перехода transition_order в статус
+TRANSITION_EVENTS = {
+    OrderStatus.WAITING_DRIVER: "posted",
+    OrderStatus.COMPLETED: "confirmed",
+    OrderStatus.CANCELLED: "cancelled",
+    OrderStatus.EXPIRED: "expired",
+}
+
+
+class Subscriber:
+    """Очередь событий одного клиента с ограниченным буфером."""
+
+    def __init__(self, buffer: int):
+        self.queue: "asyncio.Queue[Optional[Tuple[int, str, str]]]" = asyncio.Queue(buffer)
+
+    def close(self) -> None:
+        """Освободить буфер и разбудить читателя пустым событием."""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class OrderEventHub:
+    """Публикация событий заказов подписчикам внутри процесса.
+
+    Каждое событие получает возрастающий id и попадает в историю
+    ограниченной длины, из которой переподключившийся клиент дочитывает
+    пропущенное (Last-Event-ID). id начинаются с текущего времени в
+    миллисекундах, поэтому после перезапуска они не идут заново с нуля.
+    Клиент, чей буфер переполнен, отключается: он не должен задерживать
+    ни публикацию, ни остальных подписчиков.
+    """
+
+    def __init__(self, buffer: int = 256, history: int = 1000):
+        self.buffer = buffer
+        self._history: Deque[Tuple[int, str, str]] = deque(maxlen=history)
+        self._subscribers: Set[Subscriber] = set()
+        self._last_id = int(time.time() * 1000)
+        self.published = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, kind: str, order: Mapping[str, Any]) -> None:
+        """Опубликовать событие kind по заказу (строке orders)."""
+        status = order.get("status")
+        data = json.dumps({
+            "order_id": order["id"],
+            "status": OrderStatus(status).name if status is not None else None,
+            "customer_id": order.get("customer_id"),
+            "driver_id": order.get("driver_id"),
+            "at": int(time.time()),
+        }, separators=(",", ":"))
+        self._last_id += 1
+        event = (self._last_id, kind, data)
+        self._history.append(event)
+        self.published += 1
+
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._drop(subscriber)
+
+    def _drop(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+        subscriber.close()
+        self.dropped += 1
+        logger.warning("Dropped slow order event subscriber")
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> Tuple[Subscriber, bool]:
+        """Подписаться на события после last_event_id.
+
+        Возвращает подписчика и флаг полноты: False, если часть событий
+        уже ушла из истории и клиенту нужно перечитать состояние заново.
+        """
+        subscriber = Subscriber(self.buffer)
+        complete = True
+        if last_event_id is not None:
+            oldest = self._history[0][0] if self._history else self._last_id + 1
+            complete = last_event_id >= oldest - 1
+            missed = [event for event in self._history if event[0] > last_event_id]
+            if len(missed) > self.buffer:
+                missed, complete = missed[-self.buffer:], False
+            for event in missed:
+                subscriber.queue.put_nowait(event)
+        self._subscribers.add(subscriber)
+        return subscriber, complete
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+
+    def close(self) -> None:
+        """Отключить всех подписчиков (при остановке)."""
+        for subscriber in list(self._subscribers):
+            self._subscribers.discard(subscriber)
+            subscriber.close()
+
+
+def format_sse(event_id: Optional[int], kind: str, data: str) -> bytes:
+    """Событие в формате text/event-stream."""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {kind}\ndata: {data}\n\n".encode("utf-8")
+
+
+async def sse_stream(
+    hub: OrderEventHub,
+    last_event_id: Optional[int] = None,
+    keepalive: float = 15.0
+) -> AsyncIterator[bytes]:
+    """Поток событий для одного клиента до его отключения или сброса."""
+    subscriber, complete = hub.subscribe(last_event_id)
+    try:
+        # Браузер переподключится через 3 секунды с Last-Event-ID
+        yield b"retry: 3000\n\n"
+        if not complete:
+            yield format_sse(None, "reset", "{}")
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                # Комментарий не дает прокси закрыть простаивающее соединение
+                yield b": ping\n\n"
+                continue
+            if event is None:
+                return
+            yield format_sse(*event)
+    finally:
+        hub.unsubscribe(subscriber)
@@ -0,0 +1,106 @@
+import time
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+
+class PresenceTracker:
+    """Водители на смене и время их последней активности.
+
+    Водитель доступен, если он на смене и проявлял активность (любой
+    апдейт) не дольше ttl секунд назад. Доступные водители лежат в
+    словаре в порядке последней активности: устаревшие снимаются с
+    начала словаря, поэтому список доступных строится за O(доступных),
+    без обхода всех водителей на смене.
+
+    Изменения копятся в _dirty (по одной записи на водителя, сколько бы
+    апдейтов он ни прислал) и сбрасываются в БД пачкой (см. drain_dirty).
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._on_shift: Dict[int, float] = {}
+        # Доступные: водитель на смене -> время последней активности
+        self._alive: Dict[int, float] = {}
+        # Изменения для БД: водитель -> время активности (None — ушел со смены)
+        self._dirty: Dict[int, Optional[float]] = {}
+        self.heartbeats = 0
+
+    def __len__(self) -> int:
+        return len(self._on_shift)
+
+    def is_on_shift(self, driver_id: int) -> bool:
+        return driver_id in self._on_shift
+
+    def _expire(self, now: float) -> None:
+        alive = self._alive
+        while alive:
+            oldest = next(iter(alive))
+            if now - alive[oldest] <= self.ttl:
+                break
+            del alive[oldest]
+
+    def _touch(self, driver_id: int, now: float) -> None:
+        self._on_shift[driver_id] = now
+        # Вставка заново переносит водителя в конец порядка активности
+        self._alive.pop(driver_id, None)
+        self._alive[driver_id] = now
+        self._dirty[driver_id] = now
+
+    def heartbeat(self, driver_id: int) -> None:
+        """Учесть активность пользователя (для не водителей на смене — no-op)."""
+        if driver_id not in self._on_shift:
+            return
+        self.heartbeats += 1
+        self._touch(driver_id, time.time())
+
+    def start_shift(self, driver_id: int) -> None:
+        self._touch(driver_id, time.time())
+
+    def end_shift(self, driver_id: int) -> None:
+        self._on_shift.pop(driver_id, None)
+        self._alive.pop(driver_id, None)
+        self._dirty[driver_id] = None
+
+    def available(self, limit: Optional[int] = None) -> List[int]:
+        """Доступные водители, недавно активные первыми."""
+        self._expire(time.time())
+        drivers = []
+        for driver_id in reversed(self._alive):
+            if limit is not None and len(drivers) >= limit:
+                break
+            drivers.append(driver_id)
+        return drivers
+
+    def is_available(self, driver_id: int) -> bool:
+        last_seen = self._alive.get(driver_id)
+        return last_seen is not None and time.time() - last_seen <= self.ttl
+
+    def count_available(self) -> int:
+        self._expire(time.time())
+        return len(self._alive)
+
+    def last_seen(self, driver_id: int) -> Optional[float]:
+        return self._on_shift.get(driver_id)
+
+    def load(self, rows: Iterable[Mapping[str, Any]]) -> None:
+        """Заполнить по строкам driver_presence (user_id, last_seen)."""
+        self._on_shift.clear()
+        self._alive.clear()
+        now = time.time()
+        for row in sorted(rows, key=lambda row: row["last_seen"]):
+            self._on_shift[row["user_id"]] = row["last_seen"]
+            if now - row["last_seen"] <= self.ttl:
+                self._alive[row["user_id"]] = row["last_seen"]
+
+    def drain_dirty(self) -> Tuple[List[Tuple[int, int]], List[int]]:
+        """Забрать накопленные изменения: (upsert (id, last_seen), удалить id)."""
+        dirty, self._dirty = self._dirty, {}
+        upserts = [(driver_id, int(seen)) for driver_id, seen in dirty.items() if seen is not None]
+        removed = [driver_id for driver_id, seen in dirty.items() if seen is None]
+        return upserts, removed
+
+    def restore_dirty(self, upserts: List[Tuple[int, int]], removed: List[int]) -> None:
+        """Вернуть несохраненные изменения (более свежие не затираются)."""
+        for driver_id, seen in upserts:
+            self._dirty.setdefault(driver_id, seen)
+        for driver_id in removed:
+            self._dirty.setdefault(driver_id, None)
@@ -0,0 +1,82 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+def make_etag(body: bytes) -> str:
+    """Сильный ETag по содержимому ответа."""
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Совпадает ли заголовок If-None-Match с ETag (в том числе "*" и списки)."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Слабое сравнение, как требует RFC 9110 для If-None-Match
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class ResponseCache:
+    """Небольшой LRU-кэш готовых JSON-ответов с их ETag.
+
+    Ключ — путь запроса (например, "order:42"). Записи сбрасываются при
+    изменении заказа (см. invalidate_order) и по истечении ttl секунд
+    на случай изменений, о которых кэш не узнает (например, username).
+
+    generation растет при каждом сбросе: ответ, собранный до сброса,
+    сохранять нельзя (put с устаревшим поколением ничего не делает).
+    """
+
+    def __init__(self, capacity: int = 256, ttl: float = 30.0):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str, bytes]]" = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Tuple[str, bytes]]:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1], entry[2]
+
+    def put(self, key: str, body: bytes, generation: Optional[int] = None) -> str:
+        """Сохранить ответ и вернуть его ETag.
+
+        generation — значение self.generation до сборки ответа; если с тех
+        пор кэш сбрасывался, ответ мог устареть и не сохраняется.
+        """
+        etag = make_etag(body)
+        if generation is not None and generation != self.generation:
+            self.stale += 1
+            return etag
+        self._entries[key] = (time.monotonic(), etag, body)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+        return etag
+
+    def invalidate_order(self, order_id: Optional[int]) -> None:
+        """Сбросить ответы, которые могли измениться вместе с заказом.
+
+        Карточка заказа сбрасывается по id, списки — все: заказ мог
+        появиться в них или пропасть. order_id=None сбрасывает весь кэш.
+        """
+        self.generation += 1
+        if order_id is None:
+            self._entries.clear()
+            return
+        self._entries.pop(f"order:{order_id}", None)
+        for key in [key for key in self._entries if not key.startswith("order:")]:
+            del self._entries[key]
@@ -0,0 +1,85 @@
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+# Счетчики строки агрегата
+ROLLUP_COUNTERS = ("created", "reserved", "confirmed", "released", "cancelled", "wait_seconds")
+
+
+def _ratio(part: int, total: int) -> Optional[float]:
+    return round(part / total, 3) if total else None
+
+
+def _totals(rows: Iterable[Mapping[str, Any]]) -> Dict[str, int]:
+    totals = dict.fromkeys(ROLLUP_COUNTERS, 0)
+    for row in rows:
+        for counter in ROLLUP_COUNTERS:
+            totals[counter] += row[counter]
+    return totals
+
+
+def _metrics(totals: Mapping[str, int]) -> Dict[str, Any]:
+    """Показатели по сумме счетчиков."""
+    return {
+        "orders": totals["created"],
+        "reservations": totals["reserved"],
+        "confirmed": totals["confirmed"],
+        "released": totals["released"],
+        "cancelled": totals["cancelled"],
+        "avg_wait_seconds": (
+            round(totals["wait_seconds"] / totals["reserved"]) if totals["reserved"] else None
+        ),
+        "confirm_rate": _ratio(totals["confirmed"], totals["reserved"]),
+    }
+
+
+def summarize(
+    daily: Iterable[Mapping[str, Any]],
+    hourly: Iterable[Mapping[str, Any]]
+) -> Dict[str, Any]:
+    """Собрать показатели из строк order_stats_daily и order_stats_hourly.
+
+    Работает только с агрегатами, поэтому стоимость зависит от длины окна
+    и числа моделей машин, а не от числа заказов в истории.
+    """
+    daily = list(daily)
+
+    by_day: Dict[int, list] = {}
+    by_model: Dict[str, list] = {}
+    for row in daily:
+        by_day.setdefault(row["bucket"], []).append(row)
+        if row["car_model"]:
+            by_model.setdefault(row["car_model"], []).append(row)
+
+    days = []
+    for bucket in sorted(by_day):
+        day = datetime.fromtimestamp(bucket, tz=timezone.utc).strftime("%Y-%m-%d")
+        days.append({"day": day, **_metrics(_totals(by_day[bucket]))})
+
+    car_models = []
+    for car_model in sorted(by_model):
+        totals = _totals(by_model[car_model])
+        car_models.append({
+            "car_model": car_model,
+            "reservations": totals["reserved"],
+            "confirmed": totals["confirmed"],
+            "released": totals["released"],
+            "confirm_rate": _ratio(totals["confirmed"], totals["reserved"]),
+            "cancel_rate": _ratio(totals["released"], totals["reserved"]),
+        })
+
+    return {
+        "generated_at": int(time.time()),
+        "window": _metrics(_totals(daily)),
+        "last_24h": _metrics(_totals(hourly)),
+        "days": days,
+        "car_models": car_models,
+    }
+
+
+async def collect_stats(db, days: int) -> Dict[str, Any]:
+    """Показатели за последние days суток и последние 24 часа."""
+    now = int(time.time())
+    daily = await db.get_rollups(86400, now - (days - 1) * 86400)
+    hourly = await db.get_rollups(3600, now - 23 * 3600)
+    return summarize(daily, hourly)
@@ -0,0 +1,117 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class Rule:
+    """Лимит: не больше rate запросов за per секунд (с накоплением до rate)."""
+    __slots__ = ("rate", "per", "refill")
+
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self.refill = rate / per
+
+    def __repr__(self) -> str:
+        return f"{self.rate}/{self.per:g}"
+
+
+def parse_rules(spec: str) -> Dict[str, Rule]:
+    """Разобрать "orders=3/10,take=3/30,*=20/10" в словарь ключ -> Rule."""
+    rules = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        key, _, limit = item.partition("=")
+        rate, _, per = limit.partition("/")
+        rules[key.strip().lower()] = Rule(int(rate), float(per or 1))
+    return rules
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "notified")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+        self.notified = False
+
+
+class TokenBucketLimiter:
+    """Token bucket на пару (пользователь, ключ команды).
+
+    Корзины лежат в словаре в порядке последнего обращения. Корзина,
+    которую не трогали дольше времени полного пополнения, ничем не
+    отличается от новой, поэтому такие корзины снимаются с начала
+    словаря при каждом обращении — память зависит только от числа
+    недавно активных пользователей.
+    """
+
+    def __init__(self, rules: Dict[str, Rule], offenders_limit: int = 1000):
+        self.rules = rules
+        self.default = rules.get("*")
+        self._buckets: Dict[Tuple[int, str], _Bucket] = {}
+        # Корзина старше этого возраста полностью пополнена
+        self._ttl = max((rule.per for rule in rules.values()), default=0)
+        self.suppressed = 0
+        self.offenders: Dict[int, int] = {}
+        self.offenders_limit = offenders_limit
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def rule_for(self, key: str) -> Tuple[str, Optional[Rule]]:
+        rule = self.rules.get(key)
+        if rule is not None:
+            return key, rule
+        return "*", self.default
+
+    def _expire(self, now: float) -> None:
+        buckets = self._buckets
+        while buckets:
+            oldest = next(iter(buckets))
+            if now - buckets[oldest].updated <= self._ttl:
+                break
+            del buckets[oldest]
+
+    def hit(self, user_id: int, key: str) -> Tuple[bool, bool, float]:
+        """Учесть запрос пользователя.
+
+        Возвращает (разрешен, нужно ли уведомить, секунд до следующего
+        токена). Уведомление нужно только для первого отказа подряд.
+        """
+        key, rule = self.rule_for(key)
+        if rule is None:
+            return True, False, 0.0
+        now = time.monotonic()
+        self._expire(now)
+
+        bucket = self._buckets.pop((user_id, key), None)
+        if bucket is None:
+            bucket = _Bucket(rule.rate, now)
+        else:
+            bucket.tokens = min(rule.rate, bucket.tokens + (now - bucket.updated) * rule.refill)
+            bucket.updated = now
+        # Вставка заново переносит корзину в конец порядка обращений
+        self._buckets[(user_id, key)] = bucket
+
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            bucket.notified = False
+            return True, False, 0.0
+
+        self.suppressed += 1
+        self._count_offender(user_id)
+        notify = not bucket.notified
+        bucket.notified = True
+        return False, notify, (1 - bucket.tokens) / rule.refill
+
+    def _count_offender(self, user_id: int) -> None:
+        offenders = self.offenders
+        offenders[user_id] = offenders.get(user_id, 0) + 1
+        if len(offenders) > self.offenders_limit:
+            # Оставляем половину с наибольшим числом отказов
+            keep = sorted(offenders.items(), key=lambda item: item[1], reverse=True)
+            self.offenders = dict(keep[:self.offenders_limit // 2])
+
+    def top_offenders(self, limit: int = 10) -> List[Tuple[int, int]]:
+        return sorted(self.offenders.items(), key=lambda item: item[1], reverse=True)[:limit]
@@ -0,0 +1,241 @@
+import functools
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from config import TRACE_SAMPLE_RATE, TRACE_BUFFER, TRACE_FILE
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """Замер одного шага: обработчик, запрос к БД, запрос к Bot API."""
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attrs",
+                 "start", "duration_ms", "error", "_started")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, attrs: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration_ms: Optional[float] = None
+        self.error: Optional[str] = None
+        self._started = time.perf_counter()
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": self.duration_ms,
+        }
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+# Текущий span задачи asyncio; None — апдейт не попал в выборку
+_current: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+
+class _NoopScope:
+    """Замена span вне трассировки: вход и выход ничего не делают."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopScope()
+
+
+class _SpanScope:
+    __slots__ = ("tracer", "span", "token")
+
+    def __init__(self, tracer: "Tracer", span: Span):
+        self.tracer = tracer
+        self.span = span
+        self.token = None
+
+    def __enter__(self) -> Span:
+        self.token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        span = self.span
+        span.duration_ms = round((time.perf_counter() - span._started) * 1000, 3)
+        if exc_type is not None and not issubclass(exc_type, GeneratorExit):
+            span.error = f"{exc_type.__name__}: {exc}"
+        _current.reset(self.token)
+        self.tracer.export(span)
+        return False
+
+
+class RingExporter:
+    """Последние spans в памяти (для /debug/traces)."""
+
+    def __init__(self, capacity: int):
+        self._spans: deque = deque(maxlen=capacity)
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    def export(self, span: Span) -> None:
+        self._spans.append(span)
+
+    def traces(self, trace_id: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """Трассы, новые первыми; spans каждой трассы — по времени начала."""
+        grouped: Dict[str, List[Span]] = {}
+        for span in reversed(self._spans):
+            if trace_id is not None and span.trace_id != trace_id:
+                continue
+            if span.trace_id not in grouped and len(grouped) >= limit:
+                continue
+            grouped.setdefault(span.trace_id, []).append(span)
+        result = []
+        for spans in grouped.values():
+            spans.sort(key=lambda span: span.start)
+            root = next((span for span in spans if span.parent_id is None), spans[0])
+            result.append({
+                "trace_id": root.trace_id,
+                "name": root.name,
+                "duration_ms": root.duration_ms,
+                "spans": [span.as_dict() for span in spans],
+            })
+        return result
+
+
+class JsonlExporter:
+    """Spans построчно в файл JSONL; запись — в отдельном потоке."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: "queue.SimpleQueue[Optional[Span]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span) -> None:
+        self._queue.put(span)
+
+    def _write(self) -> None:
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                while True:
+                    span = self._queue.get()
+                    if span is None:
+                        break
+                    f.write(json.dumps(span.as_dict(), ensure_ascii=False, default=str) + "\n")
+                    # Пачку, накопившуюся в очереди, пишем без сброса после каждой строки
+                    if self._queue.empty():
+                        f.flush()
+        except OSError as e:
+            logger.error("Trace exporter stopped: %s", e)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+
+class Tracer:
+    """Трассировка апдейтов с выборкой по sample_rate.
+
+    Решение о выборке принимается в корне (trace). Вне выбранной трассы
+    span() возвращает общий пустой контекст, поэтому при sample_rate=0
+    цена инструментирования — одно чтение contextvar.
+    """
+
+    def __init__(self, sample_rate: float, exporters: List[Any]):
+        self.sample_rate = sample_rate
+        self.exporters = exporters
+        self.ring = next((e for e in exporters if isinstance(e, RingExporter)), None)
+        self.sampled = 0
+
+    def export(self, span: Span) -> None:
+        for exporter in self.exporters:
+            exporter.export(span)
+
+    def trace(self, name: str, **attrs: Any):
+        """Корневой span новой трассы, если она попала в выборку."""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return _NOOP
+        self.sampled += 1
+        return _SpanScope(self, Span(f"{random.getrandbits(128):032x}", None, name, attrs))
+
+    def resume(self, parent: Optional[Span], name: str, **attrs: Any):
+        """Продолжить трассу parent в другой задаче (например, в подписчике шины)."""
+        if parent is None:
+            return _NOOP
+        return _SpanScope(self, Span(parent.trace_id, parent.span_id, name, attrs))
+
+    def span(self, name: str, **attrs: Any):
+        """Дочерний span текущей трассы (или пустой контекст)."""
+        parent = _current.get()
+        if parent is None:
+            return _NOOP
+        return _SpanScope(self, Span(parent.trace_id, parent.span_id, name, attrs))
+
+    def close(self) -> None:
+        for exporter in self.exporters:
+            if hasattr(exporter, "close"):
+                exporter.close()
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def annotate(**attrs: Any) -> None:
+    """Добавить атрибуты к текущему span."""
+    span = _current.get()
+    if span is not None:
+        span.attrs.update(attrs)
+
+
+def sql_summary(sql: str, limit: int = 200) -> str:
+    """Запрос одной строкой без лишних пробелов (для атрибута span)."""
+    return " ".join(sql.split())[:limit]
+
+
+def traced_query(method: Callable) -> Callable:
+    """Обернуть метод исполнителя запросов в span "db.<метод>".
+
+    Вне трассы обертка возвращает корутину самого метода, без лишнего
+    кадра на каждый запрос.
+    """
+    name = f"db.{method.__name__}"
+
+    async def traced(self, sql: str, *args, **kwargs):
+        with tracer.span(name, sql=sql_summary(sql)):
+            return await method(self, sql, *args, **kwargs)
+
+    @functools.wraps(method)
+    def wrapper(self, sql: str, *args, **kwargs):
+        if _current.get() is None:
+            return method(self, sql, *args, **kwargs)
+        return traced(self, sql, *args, **kwargs)
+    return wrapper
+
+
+def create_tracer(sample_rate: float, buffer: int, path: Optional[str]) -> Tracer:
+    exporters: List[Any] = [RingExporter(buffer)]
+    if path and sample_rate > 0:
+        exporters.append(JsonlExporter(path))
+    return Tracer(sample_rate, exporters)
+
+
+tracer = create_tracer(TRACE_SAMPLE_RATE, TRACE_BUFFER, TRACE_FILE)
@@ -1,18 +1,80 @@
 from aiogram.fsm.state import State, StatesGroup
-from enum import Enum, auto
+from enum import Enum, IntEnum
 from datetime import datetime
-from typing import Optional
+from typing import Dict, FrozenSet, Optional, Tuple
 
 
-class OrderStatus(Enum):
-    """Статусы заказа"""
-    CREATED = auto()            # Заказ создан
-    WAITING_DRIVER = auto()     # Ожидает водителя
-    DRIVER_ASSIGNED = auto()    # Водитель назначен
-    IN_PROGRESS = auto()        # В процессе выполнения
-    COMPLETED = auto()          # Завершен
-    CANCELLED = auto()          # Отменен
-    EXPIRED = auto()            # Время на подтверждение истекло
+class OrderStatus(IntEnum):
+    """Статусы заказа (значения хранятся в БД, менять их нельзя)"""
+    CREATED = 1                 # Заказ создан
+    WAITING_DRIVER = 2          # Ожидает водителя
+    DRIVER_ASSIGNED = 3         # Водитель назначен
+    IN_PROGRESS = 4             # В процессе выполнения
+    COMPLETED = 5               # Завершен
+    CANCELLED = 6               # Отменен
+    EXPIRED = 7                 # Время на подтверждение истекло
+
+    @property
+    def is_open(self) -> bool:
+        """Заказ еще не завершен."""
+        return self in OPEN_ORDER_STATUSES
+
+    def can_transition_to(self, new_status: "OrderStatus") -> bool:
+        """Разрешен ли переход в new_status."""
+        return new_status in ORDER_TRANSITIONS[self]
+
+
+# Допустимые переходы между статусами заказа
+ORDER_TRANSITIONS: Dict[OrderStatus, FrozenSet[OrderStatus]] = {
+    OrderStatus.CREATED: frozenset({
+        OrderStatus.WAITING_DRIVER, OrderStatus.CANCELLED,
+    }),
+    OrderStatus.WAITING_DRIVER: frozenset({
+        OrderStatus.DRIVER_ASSIGNED, OrderStatus.CANCELLED, OrderStatus.EXPIRED,
+    }),
+    OrderStatus.DRIVER_ASSIGNED: frozenset({
+        OrderStatus.WAITING_DRIVER,   # водитель отказался или не успел
+        OrderStatus.IN_PROGRESS, OrderStatus.COMPLETED, OrderStatus.CANCELLED,
+    }),
+    OrderStatus.IN_PROGRESS: frozenset({
+        OrderStatus.COMPLETED, OrderStatus.CANCELLED,
+    }),
+    OrderStatus.COMPLETED: frozenset(),
+    OrderStatus.CANCELLED: frozenset(),
+    OrderStatus.EXPIRED: frozenset(),
+}
+
+OPEN_ORDER_STATUSES: FrozenSet[OrderStatus] = frozenset(
+    status for status, targets in ORDER_TRANSITIONS.items() if targets
+)
+FINISHED_ORDER_STATUSES: FrozenSet[OrderStatus] = frozenset(OrderStatus) - OPEN_ORDER_STATUSES
+
+
+def transition_sources(new_status: OrderStatus) -> Tuple[OrderStatus, ...]:
+    """Статусы, из которых разрешен переход в new_status."""
+    return tuple(sorted(
+        status for status, targets in ORDER_TRANSITIONS.items() if new_status in targets
+    ))
+
+
+# Подписи статусов для пользователей
+ORDER_STATUS_TITLES: Dict[OrderStatus, str] = {
+    OrderStatus.CREATED: "создан",
+    OrderStatus.WAITING_DRIVER: "ожидает водителя",
+    OrderStatus.DRIVER_ASSIGNED: "взят водителем",
+    OrderStatus.IN_PROGRESS: "в процессе доставки",
+    OrderStatus.COMPLETED: "завершен",
+    OrderStatus.CANCELLED: "отменен",
+    OrderStatus.EXPIRED: "истекло время ожидания",
+}
+
+# Строковые статусы, которые писались в БД до перехода на числа
+LEGACY_ORDER_STATUSES: Dict[str, OrderStatus] = {
+    "created": OrderStatus.CREATED,
+    "reserved": OrderStatus.DRIVER_ASSIGNED,
+    "completed": OrderStatus.COMPLETED,
+    **{status.name: status for status in OrderStatus},
+}
 
 
 class UserRole(Enum):
@@ -25,6 +87,7 @@ class OrderState(StatesGroup):
     """Состояния для процесса создания заказа"""
     waiting_for_cargo = State()      # Ожидание описания груза
     waiting_for_from = State()       # Ожидание адреса забора груза
+    waiting_for_region = State()     # Выбор региона (если не определился по адресу)
     waiting_for_to = State()         # Ожидание адреса доставки
     waiting_for_phone = State()      # Ожидание номера телефона
     confirm_order = State()          # Подтверждение заказа
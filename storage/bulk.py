@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence
+
+from states import OrderStatus
+from storage.common import BULK_LOAD_INDEXES, ORDER_COLUMNS, status_list, unix_now
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+class BulkMixin:
+    """Массовая загрузка пользователей и заказов и потоковая выгрузка заказов.
+
+    Часть Database: использует self.sql, transaction() и read_connection().
+    """
+
+    # ===== Bulk Import =====
+
+    async def import_users(self, rows: Sequence[Sequence], chunk_size: int = 1000) -> int:
+        """Загрузить пользователей пачками executemany, по транзакции на пачку.
+
+        rows — кортежи (user_id, username, first_name, last_name, role,
+        phone, car_model); существующие пользователи обновляются.
+        """
+        now = unix_now()
+        for start in range(0, len(rows), chunk_size):
+            chunk = [(*row, now) for row in rows[start:start + chunk_size]]
+            async with self.transaction() as sql:
+                await sql.executemany(self.UPSERT_USER_SQL, chunk)
+            # Обработчики апдейтов получают базу между пачками
+            await asyncio.sleep(0)
+        return len(rows)
+
+    async def import_orders(
+        self,
+        rows: Sequence[Sequence],
+        chunk_size: int = 1000,
+        rebuild_indexes: bool = False
+    ) -> int:
+        """Загрузить исторические (завершенные) заказы пачками executemany.
+
+        rows — кортежи (customer_id, cargo, from_addr, to_addr, phone, status,
+        driver_id, created_at, finished_at); id назначает база. Недостающие
+        заказчики и водители создаются с ролью по умолчанию.
+        rebuild_indexes снимает вторичные индексы orders на время загрузки
+        и строит их заново одним проходом в конце. Если пачка не загрузилась,
+        уже закоммиченные пачки остаются и учитываются в customer_stats и
+        агрегатах.
+        """
+        if rebuild_indexes:
+            async with self.transaction() as sql:
+                for name in BULK_LOAD_INDEXES:
+                    await sql.execute(f"DROP INDEX IF EXISTS {name}")
+        committed = 0
+        try:
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                users = {(row[0], "customer") for row in chunk}
+                users |= {(row[6], "driver") for row in chunk if row[6] is not None}
+                async with self.transaction() as sql:
+                    await sql.executemany(
+                        "INSERT INTO users (user_id, role) VALUES (?, ?) "
+                        "ON CONFLICT (user_id) DO NOTHING",
+                        sorted(users)
+                    )
+                    await sql.executemany("""
+                        INSERT INTO orders (
+                            customer_id, cargo, from_addr, to_addr, phone, status,
+                            driver_id, created_at, updated_at, posted_at, finished_at
+                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, [
+                        (*row[:8], row[8] or row[7], row[7], row[8])
+                        for row in chunk
+                    ])
+                committed += len(chunk)
+                await asyncio.sleep(0)
+        finally:
+            if rebuild_indexes:
+                async with self.transaction() as sql:
+                    for statement in self.SCHEMA_INDEXES:
+                        await sql.execute(statement)
+            if committed < len(rows):
+                logger.error("Order import stopped after %s of %s rows", committed, len(rows))
+            # Производные данные пересчитываются один раз на весь импорт
+            if committed:
+                await self._ensure_customer_stats(rebuild=True)
+                await self._roll_up_imported(rows[:committed])
+        return committed
+
+    # ===== Export =====
+
+    async def iter_orders(
+        self,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        statuses: Optional[Iterable[OrderStatus]] = None,
+        batch_size: int = 500
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Заказы в форме get_order пачками по batch_size (архив, затем orders).
+
+        Фильтр — created_at в [since, until) и статусы. Строки идут в порядке
+        первичного ключа, без сортировки результата, поэтому память не
+        зависит от объема выгрузки.
+        """
+        conditions, params = [], []
+        if since is not None:
+            conditions.append("o.created_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("o.created_at < ?")
+            params.append(until)
+        if statuses:
+            conditions.append(f"o.status IN ({status_list(statuses)})")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        columns = ", ".join(f"o.{column.strip()}" for column in ORDER_COLUMNS.split(","))
+
+        async with self.read_connection() as sql:
+            for table in ("orders_archive", "orders"):
+                query = f"""
+                    SELECT {columns},
+                           c.username as customer_username,
+                           c.phone as customer_phone,
+                           d.username as driver_username
+                    FROM {table} o
+                    LEFT JOIN users c ON o.customer_id = c.user_id
+                    LEFT JOIN users d ON o.driver_id = d.user_id
+                    {where}
+                    ORDER BY o.id
+                """
+                async for batch in sql.stream(query, params, batch_size):
+                    yield batch
@@ -0,0 +1,68 @@
+import time
+from typing import Iterable, Optional
+
+from services.order_book import OrderRecord
+from states import OrderStatus, OPEN_ORDER_STATUSES, LEGACY_ORDER_STATUSES
+
+# Колонки заказа, общие для orders и orders_archive
+ORDER_COLUMNS = (
+    "id, customer_id, cargo, from_addr, to_addr, phone, status, driver_id, "
+    "tg_chat_id, tg_message_id, reserved_until, created_at, updated_at, "
+    "posted_at, reserved_at, finished_at, photo_file_id, photo_unique_id, region, "
+    "driver_message_id"
+)
+
+# Колонки, добавленные к заказам миграциями: имя -> тип SQLite
+ORDER_ADDED_COLUMNS = {
+    # Моменты переходов статуса
+    "posted_at": "INTEGER",
+    "reserved_at": "INTEGER",
+    "finished_at": "INTEGER",
+    # Фото груза: file_id для повторной отправки без загрузки
+    "photo_file_id": "TEXT",
+    "photo_unique_id": "TEXT",
+    # Регион канала публикации (выбранный заказчиком не восстановить по адресу)
+    "region": "TEXT",
+    # Сообщение водителю с кнопками резерва (снимаются, когда резерв истек)
+    "driver_message_id": "INTEGER",
+}
+
+# Вторичные индексы orders, которые можно снять на время массовой загрузки
+BULK_LOAD_INDEXES = ("idx_orders_waiting", "idx_orders_customer_created", "idx_orders_driver")
+
+# Таблицы агрегатов: длина периода в секундах -> таблица
+ROLLUP_TABLES = {3600: "order_stats_hourly", 86400: "order_stats_daily"}
+
+# Колонки записи книги открытых заказов
+BOOK_COLUMNS = ", ".join(OrderRecord.__slots__)
+
+
+def status_list(statuses: Iterable[OrderStatus]) -> str:
+    """Статусы в виде SQL-литерала "2, 3".
+
+    Статусы подставляются литералами, а не параметрами: только так
+    планировщик может использовать частичный индекс idx_orders_waiting.
+    """
+    return ", ".join(str(int(status)) for status in sorted(statuses))
+
+
+# CASE-выражение перевода старых строковых статусов в числа
+LEGACY_STATUS_CASE = "CASE status " + " ".join(
+    f"WHEN '{name}' THEN {int(status)}" for name, status in LEGACY_ORDER_STATUSES.items()
+) + f" ELSE {int(OrderStatus.CREATED)} END"
+
+
+def stats_column(status: Optional[OrderStatus]) -> Optional[str]:
+    """Колонка customer_stats, в которой учитывается заказ в статусе status."""
+    if status is None:
+        return None
+    if status in OPEN_ORDER_STATUSES:
+        return "active"
+    if status == OrderStatus.COMPLETED:
+        return "completed"
+    return "cancelled"
+
+
+def unix_now() -> int:
+    """Текущее время в секундах Unix."""
+    return int(time.time())
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+from storage.common import unix_now
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+class DriverMixin:
+    """Присутствие водителей на смене и подписки на дайджест заказов.
+
+    Часть Database: использует self.sql, transaction() и self.presence.
+    """
+
+    # ===== Driver Presence Methods =====
+
+    async def load_presence(self) -> int:
+        """Загрузить водителей на смене в память при старте."""
+        try:
+            rows = await self.sql.fetchall("SELECT user_id, last_seen FROM driver_presence")
+        except Exception as e:
+            logger.error("Error loading driver presence: %s", e)
+            return 0
+        self.presence.load(rows)
+        logger.info("Driver presence loaded: %s on shift", len(self.presence))
+        return len(self.presence)
+
+    async def flush_presence(self) -> int:
+        """Сохранить накопленные изменения присутствия одной транзакцией.
+
+        Пишется по одной строке на водителя с изменениями с прошлого
+        сброса; при ошибке изменения возвращаются в трекер до следующего.
+        """
+        upserts, removed = self.presence.drain_dirty()
+        if not upserts and not removed:
+            return 0
+        try:
+            async with self.transaction() as sql:
+                if upserts:
+                    await sql.executemany("""
+                        INSERT INTO driver_presence (user_id, last_seen) VALUES (?, ?)
+                        ON CONFLICT (user_id) DO UPDATE SET last_seen = excluded.last_seen
+                    """, upserts)
+                if removed:
+                    await sql.executemany(
+                        "DELETE FROM driver_presence WHERE user_id = ?",
+                        [(driver_id,) for driver_id in removed]
+                    )
+        except Exception as e:
+            logger.error("Error flushing driver presence: %s", e)
+            self.presence.restore_dirty(upserts, removed)
+            return 0
+        return len(upserts) + len(removed)
+
+    async def run_presence_flusher(self, interval: int):
+        """Фоновая задача: периодический сброс присутствия водителей в БД."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush_presence()
+
+    # ===== Driver Digest Methods =====
+
+    async def set_digest(self, user_id: int, period: Optional[int]) -> bool:
+        """Подписать водителя на дайджест раз в period секунд (None — отписать).
+
+        В дайджест попадают заказы, опубликованные после подписки.
+        """
+        try:
+            async with self.transaction() as sql:
+                if period is None:
+                    await sql.execute("DELETE FROM driver_digest WHERE user_id = ?", (user_id,))
+                    return True
+                now = unix_now()
+                await sql.execute("""
+                    INSERT INTO driver_digest (user_id, period, last_sent, next_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET period = excluded.period,
+                        next_at = driver_digest.last_sent + excluded.period
+                """, (user_id, period, now, now + period))
+            return True
+        except Exception as e:
+            logger.error("Error setting digest of user %s: %s", user_id, e)
+            return False
+
+    async def get_digest_period(self, user_id: int) -> Optional[int]:
+        """Период дайджеста водителя в секундах или None, если он не подписан."""
+        try:
+            return await self.sql.fetchval(
+                "SELECT period FROM driver_digest WHERE user_id = ?",
+                (user_id,)
+            )
+        except Exception as e:
+            logger.error("Error getting digest of user %s: %s", user_id, e)
+            return None
+
+    async def get_due_digests(self, now: int, limit: int) -> List[Dict[str, Any]]:
+        """Подписки, которым пора отправить дайджест, одним запросом.
+
+        Водители с активным заказом пропускаются до его завершения:
+        их дайджест соберет заказы за все это время.
+        """
+        try:
+            return await self.sql.fetchall("""
+                SELECT d.user_id, d.period, d.last_sent, u.car_model
+                FROM driver_digest d
+                JOIN users u ON u.user_id = d.user_id
+                WHERE d.next_at <= ?
+                  AND u.role = 'driver' AND u.active_order IS NULL
+                ORDER BY d.next_at
+                LIMIT ?
+            """, (now, limit))
+        except Exception as e:
+            logger.error("Error getting due digests: %s", e)
+            return []
+
+    async def mark_digests_sent(self, digests: Sequence[Dict[str, Any]], now: int) -> bool:
+        """Сдвинуть границу показанных заказов и время следующего дайджеста.
+
+        digests — строки get_due_digests.
+        """
+        if not digests:
+            return True
+        try:
+            async with self.transaction() as sql:
+                await sql.executemany(
+                    "UPDATE driver_digest SET last_sent = ?, next_at = ? WHERE user_id = ?",
+                    [(now, now + row["period"], row["user_id"]) for row in digests]
+                )
+            return True
+        except Exception as e:
+            logger.error("Error marking digests sent: %s", e)
+            return False
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+import config
+from states import FINISHED_ORDER_STATUSES
+from storage.common import ORDER_COLUMNS, status_list, unix_now
+
+# Допустимые значения строковых PRAGMA профиля хранения
+_SYNCHRONOUS_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+_TEMP_STORE_MODES = {"DEFAULT", "FILE", "MEMORY"}
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+class MaintenanceMixin:
+    """Обслуживание файла SQLite: профиль PRAGMA, чекпоинты, vacuum, архив.
+
+    Часть Database: использует ее соединение self.db, self.sql,
+    transaction() и книгу заказов self.orders.
+    """
+
+    # ===== Storage Profile & Maintenance =====
+
+    async def _apply_profile(self):
+        """Применить профиль производительности SQLite из конфигурации."""
+        synchronous = config.SQLITE_SYNCHRONOUS.upper()
+        temp_store = config.SQLITE_TEMP_STORE.upper()
+        if synchronous not in _SYNCHRONOUS_MODES:
+            raise ValueError(f"Invalid SQLITE_SYNCHRONOUS: {config.SQLITE_SYNCHRONOUS}")
+        if temp_store not in _TEMP_STORE_MODES:
+            raise ValueError(f"Invalid SQLITE_TEMP_STORE: {config.SQLITE_TEMP_STORE}")
+
+        await self.db.execute(f"PRAGMA synchronous = {synchronous}")
+        await self.db.execute(f"PRAGMA cache_size = {int(config.SQLITE_CACHE_SIZE)}")
+        await self.db.execute(f"PRAGMA mmap_size = {int(config.SQLITE_MMAP_SIZE)}")
+        await self.db.execute(f"PRAGMA temp_store = {temp_store}")
+
+    async def _ensure_incremental_vacuum(self):
+        """Перевести небольшую базу, созданную без auto_vacuum, в режим INCREMENTAL.
+
+        Для существующего файла режим меняется только полным VACUUM: он
+        блокирует базу на все время перезаписи и требует еще столько же
+        места на диске. При старте это делается только для файлов не
+        больше VACUUM_CONVERT_MAX_MB; большую базу переводят отдельно,
+        командой python vacuum_db.py (см. convert_auto_vacuum).
+        """
+        if await self.convert_auto_vacuum(config.VACUUM_CONVERT_MAX_MB * 1024 * 1024):
+            return
+        logger.warning(
+            "Database is not in auto_vacuum=INCREMENTAL mode and is larger than "
+            "VACUUM_CONVERT_MAX_MB=%s; run 'python vacuum_db.py' during maintenance",
+            config.VACUUM_CONVERT_MAX_MB
+        )
+
+    async def convert_auto_vacuum(self, max_size: Optional[int] = None) -> bool:
+        """Перевести базу в auto_vacuum=INCREMENTAL полным VACUUM.
+
+        max_size — предельный размер файла в байтах (None — без предела).
+        Возвращает False, если база больше max_size и не переведена.
+        """
+        cursor = await self.db.execute("PRAGMA auto_vacuum")
+        if (await cursor.fetchone())[0] == 2:
+            return True
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if max_size is not None and size > max_size:
+            return False
+        logger.info("Converting database to auto_vacuum=INCREMENTAL "
+                    "(one-time VACUUM, %s bytes)", size)
+        await self.db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        await self.db.execute("VACUUM")
+        return True
+
+    def start_maintenance(self):
+        """Запустить фоновые задачи обслуживания базы."""
+        self._tasks.append(asyncio.create_task(self.run_archiver(
+            config.ARCHIVE_INTERVAL,
+            config.ARCHIVE_AFTER_DAYS * 86400,
+            config.ARCHIVE_BATCH_SIZE
+        )))
+        self._tasks.append(asyncio.create_task(self.run_maintenance(
+            config.MAINTENANCE_INTERVAL,
+            config.OPTIMIZE_INTERVAL,
+            config.VACUUM_PAGES
+        )))
+        self._tasks.append(asyncio.create_task(self.run_order_book_reconciler(
+            config.ORDER_BOOK_RECONCILE_INTERVAL
+        )))
+        self._tasks.append(asyncio.create_task(self.run_presence_flusher(
+            config.PRESENCE_FLUSH_INTERVAL
+        )))
+
+    async def run_maintenance(self, interval: int, optimize_interval: int, vacuum_pages: int):
+        """Фоновая задача: чекпоинты WAL, PRAGMA optimize и incremental_vacuum.
+
+        Если с прошлого тика записей не было, база считается простаивающей:
+        выполняется TRUNCATE-чекпоинт (WAL обрезается до нуля) и отложенный
+        после архивации incremental_vacuum. Под нагрузкой — только PASSIVE,
+        который не ждет читателей и писателей.
+        """
+        last_changes = self.db.total_changes
+        last_optimize = time.monotonic()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                changes = self.db.total_changes
+                quiet = changes == last_changes
+                last_changes = changes
+
+                # Соединение общее: без блокировки PRAGMA попадают внутрь
+                # открытой транзакции другого обработчика (transaction())
+                async with self._write_lock:
+                    if quiet and self._vacuum_pending:
+                        # executescript выполняет PRAGMA до конца; обычный execute
+                        # делает один шаг и освобождает только одну страницу
+                        await self.db.executescript(
+                            f"PRAGMA incremental_vacuum({int(vacuum_pages)});"
+                        )
+                        cursor = await self.db.execute("PRAGMA freelist_count")
+                        self._vacuum_pending = (await cursor.fetchone())[0] > 0
+
+                    mode = "TRUNCATE" if quiet else "PASSIVE"
+                    cursor = await self.db.execute(f"PRAGMA wal_checkpoint({mode})")
+                    busy, wal_pages, checkpointed = await cursor.fetchone()
+
+                    optimize = time.monotonic() - last_optimize >= optimize_interval
+                    if optimize:
+                        await self.db.execute("PRAGMA optimize")
+                        last_optimize = time.monotonic()
+
+                if not quiet:
+                    logger.debug(
+                        "WAL checkpoint %s: busy=%s, pages=%s, checkpointed=%s",
+                        mode, busy, wal_pages, checkpointed
+                    )
+                if optimize:
+                    logger.info("PRAGMA optimize done")
+
+                # Собственные PRAGMA не должны выглядеть как нагрузка
+                last_changes = self.db.total_changes
+            except Exception as e:
+                logger.error("Error in database maintenance: %s", e)
+
+    async def archive_finished_orders(self, max_age: int, batch_size: int) -> int:
+        """Перенести завершенные заказы старше max_age секунд в orders_archive.
+
+        Заказы переносятся пачками по batch_size, каждая пачка — отдельная
+        транзакция, чтобы не держать блокировку записи долго.
+        """
+        cutoff = unix_now() - max_age
+        moved = 0
+        while True:
+            try:
+                async with self.transaction() as sql:
+                    rows = await sql.fetchall(f"""
+                        SELECT id FROM orders
+                        WHERE status IN ({status_list(FINISHED_ORDER_STATUSES)}) AND updated_at < ?
+                        ORDER BY id
+                        LIMIT ?
+                    """, (cutoff, batch_size))
+                    ids = [row["id"] for row in rows]
+                    if not ids:
+                        break
+
+                    id_placeholders = ", ".join("?" for _ in ids)
+                    await sql.execute(f"""
+                        INSERT INTO orders_archive ({ORDER_COLUMNS}, archived_at)
+                        SELECT {ORDER_COLUMNS}, ?
+                        FROM orders WHERE id IN ({id_placeholders})
+                        ON CONFLICT (id) DO NOTHING
+                    """, (unix_now(), *ids))
+                    await sql.execute(
+                        f"DELETE FROM orders WHERE id IN ({id_placeholders})",
+                        ids
+                    )
+                moved += len(ids)
+            except Exception as e:
+                logger.error("Error archiving orders: %s", e)
+                break
+
+            if len(ids) < batch_size:
+                break
+            # Даем обработчикам апдейтов доступ к базе между пачками
+            await asyncio.sleep(0)
+
+        if moved:
+            logger.info("Archived %s finished orders", moved)
+        return moved
+
+    async def run_archiver(self, interval: int, max_age: int, batch_size: int):
+        """Фоновая задача: периодически архивировать завершенные заказы."""
+        while True:
+            if await self.archive_finished_orders(max_age, batch_size):
+                # Освобожденные страницы вернет run_maintenance в период простоя
+                self._vacuum_pending = True
+            await asyncio.sleep(interval)
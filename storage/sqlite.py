@@ -0,0 +1,236 @@
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+import aiosqlite
+
+from services.tracing import traced_query
+from states import OrderStatus
+from storage.common import ROLLUP_TABLES
+
+# Схема SQLite (схема PostgreSQL — в database_pg.py)
+SQLITE_SCHEMA = [
+    # Таблица пользователей
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        role TEXT NOT NULL,
+        phone TEXT,
+        car_model TEXT,
+        active_order INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (active_order) REFERENCES orders(id) ON DELETE SET NULL
+    );
+    """,
+    # Таблица заказов
+    """
+    CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        customer_id INTEGER NOT NULL,
+        cargo TEXT NOT NULL,
+        from_addr TEXT NOT NULL,
+        to_addr TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        status INTEGER NOT NULL DEFAULT 1,
+        driver_id INTEGER,
+        tg_chat_id TEXT,
+        tg_message_id INTEGER,
+        reserved_until INTEGER,
+        created_at INTEGER DEFAULT (strftime('%s','now')),
+        updated_at INTEGER DEFAULT (strftime('%s','now')),
+        posted_at INTEGER,
+        reserved_at INTEGER,
+        finished_at INTEGER,
+        photo_file_id TEXT,
+        photo_unique_id TEXT,
+        region TEXT,
+        driver_message_id INTEGER,
+        FOREIGN KEY (customer_id) REFERENCES users(user_id) ON DELETE CASCADE,
+        FOREIGN KEY (driver_id) REFERENCES users(user_id) ON DELETE SET NULL
+    );
+    """,
+    # Архив завершенных заказов: горячая таблица orders остается
+    # размером с рабочий набор
+    """
+    CREATE TABLE IF NOT EXISTS orders_archive (
+        id INTEGER PRIMARY KEY,
+        customer_id INTEGER NOT NULL,
+        cargo TEXT NOT NULL,
+        from_addr TEXT NOT NULL,
+        to_addr TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        status INTEGER NOT NULL,
+        driver_id INTEGER,
+        tg_chat_id TEXT,
+        tg_message_id INTEGER,
+        reserved_until INTEGER,
+        created_at INTEGER,
+        updated_at INTEGER,
+        posted_at INTEGER,
+        reserved_at INTEGER,
+        finished_at INTEGER,
+        photo_file_id TEXT,
+        photo_unique_id TEXT,
+        region TEXT,
+        driver_message_id INTEGER,
+        archived_at INTEGER DEFAULT (strftime('%s','now'))
+    );
+    """,
+    # Таблица сессий
+    """
+    CREATE TABLE IF NOT EXISTS sessions (
+        chat_id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        step TEXT,
+        temp TEXT,  -- JSON данные
+        created_at INTEGER DEFAULT (strftime('%s','now')),
+        updated_at INTEGER DEFAULT (strftime('%s','now')),
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    );
+    """,
+    # Служебные значения (кэш данных бота, состояние вебхука)
+    """
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT,
+        updated_at INTEGER DEFAULT (strftime('%s','now'))
+    );
+    """,
+    # Недавно обработанные апдейты (окно дедупликации)
+    """
+    CREATE TABLE IF NOT EXISTS seen_updates (
+        update_id INTEGER PRIMARY KEY
+    );
+    """,
+    # Водители на смене и их последняя активность (сброс из PresenceTracker)
+    """
+    CREATE TABLE IF NOT EXISTS driver_presence (
+        user_id INTEGER PRIMARY KEY,
+        last_seen INTEGER NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    );
+    """,
+    # Подписки водителей на дайджест заказов: period — секунды между
+    # дайджестами, last_sent — граница уже показанных заказов
+    """
+    CREATE TABLE IF NOT EXISTS driver_digest (
+        user_id INTEGER PRIMARY KEY,
+        period INTEGER NOT NULL,
+        last_sent INTEGER NOT NULL,
+        next_at INTEGER NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    );
+    """,
+    # Счетчики заказов клиента, обновляются в транзакциях изменения статуса
+    """
+    CREATE TABLE IF NOT EXISTS customer_stats (
+        customer_id INTEGER PRIMARY KEY,
+        active INTEGER NOT NULL DEFAULT 0,
+        completed INTEGER NOT NULL DEFAULT 0,
+        cancelled INTEGER NOT NULL DEFAULT 0
+    );
+    """,
+    # Агрегаты по заказам за час и за сутки (bucket — начало периода,
+    # car_model — машина водителя, '' для событий без водителя)
+    *[
+        f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            bucket INTEGER NOT NULL,
+            car_model TEXT NOT NULL DEFAULT '',
+            created INTEGER NOT NULL DEFAULT 0,
+            reserved INTEGER NOT NULL DEFAULT 0,
+            confirmed INTEGER NOT NULL DEFAULT 0,
+            released INTEGER NOT NULL DEFAULT 0,
+            cancelled INTEGER NOT NULL DEFAULT 0,
+            wait_seconds INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, car_model)
+        );
+        """
+        for table in ROLLUP_TABLES.values()
+    ],
+]
+
+# Индексы создаются после миграций: миграция может пересоздать таблицу
+SQLITE_INDEXES = [
+    # Полный индекс по статусу заменен частичным по ожидающим заказам
+    "DROP INDEX IF EXISTS idx_orders_status;",
+    f"""
+    CREATE INDEX IF NOT EXISTS idx_orders_waiting ON orders(created_at)
+    WHERE status = {int(OrderStatus.WAITING_DRIVER)};
+    """,
+    # История заказов клиента: keyset-пагинация по (created_at, id)
+    "DROP INDEX IF EXISTS idx_orders_customer;",
+    "DROP INDEX IF EXISTS idx_orders_archive_customer;",
+    "CREATE INDEX IF NOT EXISTS idx_orders_customer_created "
+    "ON orders(customer_id, created_at, id);",
+    "CREATE INDEX IF NOT EXISTS idx_orders_archive_customer_created "
+    "ON orders_archive(customer_id, created_at, id);",
+    "CREATE INDEX IF NOT EXISTS idx_orders_driver ON orders(driver_id);",
+    # Дайджесты, которым пора уходить
+    "CREATE INDEX IF NOT EXISTS idx_driver_digest_next ON driver_digest(next_at);",
+]
+
+
+class SQLiteExecutor:
+    """Выполнение запросов на соединении aiosqlite.
+
+    Строки возвращаются словарями, чтобы методы Database не зависели
+    от драйвера (см. PostgresExecutor в database_pg.py).
+    """
+
+    def __init__(self, conn: aiosqlite.Connection):
+        self.conn = conn
+
+    @traced_query
+    async def execute(self, sql: str, params: Sequence = ()) -> int:
+        """Выполнить запрос и вернуть число затронутых строк."""
+        cursor = await self.conn.execute(sql, params)
+        return cursor.rowcount
+
+    @traced_query
+    async def executemany(self, sql: str, rows: Sequence[Sequence]) -> None:
+        """Выполнить запрос для каждого набора параметров."""
+        await self.conn.executemany(sql, rows)
+
+    @traced_query
+    async def fetchone(self, sql: str, params: Sequence = ()) -> Optional[Dict[str, Any]]:
+        """Получить первую строку результата."""
+        cursor = await self.conn.execute(sql, params)
+        row = await cursor.fetchone()
+        if not row:
+            return None
+        return dict(zip([d[0] for d in cursor.description], row))
+
+    @traced_query
+    async def fetchall(self, sql: str, params: Sequence = ()) -> List[Dict[str, Any]]:
+        """Получить все строки результата."""
+        cursor = await self.conn.execute(sql, params)
+        columns = [d[0] for d in cursor.description]
+        return [dict(zip(columns, row)) for row in await cursor.fetchall()]
+
+    @traced_query
+    async def fetchval(self, sql: str, params: Sequence = ()) -> Any:
+        """Получить первое значение первой строки."""
+        cursor = await self.conn.execute(sql, params)
+        row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def stream(
+        self,
+        sql: str,
+        params: Sequence = (),
+        batch_size: int = 500
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Читать результат пачками через fetchmany, не загружая его целиком."""
+        cursor = await self.conn.execute(sql, params)
+        columns = [d[0] for d in cursor.description]
+        try:
+            while True:
+                rows = await cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [dict(zip(columns, row)) for row in rows]
+        finally:
+            await cursor.close()
@@ -0,0 +1,157 @@
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from states import OrderStatus, OPEN_ORDER_STATUSES
+from storage.common import ROLLUP_TABLES, stats_column, status_list, unix_now
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+class StatsMixin:
+    """Счетчики заказов клиентов (customer_stats) и почасовые/суточные агрегаты.
+
+    Часть Database: использует self.sql и transaction().
+    """
+
+    # ===== Customer Stats =====
+
+    async def _ensure_customer_stats(self, rebuild: bool = False):
+        """Один раз заполнить customer_stats по уже существующим заказам.
+
+        Дальше счетчики меняются только в транзакциях, меняющих статус
+        заказа (см. _count_customer_order), без COUNT(*) по заказам.
+        rebuild=True пересчитывает их заново (после массового импорта).
+        """
+        async with self.transaction() as sql:
+            if not rebuild and await sql.fetchval(
+                "SELECT value FROM meta WHERE key = 'customer_stats'"
+            ):
+                return
+            open_list = status_list(OPEN_ORDER_STATUSES)
+            await sql.execute("DELETE FROM customer_stats")
+            await sql.execute(f"""
+                INSERT INTO customer_stats (customer_id, active, completed, cancelled)
+                SELECT customer_id,
+                       SUM(CASE WHEN status IN ({open_list}) THEN 1 ELSE 0 END),
+                       SUM(CASE WHEN status = {int(OrderStatus.COMPLETED)} THEN 1 ELSE 0 END),
+                       SUM(CASE WHEN status NOT IN ({open_list})
+                                 AND status <> {int(OrderStatus.COMPLETED)} THEN 1 ELSE 0 END)
+                FROM (
+                    SELECT customer_id, status FROM orders
+                    UNION ALL
+                    SELECT customer_id, status FROM orders_archive
+                ) AS all_orders
+                GROUP BY customer_id
+            """)
+            await sql.execute("""
+                INSERT INTO meta (key, value, updated_at) VALUES ('customer_stats', '1', ?)
+                ON CONFLICT (key) DO UPDATE SET value = excluded.value
+            """, (unix_now(),))
+
+    # ===== Customer History =====
+
+    async def _count_customer_order(
+        self,
+        sql,
+        customer_id: int,
+        old_status: Optional[OrderStatus],
+        new_status: OrderStatus
+    ):
+        """Перенести заказ между счетчиками клиента (в транзакции перехода)."""
+        old_column, new_column = stats_column(old_status), stats_column(new_status)
+        if old_column == new_column:
+            return
+        delta = {"active": 0, "completed": 0, "cancelled": 0}
+        delta[new_column] += 1
+        if old_column:
+            delta[old_column] -= 1
+        await sql.execute("""
+            INSERT INTO customer_stats (customer_id, active, completed, cancelled)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (customer_id) DO UPDATE SET
+                active = customer_stats.active + excluded.active,
+                completed = customer_stats.completed + excluded.completed,
+                cancelled = customer_stats.cancelled + excluded.cancelled
+        """, (customer_id, delta["active"], delta["completed"], delta["cancelled"]))
+
+    async def get_customer_stats(self, customer_id: int) -> Dict[str, int]:
+        """Счетчики заказов клиента: активные, завершенные, отмененные."""
+        try:
+            row = await self.sql.fetchone(
+                "SELECT active, completed, cancelled FROM customer_stats WHERE customer_id = ?",
+                (customer_id,)
+            )
+            return row or {"active": 0, "completed": 0, "cancelled": 0}
+        except Exception as e:
+            logger.error("Error getting stats of customer %s: %s", customer_id, e)
+            return {"active": 0, "completed": 0, "cancelled": 0}
+
+    # ===== Analytics Rollups =====
+
+    async def _roll_up(self, sql, at: int, car_model: Optional[str] = None, **counts: int):
+        """Добавить событие к часовым и суточным агрегатам (в транзакции перехода)."""
+        columns = list(counts)
+        for period, table in ROLLUP_TABLES.items():
+            await sql.execute(f"""
+                INSERT INTO {table} (bucket, car_model, {", ".join(columns)})
+                VALUES (?, ?, {", ".join("?" for _ in columns)})
+                ON CONFLICT (bucket, car_model) DO UPDATE SET
+                {", ".join(f"{c} = {table}.{c} + excluded.{c}" for c in columns)}
+            """, (at - at % period, car_model or "", *counts.values()))
+
+    async def _roll_up_imported(self, rows: Sequence[Sequence]) -> None:
+        """Добавить импортированные заказы к агрегатам одним проходом.
+
+        Каждый заказ дает created в часе создания и confirmed (с машиной
+        водителя) или cancelled в часе завершения — как живой заказ.
+        Резервов и отказов в истории нет, они не учитываются. Агрегаты
+        прибавляются, а не пересчитываются: события живых заказов (отказы
+        водителей) из таблицы orders не восстановить.
+        """
+        if not rows:
+            return
+        driver_ids = sorted({
+            row[6] for row in rows if row[6] is not None and row[5] == OrderStatus.COMPLETED
+        })
+        cars: Dict[int, Optional[str]] = {}
+        for start in range(0, len(driver_ids), 500):
+            chunk = driver_ids[start:start + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            for user in await self.sql.fetchall(
+                f"SELECT user_id, car_model FROM users WHERE user_id IN ({placeholders})", chunk
+            ):
+                cars[user["user_id"]] = user["car_model"]
+
+        async with self.transaction() as sql:
+            for period, table in ROLLUP_TABLES.items():
+                # (bucket, car_model) -> [created, confirmed, cancelled]
+                counts: Dict[Tuple[int, str], List[int]] = {}
+                for row in rows:
+                    created_at, finished_at = row[7], row[8] or row[7]
+                    counts.setdefault((created_at - created_at % period, ""), [0, 0, 0])[0] += 1
+                    bucket = finished_at - finished_at % period
+                    if row[5] == OrderStatus.COMPLETED:
+                        key, column = (bucket, cars.get(row[6]) or ""), 1
+                    else:
+                        key, column = (bucket, ""), 2
+                    counts.setdefault(key, [0, 0, 0])[column] += 1
+                await sql.executemany(f"""
+                    INSERT INTO {table} (bucket, car_model, created, confirmed, cancelled)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (bucket, car_model) DO UPDATE SET
+                    created = {table}.created + excluded.created,
+                    confirmed = {table}.confirmed + excluded.confirmed,
+                    cancelled = {table}.cancelled + excluded.cancelled
+                """, [(*key, *values) for key, values in counts.items()])
+
+    async def get_rollups(self, period: int, since: int) -> List[Dict[str, Any]]:
+        """Агрегаты за период period (3600 или 86400) начиная с since."""
+        try:
+            return await self.sql.fetchall(
+                f"SELECT * FROM {ROLLUP_TABLES[period]} WHERE bucket >= ? ORDER BY bucket",
+                (since - since % period,)
+            )
+        except Exception as e:
+            logger.error("Error reading rollups: %s", e)
+            return []
@@ -0,0 +1,40 @@
+"""Перевод базы SQLite в режим auto_vacuum=INCREMENTAL.
+
+Базу, созданную без auto_vacuum и большую VACUUM_CONVERT_MAX_MB, бот
+при старте не переводит: полный VACUUM блокирует ее на все время
+перезаписи и требует еще столько же места на диске. Запускать при
+остановленном боте:
+    python vacuum_db.py
+"""
+import asyncio
+import sys
+
+import config
+from database import create_database
+from services.logs import setup_logging
+
+
+async def run() -> int:
+    db = create_database(config.DATABASE_URL)
+    if db.path is None:
+        # PostgresDatabase наследует Database, но файла SQLite у нее нет
+        print("auto_vacuum applies only to SQLite", file=sys.stderr)
+        return 2
+
+    await db.connect()
+    try:
+        await db.convert_auto_vacuum()
+    finally:
+        await db.close()
+    print("Database is in auto_vacuum=INCREMENTAL mode")
+    return 0
+
+
+def main():
+    setup_logging(config.LOG_LEVEL, config.LOG_FORMAT, config.LOG_TEXT_FORMAT,
+                  config.LOG_SAMPLE_BURST, config.LOG_SAMPLE_EVERY)
+    sys.exit(asyncio.run(run()))
+
+
+if __name__ == "__main__":
+    main()